@@ -1,6 +1,10 @@
-from supabase import create_client, Client
 from dotenv import load_dotenv
 import os
+import threading
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from supabase import Client
 
 # Cargar variables de entorno
 load_dotenv()
@@ -9,18 +13,39 @@ load_dotenv()
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
-# Validar que existan las credenciales
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise ValueError("Faltan credenciales de Supabase en el archivo .env")
+# El cliente se crea en el primer uso: importar la app (tests, tooling,
+# arranque de un pod nuevo) no requiere credenciales ni importar supabase
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_supabase_client() -> "Client":
+    """
+    Retorna el cliente de Supabase configurado (singleton, se crea la primera vez)
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                # Validar que existan las credenciales
+                if not SUPABASE_URL or not SUPABASE_KEY:
+                    raise ValueError("Faltan credenciales de Supabase en el archivo .env")
+                from supabase import create_client
+                _client = create_client(SUPABASE_URL, SUPABASE_KEY)
+    return _client
 
-# Crear cliente de Supabase (singleton)
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
-def get_supabase_client() -> Client:
+class _LazySupabaseClient:
     """
-    Retorna el cliente de Supabase configurado
+    Proxy del cliente de Supabase: permite usar `supabase.table(...)` a nivel
+    de módulo sin crear el cliente al importar
     """
-    return supabase
+
+    def __getattr__(self, name):
+        return getattr(get_supabase_client(), name)
+
+
+supabase = _LazySupabaseClient()
 
 # Función helper para verificar conexión
 async def check_database_connection():
@@ -29,7 +54,7 @@ async def check_database_connection():
     """
     try:
         # Intenta hacer una query simple
-        result = supabase.table("brand_manuals").select("count").execute()
+        result = get_supabase_client().table("brand_manuals").select("count").execute()
         return {"status": "connected", "database": "supabase"}
     except Exception as e:
-        return {"status": "error", "message": str(e)}
\ No newline at end of file
+        return {"status": "error", "message": str(e)}
@@ -1,21 +1,315 @@
-from langfuse import Langfuse
+"""
+Trazas de Langfuse con bajo overhead
+
+- Muestreo configurable (global y por nombre de traza)
+- Truncado y redacción de payloads: nunca se serializan bytes de imágenes
+  ni vectores de embeddings
+- Exportación en segundo plano por lotes con una cola acotada: si la cola
+  está llena, el evento se descarta en lugar de bloquear la request
+"""
 from dotenv import load_dotenv
+import atexit
+from datetime import datetime, timedelta, timezone
+import functools
+import inspect
 import os
+import queue
+import random
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from services.metrics_service import register_counter, inc_counter
 
 load_dotenv()
 
-# Inicializar Langfuse
-try:
-    langfuse = Langfuse(
-        public_key=os.getenv("LANGFUSE_PUBLIC_KEY"),
-        secret_key=os.getenv("LANGFUSE_SECRET_KEY"),
-        host=os.getenv("LANGFUSE_HOST", "https://cloud.langfuse.com"),
-        enabled=bool(os.getenv("LANGFUSE_PUBLIC_KEY"))  # Solo habilitar si hay clave
-    )
-except Exception as e:
-    print(f"Warning: Langfuse no pudo inicializarse: {e}")
-    langfuse = None
+# Configuración
+LANGFUSE_ENABLED = bool(os.getenv("LANGFUSE_PUBLIC_KEY"))  # Solo habilitar si hay clave
+SAMPLE_RATE = float(os.getenv("LANGFUSE_SAMPLE_RATE", "0.1"))
+MAX_PAYLOAD_CHARS = int(os.getenv("LANGFUSE_MAX_PAYLOAD_CHARS", "2000"))
+QUEUE_SIZE = int(os.getenv("LANGFUSE_QUEUE_SIZE", "1000"))
+BATCH_SIZE = int(os.getenv("LANGFUSE_BATCH_SIZE", "50"))
+FLUSH_INTERVAL = float(os.getenv("LANGFUSE_FLUSH_INTERVAL", "2.0"))
+
+# Parámetros que nunca se envían (clientes, bytes crudos, credenciales)
+REDACTED_PARAMS = {"image_bytes", "image", "supabase_client", "api_key"}
+
+# Listas numéricas más largas que esto se consideran vectores
+_MAX_NUMERIC_LIST = 32
+_MAX_ITEMS = 20
+_MAX_DEPTH = 4
+
+
+def _parse_sample_rates(raw: str) -> Dict[str, float]:
+    """
+    Parsea LANGFUSE_SAMPLE_RATES con formato "nombre=tasa,nombre=tasa"
+    """
+    rates = {}
+    for item in raw.split(","):
+        if "=" not in item:
+            continue
+        name, rate = item.split("=", 1)
+        try:
+            rates[name.strip()] = float(rate)
+        except ValueError:
+            print(f"Warning: tasa de muestreo inválida para '{name.strip()}': {rate}")
+    return rates
+
+
+SAMPLE_RATES = _parse_sample_rates(os.getenv("LANGFUSE_SAMPLE_RATES", ""))
+
+register_counter("trace_events_total", "Eventos de traza encolados para exportar")
+register_counter("trace_events_dropped_total", "Eventos de traza descartados por cola llena")
+
+_langfuse = None
+_langfuse_lock = threading.Lock()
+_queue: "queue.Queue[dict]" = queue.Queue(maxsize=QUEUE_SIZE)
+_worker: Optional[threading.Thread] = None
+
 
 def get_langfuse_client():
-    """Retorna el cliente de Langfuse configurado"""
-    return langfuse
\ No newline at end of file
+    """Retorna el cliente de Langfuse configurado (se crea la primera vez)"""
+    global _langfuse
+    if not LANGFUSE_ENABLED:
+        return None
+    if _langfuse is None:
+        with _langfuse_lock:
+            if _langfuse is None:
+                try:
+                    from langfuse import Langfuse
+                    _langfuse = Langfuse(
+                        public_key=os.getenv("LANGFUSE_PUBLIC_KEY"),
+                        secret_key=os.getenv("LANGFUSE_SECRET_KEY"),
+                        host=os.getenv("LANGFUSE_HOST", "https://cloud.langfuse.com")
+                    )
+                except Exception as e:
+                    print(f"Warning: Langfuse no pudo inicializarse: {e}")
+                    _langfuse = None
+    return _langfuse
+
+
+# ============================================
+# REDACCIÓN Y TRUNCADO
+# ============================================
+
+def sanitize_payload(value: Any, depth: int = 0) -> Any:
+    """
+    Convierte un valor en una versión pequeña y segura para enviar a Langfuse
+    """
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, str):
+        if len(value) > MAX_PAYLOAD_CHARS:
+            return value[:MAX_PAYLOAD_CHARS] + f"... [truncado, {len(value)} caracteres]"
+        return value
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f"<bytes len={len(value)}>"
+    # Arrays de NumPy (sin importar numpy)
+    if hasattr(value, "shape") and hasattr(value, "dtype"):
+        return f"<ndarray shape={tuple(value.shape)} dtype={value.dtype}>"
+    if depth >= _MAX_DEPTH:
+        return f"<{type(value).__name__}>"
+    if isinstance(value, dict):
+        items = list(value.items())
+        result = {
+            str(k): ("<redactado>" if k in REDACTED_PARAMS else sanitize_payload(v, depth + 1))
+            for k, v in items[:_MAX_ITEMS]
+        }
+        if len(items) > _MAX_ITEMS:
+            result["..."] = f"{len(items) - _MAX_ITEMS} claves más"
+        return result
+    if isinstance(value, (list, tuple)):
+        if len(value) > _MAX_NUMERIC_LIST and all(isinstance(v, (int, float)) for v in value[:_MAX_NUMERIC_LIST]):
+            return f"<vector dim={len(value)}>"
+        result = [sanitize_payload(v, depth + 1) for v in value[:_MAX_ITEMS]]
+        if len(value) > _MAX_ITEMS:
+            result.append(f"... {len(value) - _MAX_ITEMS} elementos más")
+        return result
+    # Clientes, imágenes PIL y otros objetos: solo el tipo
+    return f"<{type(value).__name__}>"
+
+
+# ============================================
+# EXPORTACIÓN EN SEGUNDO PLANO
+# ============================================
+
+def _export_event(client, event: dict):
+    """Envía un evento usando la API disponible del SDK (v2 o v3)"""
+    metadata = {
+        "duration_ms": event["duration_ms"],
+        "sample_rate": event["sample_rate"],
+    }
+    if event.get("error"):
+        metadata["error"] = event["error"]
+
+    if hasattr(client, "trace"):
+        # SDK v2
+        client.trace(
+            name=event["name"],
+            input=event["input"],
+            output=event["output"],
+            metadata=metadata,
+            timestamp=event["timestamp"]
+        )
+    elif hasattr(client, "create_event"):
+        # SDK v3
+        client.create_event(
+            name=event["name"],
+            input=event["input"],
+            output=event["output"],
+            metadata=metadata
+        )
+
+
+def _export_loop():
+    """Drena la cola por lotes y los envía a Langfuse"""
+    while True:
+        batch = []
+        try:
+            batch.append(_queue.get(timeout=FLUSH_INTERVAL))
+            while len(batch) < BATCH_SIZE:
+                batch.append(_queue.get_nowait())
+        except queue.Empty:
+            pass
+
+        if not batch:
+            continue
+
+        client = get_langfuse_client()
+        if client is None:
+            continue
+        for event in batch:
+            try:
+                _export_event(client, event)
+            except Exception as e:
+                print(f"Warning: no se pudo exportar traza '{event['name']}': {e}")
+        try:
+            client.flush()
+        except Exception as e:
+            print(f"Warning: error al hacer flush de Langfuse: {e}")
+
+
+def _ensure_worker():
+    global _worker
+    if _worker is None or not _worker.is_alive():
+        with _langfuse_lock:
+            if _worker is None or not _worker.is_alive():
+                _worker = threading.Thread(target=_export_loop, name="langfuse-exporter", daemon=True)
+                _worker.start()
+
+
+def _enqueue(event: dict):
+    """Encola sin bloquear; descarta si la cola está llena"""
+    try:
+        _queue.put_nowait(event)
+        inc_counter("trace_events_total")
+    except queue.Full:
+        inc_counter("trace_events_dropped_total")
+        return
+    _ensure_worker()
+
+
+def flush_traces(timeout: float = 5.0):
+    """
+    Exporta los eventos pendientes (usado al apagar el proceso)
+    """
+    if not LANGFUSE_ENABLED:
+        return
+    client = get_langfuse_client()
+    deadline = time.monotonic() + timeout
+    while client is not None and time.monotonic() < deadline:
+        try:
+            event = _queue.get_nowait()
+        except queue.Empty:
+            break
+        try:
+            _export_event(client, event)
+        except Exception:
+            pass
+    if client is not None:
+        try:
+            client.flush()
+        except Exception:
+            pass
+
+
+atexit.register(flush_traces)
+
+
+# ============================================
+# DECORADOR
+# ============================================
+
+def observe(name: str, sample_rate: Optional[float] = None):
+    """
+    Decorador de trazas muestreadas, compatible con funciones sync y async
+
+    Si Langfuse no está configurado retorna la función sin envolver
+    (costo cero). Si está configurado, solo las llamadas muestreadas
+    capturan inputs/outputs (ya redactados y truncados).
+
+    Args:
+        name: Nombre de la traza
+        sample_rate: Tasa fija; por defecto LANGFUSE_SAMPLE_RATES[name] o LANGFUSE_SAMPLE_RATE
+    """
+    def decorator(func):
+        if not LANGFUSE_ENABLED:
+            return func
+
+        rate = sample_rate if sample_rate is not None else SAMPLE_RATES.get(name, SAMPLE_RATE)
+        if rate <= 0:
+            return func
+
+        signature = inspect.signature(func)
+
+        def _capture_input(args, kwargs):
+            try:
+                bound = signature.bind_partial(*args, **kwargs)
+                return sanitize_payload(dict(bound.arguments))
+            except TypeError:
+                return None
+
+        def _emit(started_at: float, inputs, output, error: Optional[Exception]):
+            duration = time.perf_counter() - started_at
+            _enqueue({
+                "name": name,
+                "timestamp": datetime.now(timezone.utc) - timedelta(seconds=duration),
+                "duration_ms": round(duration * 1000, 2),
+                "sample_rate": rate,
+                "input": inputs,
+                "output": sanitize_payload(output),
+                "error": str(error)[:MAX_PAYLOAD_CHARS] if error else None,
+            })
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if random.random() >= rate:
+                    return await func(*args, **kwargs)
+                inputs = _capture_input(args, kwargs)
+                start = time.perf_counter()
+                try:
+                    output = await func(*args, **kwargs)
+                except Exception as e:
+                    _emit(start, inputs, None, e)
+                    raise
+                _emit(start, inputs, output, None)
+                return output
+            return async_wrapper
+
+        @functools.wraps(func)
+        def sync_wrapper(*args, **kwargs):
+            if random.random() >= rate:
+                return func(*args, **kwargs)
+            inputs = _capture_input(args, kwargs)
+            start = time.perf_counter()
+            try:
+                output = func(*args, **kwargs)
+            except Exception as e:
+                _emit(start, inputs, None, e)
+                raise
+            _emit(start, inputs, output, None)
+            return output
+        return sync_wrapper
+
+    return decorator
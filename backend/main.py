@@ -1,14 +1,19 @@
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from dotenv import load_dotenv
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 import os
+import time
+import asyncio
+import json
 from pydantic import BaseModel
 
 # Importar configuración de base de datos
-from config.database import get_supabase_client, check_database_connection
-from services.groq_service import generate_brand_manual
+from config.database import supabase, get_supabase_client, check_database_connection
+from services.groq_service import generate_brand_manual, get_groq_client
 from models.brand_manual import (
     BrandManualCreate, 
     BrandManualResponse,
@@ -16,23 +21,112 @@ from models.brand_manual import (
     BrandManualGenerateResponse
 )
 from services.embeddings_service import (
-    process_manual_for_rag,
-    search_similar_content
+    sync_manual_embeddings,
+    search_similar_content,
+    search_similar_content_batch,
+    warm_up_embeddings_model
 )
-from models.embeddings import SearchQuery, SearchResult
-from services.groq_service import generate_content_with_rag
+from services.embedding_spaces import (
+    ACTIVE_SPACE,
+    BACKFILL_SPACE,
+    EMBEDDING_SPACES,
+    EMBEDDINGS_VERSIONED,
+    scope_to_space,
+    write_spaces
+)
+from services.embedding_backfill import start_backfill, get_backfill_status
+from services.change_feed import get_change_feed, publish_change
+from services.http_cache import (
+    check_not_modified,
+    conditional_json_response,
+    invalidate_on_change,
+    list_etag,
+    manual_etag,
+)
+from services.fast_json import serialize_rows, json_response
+from services.admission_control import AdmissionRejected, admission_priority, admission_status
+from services.model_router import router_status
+from services.bulk_transfer import BULK_IMPORT_MAX_LINE_BYTES, NdjsonImporter, export_ndjson
+from models.embeddings import SearchQuery, SearchResult, GlobalSearchQuery, GlobalSearchResult
+from services.lexical_index import build_lexical_index, drop_lexical_index, invalidate_lexical_on_change
+from services.global_index import (
+    global_search,
+    global_index_status,
+    refresh_manual_in_index,
+    drop_manual_from_index,
+    reset_global_index,
+    update_index_on_change,
+)
+from services.groq_service import generate_compliant_content, build_content_prompt
+from services.context_assembler import assemble_rag_context
+from services.token_counter import count_llm_tokens
 from fastapi import UploadFile, File,Form
-from services.gemini_service import audit_image_against_brand_manual, test_gemini_connection
-from models.governance import ApprovalRequest, AuditResult
+from services.gemini_service import (
+    audit_image_against_brand_manual,
+    audit_image_against_brand_manuals,
+    test_gemini_connection,
+    get_genai
+)
+from models.governance import ApprovalRequest, AuditResult, MultiAuditResult
+from services.metrics_service import (
+    observe_request,
+    stage_timer,
+    render_metrics,
+    register_histogram,
+    observe_histogram
+)
 
 # Cargar variables de entorno
 load_dotenv()
 
+# Inicialización de clientes y modelo al arrancar:
+# - background: en un hilo, sin retrasar el inicio del servidor (default)
+# - blocking: antes de aceptar requests
+# - off: todo se crea en la primera request que lo necesita
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "background").lower()
+
+
+def _warm_up():
+    """Crea los clientes externos y carga el modelo de embeddings"""
+    steps = (
+        ("supabase", get_supabase_client),
+        ("groq", get_groq_client),
+        ("gemini", get_genai),
+        ("embeddings", warm_up_embeddings_model),
+    )
+    for name, step in steps:
+        try:
+            with stage_timer("startup_warmup", component=name):
+                step()
+        except Exception as e:
+            print(f"Warning: no se pudo inicializar {name} al arrancar: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Los cambios publicados (aquí o en otros workers) invalidan los ETags
+    # guardados, el índice global y los índices BM25
+    feed = get_change_feed()
+    for listener in (invalidate_on_change, update_index_on_change, invalidate_lexical_on_change):
+        feed.add_listener(listener)
+    try:
+        await feed.start(supabase)
+    except Exception as e:
+        print(f"Warning: no se pudo iniciar el feed de cambios: {e}")
+    
+    if STARTUP_WARMUP == "blocking":
+        await asyncio.to_thread(_warm_up)
+    elif STARTUP_WARMUP == "background":
+        app.state.warmup_task = asyncio.create_task(asyncio.to_thread(_warm_up))
+    yield
+
+
 # Crear instancia de FastAPI
 app = FastAPI(
     title="Content Suite - Alicorp",
     description="API para generación de contenido con IA",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configurar CORS
@@ -42,10 +136,65 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Change-Cursor", "ETag"],
+)
+
+# Control de admisión (services/admission_control.py): sin presupuesto del
+# proveedor se responde 429 con Retry-After en lugar de esperar o fallar
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc), "provider": exc.provider, "priority": exc.priority},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+# Métricas por endpoint (histograma de latencia + contador por status)
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        # Usar la plantilla de la ruta (/brand-manuals/{manual_id}) para no
+        # crear una serie por cada ID
+        route = request.scope.get("route")
+        path = getattr(route, "path", None) or "unmatched"
+        observe_request(request.method, path, status_code, time.perf_counter() - start)
+
+register_histogram(
+    "rag_prompt_tokens",
+    "Tokens del prompt final de generación de contenido",
+    buckets=(250, 500, 1000, 1500, 2000, 3000, 4000, 6000, 8000)
 )
 
-# Cliente de Supabase
-supabase = get_supabase_client()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Exporta las métricas locales en formato Prometheus
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/admission/status")
+async def admission_control_status():
+    """
+    Presupuestos RPM/TPM disponibles y colas por prioridad de cada proveedor
+    """
+    return admission_status()
+
+
+@app.get("/models/status")
+async def model_routing_status():
+    """
+    Cadenas de modelos por tarea, presupuestos de latencia y p90 / tasa de
+    error actuales de cada modelo
+    """
+    return router_status()
 
 
 # ============================================
@@ -79,39 +228,74 @@ async def create_brand_manual(manual: BrandManualCreate):
         }
         
         # Insertar en Supabase
-        result = supabase.table("brand_manuals").insert(manual_data).execute()
+        with stage_timer("insert", table="brand_manuals"):
+            result = supabase.table("brand_manuals").insert(manual_data).execute()
         
         if not result.data:
             raise HTTPException(status_code=500, detail="Error al crear el manual")
         
+        publish_change("brand_manuals", "create", result.data[0]["id"], result.data[0], supabase)
+        
         return result.data[0]
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 @app.get("/brand-manuals", response_model=list[BrandManualResponse])
-async def get_all_brand_manuals():
+async def get_all_brand_manuals(request: Request):
     """
     Obtiene todos los manuales de marca
+
+    El header X-Change-Cursor es el cursor del feed de cambios tomado antes
+    de la consulta: el cliente lo pasa a /changes/stream para aplicar solo
+    los cambios posteriores a esta lista.
+
+    Soporta If-None-Match (304 sin consultar la base si el ETag sigue
+    vigente) y compresión gzip/brotli según Accept-Encoding.
     """
     try:
-        result = supabase.table("brand_manuals").select("*").order("created_at", desc=True).execute()
-        return result.data
+        cursor_header = {"X-Change-Cursor": get_change_feed().current_cursor()}
+        cached = check_not_modified(request, "manuals:list")
+        if cached is not None:
+            cached.headers.update(cursor_header)
+            return cached
+
+        with stage_timer("db_fetch", table="brand_manuals"):
+            result = supabase.table("brand_manuals").select("*").order("created_at", desc=True).execute()
+        rows = result.data
+        return conditional_json_response(
+            request, "manuals:list", list_etag(rows),
+            # Misma salida que response_model (ruta rápida con FAST_JSON_RESPONSES)
+            lambda: serialize_rows(rows, BrandManualResponse, many=True),
+            headers=cursor_header
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 @app.get("/brand-manuals/{manual_id}", response_model=BrandManualResponse)
-async def get_brand_manual(manual_id: str):
+async def get_brand_manual(manual_id: str, request: Request):
     """
     Obtiene un manual de marca específico por ID
+
+    Soporta If-None-Match (304 sin consultar la base si el ETag sigue
+    vigente) y compresión gzip/brotli según Accept-Encoding.
     """
     try:
-        result = supabase.table("brand_manuals").select("*").eq("id", manual_id).execute()
+        cached = check_not_modified(request, f"manual:{manual_id}")
+        if cached is not None:
+            return cached
+
+        with stage_timer("db_fetch", table="brand_manuals"):
+            result = supabase.table("brand_manuals").select("*").eq("id", manual_id).execute()
         
         if not result.data:
             raise HTTPException(status_code=404, detail="Manual no encontrado")
         
-        return result.data[0]
+        row = result.data[0]
+        return conditional_json_response(
+            request, f"manual:{manual_id}", manual_etag(row),
+            lambda: serialize_rows(row, BrandManualResponse)
+        )
     except HTTPException:
         raise
     except Exception as e:
@@ -128,6 +312,10 @@ async def delete_brand_manual(manual_id: str):
         if not result.data:
             raise HTTPException(status_code=404, detail="Manual no encontrado")
         
+        drop_lexical_index(manual_id)
+        drop_manual_from_index(manual_id)
+        publish_change("brand_manuals", "delete", manual_id, supabase_client=supabase)
+        
         return {"message": "Manual eliminado correctamente", "id": manual_id}
     except HTTPException:
         raise
@@ -152,7 +340,8 @@ async def generate_brand_manual_with_ai(request: BrandManualGenerateRequest):
             description=request.description,
             product_type=request.product_type,
             tone=request.tone,
-            target_audience=request.target_audience
+            target_audience=request.target_audience,
+            mode=request.generation_mode
         )
         
         # 2. Preparar datos para guardar en DB
@@ -168,19 +357,23 @@ async def generate_brand_manual_with_ai(request: BrandManualGenerateRequest):
         }
         
         # 3. Guardar en Supabase
-        result = supabase.table("brand_manuals").insert(manual_data).execute()
+        with stage_timer("insert", table="brand_manuals"):
+            result = supabase.table("brand_manuals").insert(manual_data).execute()
         
         if not result.data:
             raise HTTPException(status_code=500, detail="Error al guardar el manual generado")
         
         # 4. Preparar respuesta
         saved_manual = result.data[0]
+        publish_change("brand_manuals", "create", saved_manual["id"], saved_manual, supabase)
         
         return {
             **saved_manual,
             "message": "Manual de marca generado exitosamente con IA"
         }
         
+    except AdmissionRejected:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500, 
@@ -198,7 +391,8 @@ async def generate_embeddings_for_manual(manual_id: str):
     """
     try:
         # 1. Obtener el manual de la base de datos
-        result = supabase.table("brand_manuals").select("*").eq("id", manual_id).execute()
+        with stage_timer("db_fetch", table="brand_manuals"):
+            result = supabase.table("brand_manuals").select("*").eq("id", manual_id).execute()
         
         if not result.data:
             raise HTTPException(status_code=404, detail="Manual no encontrado")
@@ -212,23 +406,37 @@ async def generate_embeddings_for_manual(manual_id: str):
                 detail="Este manual no tiene contenido generado. Usa /brand-manuals/generate primero."
             )
         
-        # 2. Procesar el manual y generar embeddings
-        embeddings_data = await process_manual_for_rag(
-            manual_id=manual_id,
-            manual_data=manual["full_manual"]
-        )
+        # 2. Sincronizar cada espacio de escritura (el activo y, durante un
+        # cambio de modelo, el espacio en backfill)
+        synced = []
+        for space in write_spaces():
+            synced.append(await sync_manual_embeddings(
+                manual_id=manual_id,
+                manual_data=manual["full_manual"],
+                supabase_client=supabase,
+                space=space
+            ))
+        active = synced[0]
         
-        # 3. Primero eliminar embeddings existentes (si hay)
-        supabase.table("brand_manual_embeddings").delete().eq("manual_id", manual_id).execute()
+        # 3. Indexar los chunks del espacio activo para la búsqueda léxica (modo hybrid)
+        build_lexical_index(manual_id, active["stored"], active["space"])
         
-        # 4. Guardar los nuevos embeddings en la base de datos
-        result = supabase.table("brand_manual_embeddings").insert(embeddings_data).execute()
+        # 4. Actualizar el índice de búsqueda global (si este proceso lo tiene cargado)
+        await asyncio.to_thread(
+            refresh_manual_in_index, manual_id, supabase, manual["name"], manual.get("product_type")
+        )
         
         return {
             "message": "Embeddings generados exitosamente",
             "manual_id": manual_id,
-            "chunks_created": len(embeddings_data),
-            "sections": [chunk["section"] for chunk in embeddings_data]
+            "embedding_space": active["space"],
+            "chunks_created": active["chunks_created"],
+            "chunks_reused": active["chunks_reused"],
+            "sections": active["sections"],
+            "spaces": {
+                item["space"]: {"chunks_created": item["chunks_created"], "chunks_reused": item["chunks_reused"]}
+                for item in synced
+            }
         }
         
     except HTTPException:
@@ -256,7 +464,8 @@ async def search_brand_manual(search: SearchQuery):
             query=search.query,
             manual_id=search.manual_id,
             supabase_client=supabase,
-            top_k=search.top_k
+            top_k=search.top_k,
+            mode=search.mode
         )
         
         if not results:
@@ -267,16 +476,43 @@ async def search_brand_manual(search: SearchQuery):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error en búsqueda: {str(e)}")
 
+@app.post("/search/global", response_model=List[GlobalSearchResult])
+async def search_all_manuals(search: GlobalSearchQuery):
+    """
+    Búsqueda semántica en todos los manuales del catálogo
+
+    Responde preguntas como "¿qué marcas ya usan este claim o este tono?".
+    Usa un índice ANN (GLOBAL_SEARCH_BACKEND: IVF local o HNSW de pgvector)
+    y admite filtros por sección, tipo de producto y manuales a excluir.
+    """
+    try:
+        return await global_search(
+            query=search.query,
+            supabase_client=supabase,
+            top_k=search.top_k,
+            sections=search.sections,
+            product_types=search.product_types,
+            exclude_manual_ids=search.exclude_manual_ids
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error en búsqueda: {str(e)}")
+
+@app.get("/search/global/status")
+async def global_search_status():
+    """Backend de la búsqueda global y tamaño del índice local"""
+    return global_index_status()
+
 @app.get("/brand-manuals/{manual_id}/embeddings/status")
 async def check_embeddings_status(manual_id: str):
     """
     Verifica si un manual tiene embeddings generados
     """
     try:
-        result = supabase.table("brand_manual_embeddings")\
-            .select("id, section")\
-            .eq("manual_id", manual_id)\
-            .execute()
+        result = scope_to_space(
+            supabase.table("brand_manual_embeddings")
+            .select("id, section")
+            .eq("manual_id", manual_id)
+        ).execute()
         
         has_embeddings = len(result.data) > 0
         
@@ -294,107 +530,341 @@ async def check_embeddings_status(manual_id: str):
 
 
 
+@app.get("/embeddings/spaces")
+async def list_embedding_spaces():
+    """
+    Espacios de embeddings registrados, cuál está activo y el estado de los backfills
+    """
+    try:
+        spaces = []
+        for space_id, config in EMBEDDING_SPACES.items():
+            chunks = None
+            if EMBEDDINGS_VERSIONED:
+                count = supabase.table("brand_manual_embeddings")\
+                    .select("id", count="exact")\
+                    .eq("embedding_space", space_id)\
+                    .limit(1)\
+                    .execute()
+                chunks = count.count
+            spaces.append({
+                **config,
+                "active": space_id == ACTIVE_SPACE,
+                "backfill_target": space_id == BACKFILL_SPACE,
+                "chunks": chunks
+            })
+        
+        return {
+            "versioned": EMBEDDINGS_VERSIONED,
+            "active_space": ACTIVE_SPACE,
+            "backfill_space": BACKFILL_SPACE,
+            "spaces": spaces,
+            "backfills": get_backfill_status()
+        }
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+
+@app.post("/embeddings/spaces/{space_id}/backfill", status_code=202)
+async def backfill_embedding_space(space_id: str):
+    """
+    Genera en segundo plano los embeddings de todos los manuales en un
+    espacio nuevo. Las búsquedas siguen usando el espacio activo; el cambio
+    se hace con EMBEDDINGS_ACTIVE_SPACE en el siguiente deploy.
+    """
+    try:
+        return start_backfill(space_id, supabase)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.get("/embeddings/spaces/{space_id}/backfill")
+async def backfill_status(space_id: str):
+    """Progreso del backfill de un espacio"""
+    return get_backfill_status(space_id)
+
+
+@app.delete("/embeddings/spaces/{space_id}")
+async def delete_embedding_space(space_id: str):
+    """
+    Elimina los vectores de un espacio retirado (no el activo ni el de backfill)
+    """
+    if not EMBEDDINGS_VERSIONED:
+        raise HTTPException(status_code=400, detail="Requiere EMBEDDINGS_VERSIONED=true")
+    if space_id in (ACTIVE_SPACE, BACKFILL_SPACE):
+        raise HTTPException(status_code=409, detail=f"El espacio {space_id} está en uso en este deployment")
+    
+    try:
+        with stage_timer("delete", table="brand_manual_embeddings"):
+            supabase.table("brand_manual_embeddings")\
+                .delete()\
+                .eq("embedding_space", space_id)\
+                .execute()
+        return {"message": f"Espacio {space_id} eliminado", "space": space_id}
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+
 class ContentGenerateRequest(BaseModel):
     manual_id: str
     content_type: str  # "product_description", "video_script", "image_prompt"
     additional_context: str = ""  # Opcional: contexto adicional del usuario
 
 
+class ContentGenerateBatchRequest(BaseModel):
+    manual_id: str
+    content_types: List[str]  # Uno o más de VALID_CONTENT_TYPES
+    additional_context: str = ""  # Opcional: se aplica a todos los tipos
+
+
+VALID_CONTENT_TYPES = ["product_description", "video_script", "image_prompt"]
+
+# Consultas RAG por tipo: preguntas naturales para encontrar reglas del manual
+# (el modelo de embeddings entiende mejor lenguaje natural que keywords)
+RAG_QUERIES = {
+    "product_description": "¿Cuál es el tono de comunicación para descripciones? ¿Hay palabras prohibidas? ¿Puedo usar tecnicismos? ¿Qué estilo de redacción debo usar?",
+    "video_script": "¿Qué tono usar en videos? ¿Cuáles son los mensajes clave? ¿Quién es el público objetivo? ¿Cómo estructurar el contenido?",
+    "image_prompt": "¿Qué colores principales y secundarios usar exactamente? ¿Cuál es el estilo fotográfico detallado? ¿Qué elementos son obligatorios y cuáles prohibidos? ¿Cómo usar el logo: tamaño mínimo, espaciado, posición? ¿Qué fondos están permitidos y prohibidos? ¿Hay reglas de composición visual? ¿Qué tipografía usar?"
+}
+
+# Chunks por consulta (5 en lugar de 3 para más contexto en image_prompt)
+RAG_TOP_K = 5
+
+
+def _get_manual_for_content(manual_id: str) -> dict:
+    """
+    Manual listo para generar contenido: con full_manual y embeddings
+    
+    Raises:
+        HTTPException: 404 si no existe, 400 si falta el manual IA o los embeddings
+    """
+    with stage_timer("db_fetch", table="brand_manuals"):
+        manual_result = supabase.table("brand_manuals")\
+            .select("*")\
+            .eq("id", manual_id)\
+            .execute()
+    
+    if not manual_result.data:
+        raise HTTPException(status_code=404, detail="Manual no encontrado")
+    
+    manual = manual_result.data[0]
+    
+    if not manual.get("full_manual"):
+        raise HTTPException(
+            status_code=400,
+            detail="Este manual no tiene contenido generado por IA"
+        )
+    
+    with stage_timer("db_fetch", table="brand_manual_embeddings"):
+        embeddings_check = scope_to_space(
+            supabase.table("brand_manual_embeddings")
+            .select("id")
+            .eq("manual_id", manual_id)
+            .limit(1)
+        ).execute()
+    
+    if not embeddings_check.data:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Este manual no tiene embeddings. Ejecuta: POST /brand-manuals/{manual_id}/generate-embeddings"
+        )
+    
+    return manual
+
+
+def _prepare_content_context(content_type: str, rag_results: list, user_prompt: str, brand_name: str) -> dict:
+    """
+    Contexto RAG ordenado por score, sin duplicados y dentro del presupuesto
+    de tokens del tipo de contenido, más el conteo de tokens del prompt final
+    """
+    if not rag_results:
+        raise HTTPException(
+            status_code=500,
+            detail="No se pudo recuperar contexto del manual"
+        )
+    
+    assembled = assemble_rag_context(rag_results, content_type)
+    prompt_tokens = count_llm_tokens(
+        build_content_prompt(content_type, user_prompt, assembled["context"], brand_name)
+    )
+    observe_histogram("rag_prompt_tokens", prompt_tokens, {"content_type": content_type})
+    return {**assembled, "prompt_tokens": prompt_tokens}
+
+
+# Guardar el modelo que generó cada contenido (requiere la columna
+# generated_content.model_used, ver docs/SUPABASE_RAG_SETUP.sql)
+RECORD_MODEL_USED = os.getenv("RECORD_MODEL_USED", "false").lower() == "true"
+
+
+def _content_row(manual_id: str, content_type: str, additional_context: str, generation: dict) -> dict:
+    row = {
+        "manual_id": manual_id,
+        "content_type": content_type,
+        "user_prompt": additional_context if additional_context else f"Generación automática de {content_type}",
+        "generated_text": generation["text"],
+        "status": "pending"
+    }
+    if RECORD_MODEL_USED:
+        row["model_used"] = generation["model"]
+    return row
+
+
+def _content_response(saved: dict, context: dict, generation: dict) -> dict:
+    return {
+        "id": saved["id"],
+        "content_type": saved["content_type"],
+        "generated_text": generation["text"],
+        "rag_context_used": context["chunks_used"],
+        "context_tokens": context["context_tokens"],
+        "prompt_tokens": context["prompt_tokens"],
+        "compliance": {**generation["compliance"], "regenerations": generation["regenerations"]},
+        "model_used": generation["model"],
+        "status": "pending",
+        "message": "Contenido generado basado en el manual de IA"
+    }
+
+
 @app.post("/content/generate")
 async def generate_content(request: ContentGenerateRequest):
     """Módulo II: Creative Engine"""
     try:
         # 1. Validar tipo
-        valid_types = ["product_description", "video_script", "image_prompt"]
-        if request.content_type not in valid_types:
-            raise HTTPException(status_code=400, detail=f"Tipo inválido. Use: {valid_types}")
+        if request.content_type not in VALID_CONTENT_TYPES:
+            raise HTTPException(status_code=400, detail=f"Tipo inválido. Use: {VALID_CONTENT_TYPES}")
         
-        # 2. Obtener manual
-        manual_result = supabase.table("brand_manuals")\
-            .select("*")\
-            .eq("id", request.manual_id)\
-            .execute()
+        # 2. Obtener manual (con full_manual y embeddings)
+        manual = _get_manual_for_content(request.manual_id)
         
-        if not manual_result.data:
-            raise HTTPException(status_code=404, detail="Manual no encontrado")
+        # 3. Consultar RAG
+        rag_results = await search_similar_content(
+            query=RAG_QUERIES[request.content_type],
+            manual_id=request.manual_id,
+            supabase_client=supabase,
+            top_k=RAG_TOP_K
+        )
         
-        manual = manual_result.data[0]
+        # 4. Formatear contexto
+        user_prompt = request.additional_context if request.additional_context else ""
+        context = _prepare_content_context(request.content_type, rag_results, user_prompt, manual["name"])
         
-        # 3. Verificar que tenga full_manual generado
-        if not manual.get("full_manual"):
-            raise HTTPException(
-                status_code=400,
-                detail="Este manual no tiene contenido generado por IA"
-            )
+        # 5. Generar contenido automáticamente basado en el tipo seleccionado,
+        # escaneando el stream contra las palabras prohibidas del manual
+        generation = await generate_compliant_content(
+            content_type=request.content_type,
+            user_prompt=user_prompt,
+            rag_context=context["context"],
+            brand_name=manual["name"],
+            manual_content=manual["full_manual"]
+        )
         
-        # 4. Verificar embeddings
-        embeddings_check = supabase.table("brand_manual_embeddings")\
-            .select("id")\
-            .eq("manual_id", request.manual_id)\
-            .execute()
+        # 6. Guardar
+        content_data = _content_row(request.manual_id, request.content_type,
+                                    request.additional_context, generation)
         
-        if not embeddings_check.data:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Este manual no tiene embeddings. Ejecuta: POST /brand-manuals/{request.manual_id}/generate-embeddings"
-            )
+        with stage_timer("insert", table="generated_content"):
+            result = supabase.table("generated_content").insert(content_data).execute()
         
-        # 5. Consultar RAG - Preguntas naturales para encontrar reglas del manual
-        # El modelo de embeddings entiende mejor lenguaje natural que keywords
-        rag_queries = {
-            "product_description": "¿Cuál es el tono de comunicación para descripciones? ¿Hay palabras prohibidas? ¿Puedo usar tecnicismos? ¿Qué estilo de redacción debo usar?",
-            "video_script": "¿Qué tono usar en videos? ¿Cuáles son los mensajes clave? ¿Quién es el público objetivo? ¿Cómo estructurar el contenido?",
-            "image_prompt": "¿Qué colores principales y secundarios usar exactamente? ¿Cuál es el estilo fotográfico detallado? ¿Qué elementos son obligatorios y cuáles prohibidos? ¿Cómo usar el logo: tamaño mínimo, espaciado, posición? ¿Qué fondos están permitidos y prohibidos? ¿Hay reglas de composición visual? ¿Qué tipografía usar?"
-        }
+        publish_change("generated_content", "create", result.data[0]["id"], result.data[0], supabase)
         
-        rag_results = await search_similar_content(
-            query=rag_queries[request.content_type],
+        return _content_response(result.data[0], context, generation)
+        
+    except (HTTPException, AdmissionRejected):
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+
+@app.post("/content/generate/batch")
+async def generate_content_batch(request: ContentGenerateBatchRequest):
+    """
+    Genera varios tipos de contenido para el mismo manual en una sola request
+
+    El manual se lee una vez, las consultas RAG van en un solo batch de
+    embeddings con las búsquedas en paralelo, las llamadas a Groq son
+    concurrentes y las filas se guardan en un solo insert. La latencia es
+    aproximadamente la del tipo más lento.
+
+    Si un tipo falla, los demás se guardan igual y el error se reporta en
+    "errors".
+    """
+    try:
+        # 1. Validar tipos (sin duplicados, en el orden pedido)
+        content_types = list(dict.fromkeys(request.content_types))
+        invalid = [t for t in content_types if t not in VALID_CONTENT_TYPES]
+        if not content_types or invalid:
+            raise HTTPException(status_code=400, detail=f"Tipo inválido. Use: {VALID_CONTENT_TYPES}")
+        
+        # 2. Obtener manual una sola vez
+        manual = _get_manual_for_content(request.manual_id)
+        
+        # 3. Todas las consultas RAG en un batch
+        rag_by_type = await search_similar_content_batch(
+            queries=[RAG_QUERIES[t] for t in content_types],
             manual_id=request.manual_id,
             supabase_client=supabase,
-            top_k=5  # Aumentado de 3 a 5 para más contexto en image_prompt
+            top_k=RAG_TOP_K
         )
         
-        if not rag_results:
-            raise HTTPException(
-                status_code=500,
-                detail="No se pudo recuperar contexto del manual"
+        user_prompt = request.additional_context if request.additional_context else ""
+        contexts = {
+            content_type: _prepare_content_context(content_type, rag_results, user_prompt, manual["name"])
+            for content_type, rag_results in zip(content_types, rag_by_type)
+        }
+        
+        # 4. Generación concurrente, con prioridad batch frente a las
+        # generaciones individuales
+        with stage_timer("content_generate_batch", types=str(len(content_types))), admission_priority("batch"):
+            generations = await asyncio.gather(
+                *[
+                    generate_compliant_content(
+                        content_type=content_type,
+                        user_prompt=user_prompt,
+                        rag_context=contexts[content_type]["context"],
+                        brand_name=manual["name"],
+                        manual_content=manual["full_manual"]
+                    )
+                    for content_type in content_types
+                ],
+                return_exceptions=True
             )
         
-        # 6. Formatear contexto
-        rag_context = "\n\n".join([
-            f"[SECCIÓN: {r['section']}]\n{r['content']}"
-            for r in rag_results
-        ])
+        succeeded = []
+        errors = []
+        for content_type, generation in zip(content_types, generations):
+            if isinstance(generation, Exception):
+                errors.append({"content_type": content_type, "error": str(generation)})
+            else:
+                succeeded.append((content_type, generation))
         
-        # 7. Generar contenido automáticamente basado en el tipo seleccionado
-        generated = await generate_content_with_rag(
-            content_type=request.content_type,
-            user_prompt=request.additional_context if request.additional_context else "",
-            rag_context=rag_context,
-            brand_name=manual["name"]
-        )
+        if not succeeded:
+            rejected = [g for g in generations if isinstance(g, AdmissionRejected)]
+            if rejected:
+                raise rejected[0]
+            raise HTTPException(status_code=500, detail=f"Error: ningún tipo se generó ({errors})")
         
-        # 8. Guardar
-        content_data = {
-            "manual_id": request.manual_id,
-            "content_type": request.content_type,
-            "user_prompt": request.additional_context if request.additional_context else f"Generación automática de {request.content_type}",
-            "generated_text": generated,
-            "status": "pending"
-        }
+        # 5. Un solo insert para todas las filas (PostgREST conserva el orden)
+        rows = [
+            _content_row(request.manual_id, content_type, request.additional_context, generation)
+            for content_type, generation in succeeded
+        ]
+        with stage_timer("insert", table="generated_content"):
+            result = supabase.table("generated_content").insert(rows).execute()
         
-        result = supabase.table("generated_content").insert(content_data).execute()
+        results = []
+        for saved, (content_type, generation) in zip(result.data, succeeded):
+            publish_change("generated_content", "create", saved["id"], saved, supabase)
+            results.append(_content_response(saved, contexts[content_type], generation))
         
         return {
-            "id": result.data[0]["id"],
-            "content_type": request.content_type,
-            "generated_text": generated,
-            "rag_context_used": rag_results,
-            "status": "pending",
-            "message": "Contenido generado basado en el manual de IA"
+            "manual_id": request.manual_id,
+            "results": results,
+            "errors": errors
         }
         
-    except HTTPException:
+    except (HTTPException, AdmissionRejected):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
@@ -414,7 +884,7 @@ async def list_content(manual_id: str = None):
             query = query.eq("manual_id", manual_id)
         
         result = query.order("created_at", desc=True).execute()
-        return result.data
+        return json_response(result.data)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
@@ -442,6 +912,9 @@ async def approve_content(content_id: str):
             .eq("id", content_id)\
             .execute()
         
+        publish_change("generated_content", "update", content_id,
+                       result.data[0] if result.data else {"id": content_id, "status": "approved"}, supabase)
+        
         return {
             "id": content_id,
             "status": "approved",
@@ -475,6 +948,9 @@ async def reject_content(content_id: str):
             .eq("id", content_id)\
             .execute()
         
+        publish_change("generated_content", "update", content_id,
+                       result.data[0] if result.data else {"id": content_id, "status": "rejected"}, supabase)
+        
         return {
             "id": content_id,
             "status": "rejected",
@@ -487,6 +963,169 @@ async def reject_content(content_id: str):
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 
+# --- FEED DE CAMBIOS (SSE) ---
+
+@app.get("/changes/stream")
+async def stream_changes(request: Request, cursor: Optional[str] = None, topics: Optional[str] = None):
+    """
+    Stream SSE de cambios en brand_manuals y generated_content
+
+    - cursor: último cursor recibido (o el header X-Change-Cursor de la
+      lista inicial). Al reconectarse, EventSource envía Last-Event-ID y
+      tiene prioridad.
+    - topics: tablas separadas por coma (por defecto todas)
+
+    Cada evento es {"table", "op", "row_id", "data", "cursor"} con op create,
+    update o delete; "data" solo trae los campos de resumen. Un evento
+    "reset" indica que el cliente debe recargar la lista completa.
+    """
+    cursor = request.headers.get("last-event-id") or cursor
+    topic_set = {t.strip() for t in topics.split(",") if t.strip()} if topics else None
+    feed = get_change_feed()
+
+    async def event_stream():
+        # Reintento sugerido a EventSource tras una desconexión (ms)
+        yield "retry: 3000\n\n"
+        async for event in feed.subscribe(cursor, topic_set, supabase):
+            if await request.is_disconnected():
+                break
+            if event is None:
+                yield ": keep-alive\n\n"
+                continue
+            name = "reset" if event["op"] == "reset" else "change"
+            payload = {k: event.get(k) for k in ("table", "op", "row_id", "data", "cursor")}
+            yield f"id: {event['cursor']}\nevent: {name}\ndata: {json.dumps(payload, default=str)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            # Evitar que un proxy (nginx) acumule el stream
+            "X-Accel-Buffering": "no",
+        }
+    )
+
+
+# --- EXPORTACIÓN / IMPORTACIÓN MASIVA (NDJSON) ---
+
+def _split_param(value: Optional[str]) -> Optional[List[str]]:
+    return [item.strip() for item in value.split(",") if item.strip()] if value else None
+
+
+@app.get("/export/ndjson")
+async def export_data(
+    tables: Optional[str] = None,
+    manual_ids: Optional[str] = None,
+    vector_format: str = "f32"
+):
+    """
+    Exporta manuales, embeddings y contenidos como NDJSON en streaming
+
+    - tables: tablas separadas por coma (por defecto todas, en orden de dependencias)
+    - manual_ids: solo estos manuales y sus filas relacionadas
+    - vector_format: f32 (sin pérdida, por defecto), f16 o json
+
+    Las filas se leen por páginas (BULK_EXPORT_PAGE_SIZE) a medida que el
+    cliente consume la respuesta. El archivo se importa con POST
+    /import/ndjson o scripts/bulk_transfer.py sin regenerar embeddings.
+    """
+    try:
+        # Valida los parámetros antes de empezar a responder
+        lines = export_ndjson(supabase, _split_param(tables), _split_param(manual_ids), vector_format)
+        first = next(lines)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    def stream():
+        yield first
+        # Generador síncrono: Starlette lo consume en el threadpool
+        yield from lines
+
+    return StreamingResponse(
+        stream(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="brand-export.ndjson"'}
+    )
+
+
+@app.post("/import/ndjson")
+async def import_data(request: Request, mode: str = "upsert", batch_size: Optional[int] = None):
+    """
+    Importa un export NDJSON leyendo el body en streaming
+
+    - mode: upsert (reemplaza filas con el mismo id) o skip (conserva las existentes)
+    - batch_size: filas por insert (por defecto BULK_IMPORT_BATCH_SIZE)
+
+    Los embeddings se guardan con el vector del archivo (no se regeneran).
+    Los lotes ya guardados no se revierten si una línea posterior es
+    inválida; reimportar con upsert es idempotente.
+    """
+    op = "update" if mode == "upsert" else "create"
+    # Lotes guardados en el hilo de importación; se publican desde el event
+    # loop (el feed de cambios y sus listeners no son thread-safe)
+    flushed = []
+    imported_manuals = set()
+
+    def publish_flushed():
+        while flushed:
+            table, rows = flushed.pop(0)
+            if table == "brand_manual_embeddings":
+                imported_manuals.update(str(row["manual_id"]) for row in rows if row.get("manual_id"))
+                continue
+            for row in rows:
+                if row.get("id") is not None:
+                    publish_change(table, op, row["id"], row, supabase)
+
+    try:
+        importer = NdjsonImporter(supabase, batch_size, mode,
+                                  on_flush=lambda table, rows: flushed.append((table, rows)))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    def add_lines(lines: list):
+        for line in lines:
+            importer.add_line(line)
+
+    try:
+        pending = b""
+        async for chunk in request.stream():
+            pending += chunk
+            *lines, pending = pending.split(b"\n")
+            if len(pending) > BULK_IMPORT_MAX_LINE_BYTES:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"Línea de más de {BULK_IMPORT_MAX_LINE_BYTES} bytes (filas ya importadas: {importer.counts})"
+                )
+            if lines:
+                # Los inserts del cliente de Supabase son síncronos
+                await asyncio.to_thread(add_lines, lines)
+                publish_flushed()
+        await asyncio.to_thread(add_lines, [pending])
+        summary = await asyncio.to_thread(importer.finish)
+        publish_flushed()
+        return summary
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"{str(e)} (filas ya importadas: {importer.counts})"
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al importar: {str(e)} (filas ya importadas: {importer.counts})")
+    finally:
+        # También tras un error: los lotes ya guardados cambiaron la base
+        try:
+            publish_flushed()
+        except Exception as e:
+            print(f"Warning: no se pudieron publicar los cambios del import: {str(e)}")
+        if imported_manuals:
+            for manual_id in imported_manuals:
+                drop_lexical_index(manual_id)
+            reset_global_index()
+
+
 # --- PARTE B: AUDITORÍA MULTIMODAL (CORREGIDO) ---
 
 @app.get("/gemini/status")
@@ -499,7 +1138,8 @@ async def gemini_status():
 @app.post("/audit/image", response_model=AuditResult)
 async def audit_image_against_manual(
     manual_id: str = Form(...),
-    image: UploadFile = File(...)
+    image: UploadFile = File(...),
+    tiered: Optional[bool] = Form(None)
 ):
     """
     MÓDULO III - Parte B: Auditoría Multimodal
@@ -510,6 +1150,7 @@ async def audit_image_against_manual(
     Args:
         manual_id: UUID del manual de marca a usar como referencia
         image: Archivo de imagen a auditar
+        tiered: Auditoría por niveles (pre-filtro + escalado). Por defecto AUDIT_TIERED
     
     Returns:
         - compliant: true/false si cumple con el manual
@@ -517,13 +1158,15 @@ async def audit_image_against_manual(
         - issues: Lista de problemas encontrados
         - recommendations: Recomendaciones para mejorar
         - analysis: Análisis detallado de la imagen
+        - tier_used / tiers: Nivel que decidió y detalle por nivel
     """
     try:
         # 1. Obtener el manual de marca
-        manual_result = supabase.table("brand_manuals")\
-            .select("*")\
-            .eq("id", manual_id)\
-            .execute()
+        with stage_timer("db_fetch", table="brand_manuals"):
+            manual_result = supabase.table("brand_manuals")\
+                .select("*")\
+                .eq("id", manual_id)\
+                .execute()
         
         if not manual_result.data:
             raise HTTPException(status_code=404, detail="Manual no encontrado")
@@ -551,7 +1194,8 @@ async def audit_image_against_manual(
         audit_result = await audit_image_against_brand_manual(
             image_bytes=image_bytes,
             manual_content=manual["full_manual"],
-            brand_name=manual["name"]
+            brand_name=manual["name"],
+            tiered=tiered
         )
         
         # 6. Retornar resultado
@@ -563,13 +1207,114 @@ async def audit_image_against_manual(
             "message": "✅ Auditoría completada" if audit_result["compliant"] else "❌ La imagen no cumple con el manual"
         }
         
-    except HTTPException:
+    except (HTTPException, AdmissionRejected):
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error en auditoría: {str(e)}")
+
+
+# Manuales por auditoría múltiple (cada uno es una llamada a Gemini)
+AUDIT_MAX_MANUALS = int(os.getenv("AUDIT_MAX_MANUALS", "5"))
+
+
+@app.post("/audit/image/multi", response_model=MultiAuditResult)
+async def audit_image_against_manuals(
+    manual_ids: List[str] = Form(...),
+    image: UploadFile = File(...),
+    tiered: Optional[bool] = Form(None)
+):
+    """
+    Auditoría de una imagen contra varios manuales (piezas co-branded)
+    
+    La imagen se sube y decodifica una sola vez, los manuales se leen en
+    una sola consulta y las auditorías corren en paralelo.
+    
+    Args:
+        manual_ids: UUIDs de los manuales (campo repetido o separados por coma)
+        image: Archivo de imagen a auditar
+        tiered: Auditoría por niveles (pre-filtro + escalado). Por defecto AUDIT_TIERED
+    
+    Returns:
+        - compliant: true si cumple con todos los manuales auditados
+        - results: un resultado por manual (mismo formato que /audit/image)
+        - errors: manuales que no se pudieron auditar
+    """
+    try:
+        # 1. Normalizar IDs (sin duplicados, en el orden recibido)
+        ids = list(dict.fromkeys(
+            manual_id.strip() for value in manual_ids for manual_id in value.split(",") if manual_id.strip()
+        ))
+        if not ids:
+            raise HTTPException(status_code=400, detail="Indica al menos un manual")
+        if len(ids) > AUDIT_MAX_MANUALS:
+            raise HTTPException(status_code=400, detail=f"Máximo {AUDIT_MAX_MANUALS} manuales por auditoría")
+        
+        # 2. Validar que sea imagen
+        if not image.content_type or not image.content_type.startswith("image/"):
+            raise HTTPException(
+                status_code=400,
+                detail=f"El archivo debe ser una imagen. Tipo recibido: {image.content_type}"
+            )
+        
+        # 3. Obtener todos los manuales en una consulta
+        with stage_timer("db_fetch", table="brand_manuals"):
+            manual_result = supabase.table("brand_manuals")\
+                .select("id, name, full_manual")\
+                .in_("id", ids)\
+                .execute()
+        
+        manuals = {row["id"]: row for row in manual_result.data or []}
+        missing = [manual_id for manual_id in ids if manual_id not in manuals]
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Manuales no encontrados: {missing}")
+        
+        without_manual = [manual_id for manual_id in ids if not manuals[manual_id].get("full_manual")]
+        if without_manual:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Manuales sin contenido generado por IA: {without_manual}. Ejecuta POST /brand-manuals/generate primero"
+            )
+        
+        # 4. Leer imagen y auditar contra todos los manuales
+        image_bytes = await image.read()
+        ordered = [manuals[manual_id] for manual_id in ids]
+        with admission_priority("batch"):
+            audits = await audit_image_against_brand_manuals(image_bytes, ordered, tiered=tiered)
+        
+        results = []
+        errors = []
+        for manual, audit_result in zip(ordered, audits):
+            if isinstance(audit_result, Exception):
+                errors.append({"manual_id": manual["id"], "error": str(audit_result)})
+                continue
+            results.append({
+                "content_id": None,
+                "manual_id": manual["id"],
+                "manual_name": manual["name"],
+                **audit_result,
+                "message": "✅ Auditoría completada" if audit_result["compliant"] else "❌ La imagen no cumple con el manual"
+            })
+        
+        if not results:
+            rejected = [a for a in audits if isinstance(a, AdmissionRejected)]
+            if rejected:
+                raise rejected[0]
+            raise HTTPException(status_code=500, detail=f"Error en auditoría: {errors}")
+        
+        return {
+            "compliant": not errors and all(r["compliant"] for r in results),
+            "results": results,
+            "errors": errors
+        }
+        
+    except (HTTPException, AdmissionRejected):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error en auditoría: {str(e)}")
 
 
 # Ejecutar con: uvicorn main:app --reload
+# Varios workers compartiendo el modelo (Linux): python prefork_server.py --workers 4
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Literal
 from datetime import datetime
 from uuid import UUID
 
@@ -53,6 +53,10 @@ class BrandManualGenerateRequest(BaseModel):
     product_type: str = Field(..., description="Tipo de producto")
     tone: str = Field(..., description="Tono de comunicación deseado")
     target_audience: str = Field(..., description="Público objetivo")
+    generation_mode: Optional[Literal["single", "parallel"]] = Field(
+        None,
+        description="single: un solo JSON | parallel: una llamada por sección en paralelo (por defecto MANUAL_GENERATION_MODE)"
+    )
     
     class Config:
         json_schema_extra = {
@@ -61,7 +65,8 @@ class BrandManualGenerateRequest(BaseModel):
                 "description": "Snack saludable hecho con quinua orgánica peruana, alto en proteínas y fibra",
                 "product_type": "snack saludable",
                 "tone": "divertido, cercano pero profesional",
-                "target_audience": "Gen Z y Millennials health-conscious"
+                "target_audience": "Gen Z y Millennials health-conscious",
+                "generation_mode": "parallel"
             }
         }
 
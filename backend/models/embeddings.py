@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import List, Optional, Literal
 from uuid import UUID
 
 class EmbeddingCreate(BaseModel):
@@ -18,13 +18,18 @@ class SearchQuery(BaseModel):
     query: str = Field(..., description="Pregunta o consulta sobre el manual")
     manual_id: str = Field(..., description="ID del manual a consultar")
     top_k: int = Field(default=3, description="Número de resultados")
+    mode: Literal["vector", "hybrid"] = Field(
+        default="vector",
+        description="vector: similitud coseno | hybrid: BM25 + vector con Reciprocal Rank Fusion"
+    )
     
     class Config:
         json_schema_extra = {
             "example": {
                 "query": "¿Puedo usar tecnicismos en las descripciones?",
                 "manual_id": "uuid-del-manual",
-                "top_k": 3
+                "top_k": 3,
+                "mode": "hybrid"
             }
         }
 
@@ -36,4 +41,39 @@ class SearchResult(BaseModel):
     manual_id: UUID
     content: str
     section: str
-    similarity: float
\ No newline at end of file
+    similarity: Optional[float] = None  # None si el chunk solo vino de la búsqueda léxica
+    score: Optional[float] = None  # Score RRF (solo en modo hybrid)
+class GlobalSearchQuery(BaseModel):
+    """
+    Búsqueda semántica en todos los manuales
+    """
+    query: str = Field(..., description="Claim, tono o texto a buscar en el catálogo")
+    top_k: int = Field(default=10, ge=1, le=100, description="Número de resultados")
+    sections: Optional[List[str]] = Field(
+        default=None,
+        description="Secciones o sub-secciones (ej. tono_comunicacion, directrices_contenido.claims)"
+    )
+    product_types: Optional[List[str]] = Field(default=None, description="Tipos de producto del manual")
+    exclude_manual_ids: Optional[List[str]] = Field(default=None, description="Manuales a excluir")
+    
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "query": "Energía natural para toda la familia",
+                "top_k": 10,
+                "sections": ["tono_comunicacion"],
+                "product_types": ["snack"]
+            }
+        }
+
+class GlobalSearchResult(BaseModel):
+    """
+    Chunk de cualquier manual con los datos de su manual
+    """
+    id: UUID
+    manual_id: UUID
+    manual_name: Optional[str] = None
+    product_type: Optional[str] = None
+    content: str
+    section: str
+    similarity: float
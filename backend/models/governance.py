@@ -1,11 +1,21 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 from uuid import UUID
 
 class ApprovalRequest(BaseModel):
     """Request para aprobar/rechazar contenido"""
     status: str  # "approved" o "rejected"
     
+class AuditTierResult(BaseModel):
+    """Resultado de un nivel de la auditoría (prescreen / full)"""
+    tier: str
+    score: Optional[float] = None
+    compliant: Optional[bool] = None
+    confidence: Optional[float] = None
+    latency_ms: float
+    escalated: bool = False
+    model: Optional[str] = None  # Modelo de Gemini (None en local_color)
+
 class AuditResult(BaseModel):
     """Resultado de auditoría multimodal"""
     content_id: Optional[UUID] = None
@@ -16,4 +26,20 @@ class AuditResult(BaseModel):
     issues: List[str]
     recommendations: List[str]
     analysis: str
-    message: str
\ No newline at end of file
+    message: str
+    category_scores: Optional[Dict[str, float]] = None
+    color_analysis: Optional[Dict[str, Any]] = None  # Paleta medida localmente
+    tier_used: Optional[str] = None  # Nivel que tomó la decisión final
+    model_used: Optional[str] = None  # Modelo que tomó la decisión final (ruteo por latencia)
+    tiers: Optional[List[AuditTierResult]] = None
+
+class AuditError(BaseModel):
+    """Manual que no se pudo auditar en una auditoría múltiple"""
+    manual_id: str
+    error: str
+
+class MultiAuditResult(BaseModel):
+    """Resultado de auditar una imagen contra varios manuales"""
+    compliant: bool  # true solo si cumple con todos los manuales auditados
+    results: List[AuditResult]
+    errors: List[AuditError] = []
@@ -0,0 +1,232 @@
+"""
+Servidor pre-fork: carga el modelo de embeddings una sola vez y lo
+comparte entre varios workers uvicorn
+
+El proceso padre importa la app, carga los pesos del modelo, los deja en
+modo inferencia (eval, sin gradientes) y congela el heap con gc.freeze()
+para que el recolector no toque esas páginas. Después hace fork de N
+workers que comparten la memoria del modelo copy-on-write y atienden el
+mismo socket. Los clientes externos (Supabase, Groq, Gemini) se crean en
+cada worker, nunca en el padre.
+
+Cada worker reporta su memoria al arrancar (RSS, PSS y parte compartida;
+PSS reparte las páginas compartidas entre los procesos que las usan, así
+que la suma de PSS es el consumo real del nodo).
+
+Uso (desde backend/, solo Linux/macOS):
+    python prefork_server.py --workers 4 --port 8000
+"""
+import argparse
+import asyncio
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Dict, Optional, Union
+
+# Campos de /proc/<pid>/smaps_rollup que se reportan (kB)
+_SMAPS_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+
+
+def read_memory(pid: Union[int, str] = "self") -> Optional[Dict[str, float]]:
+    """
+    Memoria de un proceso en MB (Linux: smaps_rollup)
+
+    Sin /proc (macOS) solo se conoce el RSS máximo del proceso actual: para
+    otro pid retorna None.
+    """
+    try:
+        values = {}
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                name, _, rest = line.partition(":")
+                if name in _SMAPS_FIELDS:
+                    values[name] = int(rest.split()[0]) / 1024
+        return {
+            "rss_mb": values.get("Rss", 0.0),
+            "pss_mb": values.get("Pss", 0.0),
+            "shared_mb": values.get("Shared_Clean", 0.0) + values.get("Shared_Dirty", 0.0),
+            "private_mb": values.get("Private_Clean", 0.0) + values.get("Private_Dirty", 0.0),
+        }
+    except OSError:
+        if pid not in ("self", os.getpid()):
+            return None
+        import resource
+        # ru_maxrss está en kB en Linux y en bytes en macOS
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+        return {"rss_mb": maxrss / divisor}
+
+
+def format_memory(memory: Dict[str, float]) -> str:
+    if "pss_mb" not in memory:
+        return f"RSS máx {memory['rss_mb']:.1f} MB"
+    return (
+        f"RSS {memory['rss_mb']:.1f} MB | PSS {memory['pss_mb']:.1f} MB | "
+        f"compartida {memory['shared_mb']:.1f} MB | privada {memory['private_mb']:.1f} MB"
+    )
+
+
+def preload():
+    """
+    Importa la app y carga el modelo en el padre, antes del fork
+    """
+    from main import app
+    from services.embeddings_service import warm_up_embeddings_model
+
+    start = time.perf_counter()
+    model = warm_up_embeddings_model()
+    if model is not None:
+        model.freeze()
+        print(f"[prefork] Modelo '{model.name}' cargado en {time.perf_counter() - start:.1f}s")
+    else:
+        print("[prefork] EMBEDDINGS_SERVER_SOCKET configurado: el modelo vive en el servidor de embeddings")
+
+    # Todo lo creado hasta aquí pasa a la generación permanente: el GC no lo
+    # recorre en los workers y no fuerza copias de esas páginas
+    gc.collect()
+    gc.freeze()
+    return app
+
+
+def _bind_socket(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(index: int, app, sock: socket.socket, args):
+    """Cuerpo del proceso hijo: un servidor uvicorn sobre el socket compartido"""
+    import uvicorn
+
+    # El pool de hilos de torch no sobrevive al fork: configurarlo por worker
+    torch = sys.modules.get("torch")
+    if torch is not None and args.threads_per_worker:
+        torch.set_num_threads(args.threads_per_worker)
+
+    config = uvicorn.Config(app, log_level=args.log_level, lifespan="on")
+    server = uvicorn.Server(config)
+
+    async def serve():
+        task = asyncio.create_task(server.serve(sockets=[sock]))
+        while not server.started and not task.done():
+            await asyncio.sleep(0.05)
+        if server.started:
+            print(f"[worker {index} pid {os.getpid()}] listo: {format_memory(read_memory())}", flush=True)
+        await task
+
+    asyncio.run(serve())
+
+
+def _spawn(index: int, app, sock: socket.socket, args) -> int:
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            _run_worker(index, app, sock, args)
+        except BaseException as e:
+            print(f"[worker {index}] Error: {e}", file=sys.stderr)
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor pre-fork con modelo compartido")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "2")))
+    parser.add_argument("--threads-per-worker", type=int, default=0,
+                        help="Hilos de torch por worker (0 = núcleos / workers)")
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--report-after", type=float, default=5.0,
+                        help="Segundos tras los que el padre imprime la memoria de todos los workers")
+    args = parser.parse_args()
+
+    if not hasattr(os, "fork"):
+        sys.exit("prefork_server requiere fork (Linux/macOS). En Windows usar: uvicorn main:app")
+
+    # Los workers reparten entre sí las cuotas de los proveedores
+    # (services/admission_control.py)
+    os.environ["WEB_CONCURRENCY"] = str(args.workers)
+
+    if not args.threads_per_worker:
+        args.threads_per_worker = max(1, (os.cpu_count() or 1) // args.workers)
+
+    app = preload()
+    print(f"[prefork] Padre pid {os.getpid()}: {format_memory(read_memory())}")
+
+    sock = _bind_socket(args.host, args.port)
+    workers = {_spawn(i, app, sock, args): i for i in range(args.workers)}
+    print(f"[prefork] {args.workers} workers en http://{args.host}:{args.port}")
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    report_at = time.monotonic() + args.report_after
+    while not stopping:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid:
+            index = workers.pop(pid, None)
+            if index is not None:
+                print(f"[prefork] Worker {index} (pid {pid}) terminó con estado {status}; reiniciando")
+                workers[_spawn(index, app, sock, args)] = index
+            continue
+        if report_at and time.monotonic() >= report_at:
+            report_at = None
+            total_pss = 0.0
+            for pid, index in sorted(workers.items(), key=lambda item: item[1]):
+                memory = read_memory(pid)
+                if memory is None:
+                    # Sin /proc: cada worker ya reportó su memoria al arrancar
+                    print("[prefork] Sin /proc/<pid>/smaps_rollup: se omite el reporte por worker")
+                    break
+                total_pss += memory.get("pss_mb", memory["rss_mb"])
+                print(f"[prefork] worker {index} pid {pid}: {format_memory(memory)}")
+            else:
+                print(f"[prefork] Memoria total de los workers (suma PSS): {total_pss:.1f} MB")
+        time.sleep(0.2)
+
+    # Apagado: SIGTERM a los workers (uvicorn cierra ordenadamente) y luego SIGKILL
+    for pid in workers:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    deadline = time.monotonic() + 30
+    while workers and time.monotonic() < deadline:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid:
+            workers.pop(pid, None)
+        else:
+            time.sleep(0.1)
+    for pid in workers:
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    sock.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+Recall y latencia del índice IVF de la búsqueda global
+(services/global_index.py) frente a la búsqueda exacta
+
+Genera un catálogo sintético con la estructura de los chunks reales: cada
+manual tiene las secciones del esquema, los chunks de una misma sección se
+parecen entre manuales y cada manual agrega su propio "estilo". Mide:
+
+1. recall@k y latencia por consulta para varios nprobe
+2. recall con filtros (section, product_type)
+3. altas y bajas incrementales: borra y agrega manuales, verifica que los
+   borrados nunca aparecen y que el recall se mantiene
+
+Uso (desde backend/):
+    python scripts/benchmark_global_search.py --manuals 2000 --queries 200
+    python scripts/benchmark_global_search.py --manuals 2000 --dim 384 --nprobe 4,8,16,32
+"""
+import argparse
+import os
+import sys
+import time
+import uuid
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.global_index import IVFIndex  # noqa: E402
+
+SECTIONS = [
+    "identidad_marca.mision", "identidad_marca.valores", "tono_comunicacion.estilo",
+    "tono_comunicacion.palabras_prohibidas", "elementos_visuales.colores", "elementos_visuales.logo",
+    "publico_objetivo.perfil", "directrices_contenido.claims", "ejemplos_aplicacion.redes",
+]
+PRODUCT_TYPES = ["snack", "bebida", "galleta", "salsa", "detergente", "pasta"]
+
+
+def _unit(x):
+    return x / np.linalg.norm(x, axis=-1, keepdims=True)
+
+
+def make_catalog(rng, dim):
+    """Direcciones compartidas por sección y por tipo de producto"""
+    return {
+        "sections": _unit(rng.standard_normal((len(SECTIONS), dim))),
+        "products": _unit(rng.standard_normal((len(PRODUCT_TYPES), dim))),
+    }
+
+
+def make_manuals(rng, catalog, count, dim, chunks_per_section=3):
+    """Chunks sintéticos: sección + tipo de producto + estilo del manual + ruido"""
+    section_centers = catalog["sections"]
+    product_centers = catalog["products"]
+    manuals = []
+    for _ in range(count):
+        manual_id = str(uuid.uuid4())
+        product_type = PRODUCT_TYPES[rng.integers(len(PRODUCT_TYPES))]
+        style = _unit(rng.standard_normal(dim))
+        chunks, vectors = [], []
+        for s, section in enumerate(SECTIONS):
+            for _ in range(chunks_per_section):
+                vector = (section_centers[s] + 0.4 * product_centers[PRODUCT_TYPES.index(product_type)]
+                          + 0.5 * style + 0.6 * _unit(rng.standard_normal(dim)))
+                chunks.append({"id": str(uuid.uuid4()), "manual_id": manual_id,
+                               "content": f"{section} de {manual_id[:8]}", "section": section})
+                vectors.append(vector)
+        manuals.append({"id": manual_id, "product_type": product_type,
+                        "chunks": chunks, "vectors": _unit(np.array(vectors, dtype=np.float32))})
+    return manuals
+
+
+def make_queries(rng, manuals, count, dim, section_prefix=None):
+    """
+    Consultas cerca de chunks existentes (como "¿quién usa este claim?");
+    con section_prefix, cerca de chunks de esa sección (consulta coherente
+    con el filtro)
+    """
+    queries = []
+    while len(queries) < count:
+        manual = manuals[rng.integers(len(manuals))]
+        position = rng.integers(len(manual["vectors"]))
+        if section_prefix and not manual["chunks"][position]["section"].startswith(section_prefix):
+            continue
+        queries.append(_unit(manual["vectors"][position] + 0.5 * _unit(rng.standard_normal(dim))))
+    return queries
+
+
+def recall(index, queries, k, **kwargs):
+    hits, total, elapsed = 0, 0, 0.0
+    for query in queries:
+        exact = {r["id"] for r in index.search(query, k, exact=True, **{
+            key: value for key, value in kwargs.items() if key != "nprobe"})}
+        start = time.perf_counter()
+        approx = index.search(query, k, **kwargs)
+        elapsed += time.perf_counter() - start
+        hits += len(exact & {r["id"] for r in approx})
+        total += len(exact)
+    return hits / max(total, 1), elapsed / len(queries) * 1000
+
+
+def exact_latency(index, queries, k):
+    start = time.perf_counter()
+    for query in queries:
+        index.search(query, k, exact=True)
+    return (time.perf_counter() - start) / len(queries) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall del índice IVF de búsqueda global")
+    parser.add_argument("--manuals", type=int, default=2000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", default="4,8,16,32")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    catalog = make_catalog(rng, args.dim)
+    manuals = make_manuals(rng, catalog, args.manuals, args.dim)
+    index = IVFIndex(args.dim)
+    start = time.perf_counter()
+    for manual in manuals:
+        index.set_manual(manual["id"], product_type=manual["product_type"])
+        index.add(manual["chunks"], manual["vectors"])
+    build = time.perf_counter() - start
+    stats = index.stats()
+    print(f"{stats['chunks']} chunks de {args.manuals} manuales, {stats['lists']} listas, "
+          f"{stats['memory_mb']} MB, construcción incremental {build:.1f}s")
+
+    queries = make_queries(rng, manuals, args.queries, args.dim)
+    print(f"\nexacta: {exact_latency(index, queries, args.k):.2f} ms/consulta")
+    print(f"{'nprobe':>7} {'recall@' + str(args.k):>10} {'ms/consulta':>12}")
+    for nprobe in map(int, args.nprobe.split(",")):
+        value, latency = recall(index, queries, args.k, nprobe=nprobe)
+        print(f"{nprobe:7d} {value:10.3f} {latency:12.2f}")
+
+    print("\nCon filtros (nprobe por defecto); consultas al azar / de la sección filtrada:")
+    filters = {
+        "section=tono_comunicacion": {"sections": ["tono_comunicacion"]},
+        "product_type=bebida": {"product_types": ["bebida"]},
+        "section=directrices_contenido.claims + snack": {
+            "sections": ["directrices_contenido.claims"], "product_types": ["snack"]},
+    }
+    for name, kwargs in filters.items():
+        value, latency = recall(index, queries, args.k, **kwargs)
+        line = f"  {name:45} recall {value:.3f} {latency:5.2f} ms"
+        if "sections" in kwargs:
+            matching = make_queries(rng, manuals, args.queries, args.dim, kwargs["sections"][0])
+            value, latency = recall(index, matching, args.k, **kwargs)
+            line += f"  |  recall {value:.3f} {latency:5.2f} ms"
+        print(line)
+
+    # Altas y bajas incrementales
+    removed = manuals[: len(manuals) // 10]
+    for manual in removed:
+        index.remove_manual(manual["id"])
+    added = make_manuals(rng, catalog, len(removed), args.dim)
+    for manual in added:
+        index.set_manual(manual["id"], product_type=manual["product_type"])
+        index.add(manual["chunks"], manual["vectors"])
+    removed_ids = {m["id"] for m in removed}
+    queries = make_queries(rng, manuals[len(removed):] + added, args.queries, args.dim)
+    leaked = sum(
+        r["manual_id"] in removed_ids for q in queries for r in index.search(q, args.k)
+    )
+    value, latency = recall(index, queries, args.k)
+    print(f"\nTras borrar {len(removed)} manuales y agregar {len(added)}: recall {value:.3f}, "
+          f"{latency:.2f} ms, resultados de manuales borrados: {leaked}")
+    if leaked:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
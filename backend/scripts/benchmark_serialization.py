@@ -0,0 +1,131 @@
+"""
+Mide la serialización rápida de manuales (services/fast_json.py)
+
+Throughput por core (tiempo de CPU de un solo hilo) de:
+- fastapi:  validación + jsonable (dump_python mode=json) + json.dumps,
+            lo que hace FastAPI con response_model
+- pydantic: validación + dump_json (ruta con ETag sin FAST_JSON_RESPONSES)
+- orjson:   proyección + orjson (FAST_JSON_RESPONSES=true)
+
+La equivalencia con BrandManualResponse se verifica en tests/test_fast_json.py.
+
+Uso (desde backend/):
+    python scripts/benchmark_serialization.py --rows 200 --rounds 20
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.brand_manual import BrandManualResponse  # noqa: E402
+from services.fast_json import _adapter, orjson, serialize_fast, serialize_validated  # noqa: E402
+
+TIMESTAMPS = (
+    "2024-05-01T12:34:56.78901+00:00",
+    "2024-05-01T12:34:56+00:00",
+    "2024-05-01T12:34:56.123456",
+    "2024-05-01T07:34:56.5-05:00",
+)
+
+
+def _full_manual(rng: random.Random):
+    """Manual con la forma del que genera services/groq_service.py"""
+    words = ["marca", "sabor", "energía", "natural", "crocante", "familia", "Perú", "ñandú", "🌽"]
+
+    def text(n):
+        return " ".join(rng.choice(words) for _ in range(n))
+
+    return {
+        "identidad_marca": {
+            "mision": text(25), "vision": text(25),
+            "valores": [text(3) for _ in range(5)],
+            "personalidad": text(15),
+        },
+        "tono_comunicacion": {
+            "estilo": text(10),
+            "palabras_clave": [text(1) for _ in range(8)],
+            "palabras_prohibidas": [text(1) for _ in range(6)],
+            "ejemplos": [text(20) for _ in range(4)],
+        },
+        "elementos_visuales": {
+            "colores_principales": [f"#{rng.randrange(16 ** 6):06X}" for _ in range(3)],
+            "colores_secundarios": [f"#{rng.randrange(16 ** 6):06X}" for _ in range(3)],
+            "tipografia": {"principal": "Montserrat", "secundaria": "Open Sans"},
+            "estilo_fotografia": text(20),
+        },
+        "uso_logo": {"tamano_minimo": f"{rng.randint(10, 40)}mm", "area_proteccion": rng.random(),
+                     "prohibiciones": [text(6) for _ in range(4)]},
+        "publico_objetivo": {"edad": [18, 35], "intereses": [text(2) for _ in range(5)]},
+        "reglas": {"uso_tecnicismos": rng.random() < 0.5, "max_palabras": rng.randint(50, 300)},
+    }
+
+
+def make_rows(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        rows.append({
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "name": f"Marca {i} ñ",
+            "description": None if i % 5 == 0 else "Descripción con \"comillas\" y \\ barras\n",
+            "product_type": "snack",
+            "tone": "divertido",
+            "target_audience": "Gen Z",
+            "full_manual": None if i % 7 == 0 else _full_manual(rng),
+            "created_at": TIMESTAMPS[i % len(TIMESTAMPS)],
+            "updated_at": TIMESTAMPS[(i + 1) % len(TIMESTAMPS)],
+            # Columnas que no están en el modelo no deben salir
+            "internal_note": "x",
+        })
+    return rows
+
+
+def _fastapi_like(rows):
+    adapter = _adapter(BrandManualResponse, True)
+    data = adapter.dump_python(adapter.validate_python(rows), mode="json")
+    return json.dumps(data, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def _throughput(fn, rows, rounds):
+    fn(rows)
+    start = time.process_time()
+    for _ in range(rounds):
+        fn(rows)
+    elapsed = time.process_time() - start
+    return len(rows) * rounds / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de serialización de manuales")
+    parser.add_argument("--rows", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    if orjson is None:
+        print("❌ orjson no está instalado (pip install orjson)")
+        sys.exit(1)
+
+    rows = make_rows(args.rows)
+
+    paths = {
+        "fastapi": _fastapi_like,
+        "pydantic": lambda r: serialize_validated(r, BrandManualResponse, many=True),
+        "orjson": lambda r: serialize_fast(r, BrandManualResponse, many=True),
+    }
+    size = len(paths["pydantic"](rows))
+    print(f"\n{args.rows} manuales, {size / args.rows / 1024:.1f} KB/manual")
+    print(f"{'ruta':10} {'filas/s/core':>14} {'MB/s':>8} {'vs fastapi':>11}")
+    baseline = None
+    for name, fn in paths.items():
+        rate = _throughput(fn, rows, args.rounds)
+        baseline = baseline or rate
+        print(f"{name:10} {rate:14.0f} {rate * size / args.rows / 1e6:8.1f} {rate / baseline:10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Compara el transporte de vectores JSON vs base64 (float16 / float32)
+
+Mide, para N vectores normalizados de 384 dimensiones:
+- bytes del payload JSON que se envía a Supabase
+- CPU de serialización (desde el array de NumPy hasta el texto JSON)
+- error de similitud coseno tras la ida y vuelta
+
+También verifica que la decodificación de decode_vector_b64() en SQL
+(docs/SUPABASE_RAG_SETUP.sql), replicada aquí con la misma aritmética de
+bits, reconstruye exactamente los valores.
+
+Uso (desde backend/):
+    python scripts/benchmark_vector_transport.py --vectors 1000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.vector_codec import decode_vector, embedding_column  # noqa: E402
+
+DIMENSION = 384
+
+
+def _sql_decode(payload: str) -> np.ndarray:
+    """Réplica de decode_vector_b64() con la misma aritmética de bits que el SQL"""
+    import base64
+    fmt, _, data = payload.partition(":")
+    raw = np.frombuffer(base64.b64decode(data), dtype=np.uint8).astype(np.int64)
+    if fmt == "f16":
+        bits = raw[0::2] | (raw[1::2] << 8)
+        sign = np.where((bits >> 15) == 1, -1.0, 1.0)
+        exp = (bits >> 10) & 31
+        mant = (bits & 1023).astype(np.float64)
+        value = np.where(exp == 0, mant * 2.0 ** -24, (1 + mant / 1024) * 2.0 ** (exp - 15))
+    else:
+        bits = raw[0::4] | (raw[1::4] << 8) | (raw[2::4] << 16) | (raw[3::4] << 24)
+        sign = np.where((bits >> 31) == 1, -1.0, 1.0)
+        exp = (bits >> 23) & 255
+        mant = (bits & 8388607).astype(np.float64)
+        value = np.where(exp == 0, mant * 2.0 ** -149, (1 + mant / 8388608) * 2.0 ** (exp - 127))
+    # La columna vector de pgvector es float32
+    return (sign * value).astype(np.float32)
+
+
+def _bench(vectors: np.ndarray, transport: str):
+    start = time.perf_counter()
+    payload = json.dumps([embedding_column(v, transport) for v in vectors])
+    elapsed = time.perf_counter() - start
+    return payload, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de transporte de vectores")
+    parser.add_argument("--vectors", type=int, default=1000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((args.vectors, DIMENSION)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    baseline_payload, baseline_time = _bench(vectors, "json")
+    print(f"{'formato':8} {'bytes/vector':>13} {'ms/1000 vec':>12} {'reducción':>10} {'max err coseno':>15}")
+    print(f"{'json':8} {len(baseline_payload) / args.vectors:13.0f} "
+          f"{baseline_time / args.vectors * 1e6:12.1f} {'1.0x':>10} {0.0:15.2e}")
+
+    ok = True
+    for transport in ("f32", "f16"):
+        payload, elapsed = _bench(vectors, transport)
+        encoded = [row["embedding_b64"] for row in json.loads(payload)]
+
+        decoded = np.stack([decode_vector(p) for p in encoded])
+        sql_decoded = np.stack([_sql_decode(p) for p in encoded])
+        if not np.array_equal(decoded, sql_decoded):
+            print(f"❌ {transport}: la decodificación SQL no coincide con NumPy")
+            ok = False
+
+        cosine = (vectors * decoded).sum(axis=1) / np.linalg.norm(decoded, axis=1)
+        print(f"{transport:8} {len(payload) / args.vectors:13.0f} "
+              f"{elapsed / args.vectors * 1e6:12.1f} "
+              f"{len(baseline_payload) / len(payload):9.1f}x "
+              f"{float(np.abs(1 - cosine).max()):15.2e}")
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Exporta / importa manuales, embeddings y contenidos en NDJSON
+(services/bulk_transfer.py) directamente contra Supabase, sin pasar por
+la API
+
+Usa SUPABASE_URL y SUPABASE_KEY del .env del entorno (origen al exportar,
+destino al importar). Los archivos .gz se comprimen / descomprimen al vuelo.
+
+Uso (desde backend/):
+    python scripts/bulk_transfer.py export --out staging.ndjson.gz
+    python scripts/bulk_transfer.py export --out marca.ndjson --manual-ids <uuid1>,<uuid2>
+    python scripts/bulk_transfer.py import --in staging.ndjson.gz --batch-size 500
+"""
+import argparse
+import gzip
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.database import get_supabase_client  # noqa: E402
+from services.bulk_transfer import (  # noqa: E402
+    EXPORT_TABLES,
+    IMPORT_MODES,
+    VECTOR_FORMATS,
+    export_ndjson,
+    import_ndjson,
+)
+
+
+def _open(path: str, mode: str):
+    if path == "-":
+        return sys.stdout.buffer if "w" in mode else sys.stdin.buffer
+    return gzip.open(path, mode) if path.endswith(".gz") else open(path, mode)
+
+
+def _split(value):
+    return [item.strip() for item in value.split(",") if item.strip()] if value else None
+
+
+def run_export(args):
+    start = time.perf_counter()
+    lines = 0
+    output = _open(args.out, "wb")
+    try:
+        for line in export_ndjson(get_supabase_client(), _split(args.tables), _split(args.manual_ids),
+                                  args.vector_format, args.page_size):
+            output.write(line)
+            lines += 1
+    finally:
+        if output is not sys.stdout.buffer:
+            output.close()
+    print(f"✅ {lines - 1} filas exportadas en {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+
+def run_import(args):
+    start = time.perf_counter()
+    source = _open(args.input, "rb")
+    try:
+        summary = import_ndjson(source, get_supabase_client(), args.batch_size, args.mode)
+    finally:
+        if source is not sys.stdin.buffer:
+            source.close()
+    print(f"✅ importado en {time.perf_counter() - start:.1f}s: {summary['rows']}", file=sys.stderr)
+    if any(summary["skipped"].values()):
+        print(f"   omitidas: {summary['skipped']}", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export / import NDJSON de manuales y embeddings")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="Exportar a NDJSON")
+    export.add_argument("--out", default="-", help="Archivo destino (.gz para comprimir, - para stdout)")
+    export.add_argument("--tables", help=f"Tablas separadas por coma (por defecto {','.join(EXPORT_TABLES)})")
+    export.add_argument("--manual-ids", help="Solo estos manuales (UUIDs separados por coma)")
+    export.add_argument("--vector-format", default="f32", choices=VECTOR_FORMATS)
+    export.add_argument("--page-size", type=int, default=None)
+    export.set_defaults(func=run_export)
+
+    imp = commands.add_parser("import", help="Importar un NDJSON")
+    imp.add_argument("--in", dest="input", default="-", help="Archivo origen (.gz o - para stdin)")
+    imp.add_argument("--mode", default="upsert", choices=IMPORT_MODES)
+    imp.add_argument("--batch-size", type=int, default=None)
+    imp.set_defaults(func=run_import)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Verifica el tiempo de importación de la app y que no cargue SDKs pesados
+
+Importa el módulo (por defecto main) en un proceso limpio, sin
+credenciales en el entorno, con `python -X importtime`. Falla (exit 1) si:
+- la importación supera el presupuesto (--budget-ms)
+- quedó cargado algún módulo que debe ser lazy (clientes, PIL, torch...)
+- la importación falla (ej: por exigir credenciales)
+
+Lo mismo corre como test en tests/test_import_time.py.
+
+Uso (desde backend/):
+    python scripts/check_import_time.py
+    python scripts/check_import_time.py --module main --budget-ms 1500
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_TIME_BUDGET_MS = float(os.getenv("IMPORT_TIME_BUDGET_MS", "1500"))
+
+# Módulos que solo deben importarse al usarse (lazy o en el lifespan)
+LAZY_MODULES = [
+    "supabase",
+    "groq",
+    "google.generativeai",
+    "PIL",
+    "langfuse",
+    "sentence_transformers",
+    "torch",
+    "onnxruntime",
+]
+
+# Variables que no deben hacer falta para importar la app
+CREDENTIAL_VARS = [
+    "SUPABASE_URL", "SUPABASE_KEY", "GROQ_API_KEY", "GOOGLE_AI_KEY",
+    "LANGFUSE_PUBLIC_KEY", "LANGFUSE_SECRET_KEY",
+]
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+lazy = {lazy!r}
+print("__RESULT__" + json.dumps({{
+    "elapsed_ms": elapsed * 1000,
+    "loaded": [m for m in lazy if m in sys.modules],
+}}))
+"""
+
+_IMPORTTIME_RE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def _clean_env() -> dict:
+    env = dict(os.environ)
+    # Vacías (no ausentes) para que load_dotenv() no las tome de backend/.env
+    for name in CREDENTIAL_VARS:
+        env[name] = ""
+    return env
+
+
+def _slowest_imports(stderr: str, top: int):
+    """Módulos de primer nivel con mayor tiempo acumulado"""
+    rows = []
+    for line in stderr.splitlines():
+        match = _IMPORTTIME_RE.match(line)
+        if match and len(match.group(3)) <= 2:
+            rows.append((int(match.group(2)) / 1000, match.group(4)))
+    return sorted(rows, reverse=True)[:top]
+
+
+def measure_import(module: str = "main"):
+    """
+    Importa el módulo en un proceso limpio sin credenciales
+
+    Returns:
+        (resultado, stderr): resultado tiene elapsed_ms y los módulos lazy
+        cargados; es None si la importación falló
+    """
+    probe = _PROBE.format(module=module, lazy=LAZY_MODULES)
+    env = _clean_env()
+    env["PYTHONPATH"] = BACKEND_DIR + os.pathsep + env.get("PYTHONPATH", "")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", probe],
+        cwd=os.path.join(BACKEND_DIR, "scripts"),
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        return None, proc.stderr
+    return json.loads(proc.stdout.split("__RESULT__", 1)[1]), proc.stderr
+
+
+def import_errors(stderr: str) -> str:
+    """stderr sin las líneas de -X importtime"""
+    return "\n".join(l for l in stderr.splitlines() if not l.startswith("import time:"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--budget-ms", type=float, default=IMPORT_TIME_BUDGET_MS)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    result, stderr = measure_import(args.module)
+    if result is None:
+        print(f"❌ No se pudo importar '{args.module}' sin credenciales:")
+        print(import_errors(stderr))
+        sys.exit(1)
+
+    print(f"Importación de '{args.module}': {result['elapsed_ms']:.0f} ms (presupuesto {args.budget_ms:.0f} ms)")
+    print("Módulos más lentos:")
+    for ms, name in _slowest_imports(stderr, args.top):
+        print(f"  {ms:8.1f} ms  {name}")
+
+    failed = False
+    if result["loaded"]:
+        print(f"❌ Módulos que deberían cargarse lazy: {', '.join(result['loaded'])}")
+        failed = True
+    if result["elapsed_ms"] > args.budget_ms:
+        print("❌ Importación sobre el presupuesto")
+        failed = True
+
+    if failed:
+        sys.exit(1)
+    print("✅ OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Exporta all-MiniLM-L6-v2 a ONNX, lo cuantiza a int8 y verifica la paridad
+con el backend torch.
+
+Uso (desde backend/):
+    pip install optimum[onnxruntime] onnxruntime tokenizers
+    python scripts/export_onnx_embeddings.py --output models_onnx/all-MiniLM-L6-v2
+
+Luego configurar en .env:
+    EMBEDDINGS_BACKEND=onnx
+
+Cada modelo se carga desde models_onnx/<modelo>: para otro espacio de
+embeddings, exportar su modelo con --model sentence-transformers/<modelo>.
+EMBEDDINGS_ONNX_DIR solo cambia el directorio del modelo por defecto.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.embedding_backends import (  # noqa: E402
+    DEFAULT_MODEL_NAME,
+    OnnxEmbeddingBackend,
+    TorchEmbeddingBackend,
+    check_backend_parity,
+    onnx_model_dir,
+    quantize_onnx_model,
+)
+
+# Textos representativos de los chunks y consultas reales del manual
+PARITY_TEXTS = [
+    "¿Qué palabras están prohibidas?",
+    "¿Cuál es el tono de comunicación?",
+    "¿Puedo usar tecnicismos?",
+    "¿Qué colores debo usar?",
+    "Colores principales: #8BC34A, #FFC107",
+    "TONO DE COMUNICACIÓN: Descripción: cercano, divertido pero profesional",
+    "Palabras prohibidas: barato, químico, artificial",
+    "PÚBLICO OBJETIVO: Gen Z y Millennials health-conscious en Lima",
+    "Uso del logo: tamaño mínimo 10% del ancho, espaciado 5% alrededor",
+    "Snack saludable hecho con quinua orgánica peruana, alto en proteínas y fibra",
+    "Crea una imagen publicitaria vibrante con fondo blanco limpio",
+    "Mensajes clave: energía natural, orgullo peruano, sabor auténtico",
+]
+
+
+def _benchmark(backend, texts, repeats: int = 20) -> float:
+    backend.encode(texts)  # warmup
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for text in texts:
+            backend.encode([text])
+    return (time.perf_counter() - start) / (repeats * len(texts)) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=f"sentence-transformers/{DEFAULT_MODEL_NAME}")
+    parser.add_argument("--output", default=None,
+                        help="Directorio destino (por defecto el que carga el backend: models_onnx/<modelo>)")
+    parser.add_argument("--min-cosine", type=float, default=0.99,
+                        help="Coseno mínimo aceptable entre backends")
+    parser.add_argument("--skip-export", action="store_true",
+                        help="Solo cuantizar y verificar un modelo ya exportado")
+    args = parser.parse_args()
+    args.output = args.output or onnx_model_dir(args.model.rsplit("/", 1)[-1])
+
+    if not args.skip_export:
+        from optimum.exporters.onnx import main_export
+        print(f"Exportando {args.model} → {args.output}")
+        main_export(args.model, output=args.output, task="feature-extraction")
+
+    quantized = os.path.join(args.output, "model_quantized.onnx")
+    print(f"Cuantizando (int8 dinámico) → {quantized}")
+    quantize_onnx_model(os.path.join(args.output, "model.onnx"), quantized)
+
+    print("Verificando paridad contra el backend torch...")
+    torch_backend = TorchEmbeddingBackend(args.model)
+    onnx_backend = OnnxEmbeddingBackend(args.output, quantize=True)
+    report = check_backend_parity(torch_backend, onnx_backend, PARITY_TEXTS)
+    report["torch_ms_per_encode"] = round(_benchmark(torch_backend, PARITY_TEXTS), 2)
+    report["onnx_ms_per_encode"] = round(_benchmark(onnx_backend, PARITY_TEXTS), 2)
+    print(json.dumps(report, indent=2))
+
+    if report["min_cosine"] < args.min_cosine:
+        print(f"❌ Paridad insuficiente: min_cosine {report['min_cosine']:.4f} < {args.min_cosine}")
+        sys.exit(1)
+    print("✅ Paridad OK")
+
+
+if __name__ == "__main__":
+    main()
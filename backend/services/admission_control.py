@@ -0,0 +1,327 @@
+"""
+Control de admisión para las llamadas a Groq y Gemini
+
+Las generaciones interactivas (un creador que presiona "generar") y los
+trabajos masivos (auditorías múltiples, generación por lotes) comparten los
+mismos límites de los proveedores. Sin control, un lote dispara 429s y los
+usuarios interactivos son los más afectados.
+
+Por proveedor se llevan localmente dos presupuestos (token buckets):
+requests por minuto y tokens por minuto. Cada llamada estima sus tokens
+(prompt + máximo de salida) y espera turno en una cola con prioridades:
+
+- interactive: pasa antes que cualquier trabajo batch en espera
+- batch: solo usa el presupuesto que no reclama una request interactiva
+
+Si la espera estimada supera el máximo de la clase
+(ADMISSION_INTERACTIVE_MAX_WAIT / ADMISSION_BATCH_MAX_WAIT) la llamada se
+rechaza de inmediato con AdmissionRejected. main.py la convierte en un 429
+con Retry-After. Cuando el proveedor igual responde 429, el presupuesto se
+vacía durante ADMISSION_PENALTY_SECONDS (o el Retry-After recibido).
+
+La prioridad se indica con admission_priority() alrededor del trabajo;
+asyncio la propaga a las tareas y los hilos que lanza ese código.
+
+Los presupuestos viven en cada proceso: GROQ_RPM, GROQ_TPM, etc. son los
+límites de la cuenta y se reparten entre los workers que corren en el nodo
+(ADMISSION_WORKERS, por defecto WEB_CONCURRENCY, que usan uvicorn --workers
+y prefork_server.py). Con varios nodos hay que bajar los límites en
+proporción.
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import math
+import os
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Dict, List, Optional
+
+from services.metrics_service import (
+    register_counter,
+    register_histogram,
+    inc_counter,
+    observe_histogram,
+)
+
+ADMISSION_CONTROL = os.getenv("ADMISSION_CONTROL", "false").lower() == "true"
+
+# Presupuestos por proveedor (valores del plan gratuito como referencia)
+PROVIDER_LIMITS = {
+    "groq": {
+        "rpm": float(os.getenv("GROQ_RPM", "30")),
+        "tpm": float(os.getenv("GROQ_TPM", "6000")),
+    },
+    "gemini": {
+        "rpm": float(os.getenv("GEMINI_RPM", "15")),
+        "tpm": float(os.getenv("GEMINI_TPM", "1000000")),
+    },
+}
+
+
+def admission_workers() -> int:
+    """Procesos que comparten la cuota del proveedor en este nodo"""
+    return max(1, int(os.getenv("ADMISSION_WORKERS") or os.getenv("WEB_CONCURRENCY") or "1"))
+
+
+PRIORITIES = ("interactive", "batch")
+# Espera máxima en cola por clase (segundos)
+MAX_WAIT = {
+    "interactive": float(os.getenv("ADMISSION_INTERACTIVE_MAX_WAIT", "15")),
+    "batch": float(os.getenv("ADMISSION_BATCH_MAX_WAIT", "120")),
+}
+# Bloqueo tras un 429 del proveedor sin Retry-After (segundos)
+ADMISSION_PENALTY_SECONDS = float(os.getenv("ADMISSION_PENALTY_SECONDS", "10"))
+
+register_counter("admission_decisions_total", "Decisiones del control de admisión por proveedor y prioridad")
+register_histogram("admission_wait_seconds", "Espera en la cola de admisión antes de llamar al proveedor")
+
+_priority: contextvars.ContextVar = contextvars.ContextVar("admission_priority", default="interactive")
+
+
+class AdmissionRejected(Exception):
+    """La llamada no se admitió: la espera estimada supera el máximo de su clase"""
+
+    def __init__(self, provider: str, retry_after: float, priority: str):
+        self.provider = provider
+        self.priority = priority
+        self.retry_after = max(1, math.ceil(retry_after))
+        super().__init__(
+            f"Límite de {provider} alcanzado para tráfico {priority}; reintenta en {self.retry_after}s"
+        )
+
+
+@contextmanager
+def admission_priority(priority: str):
+    """Marca el trabajo dentro del bloque como interactive o batch"""
+    if priority not in PRIORITIES:
+        raise ValueError(f"Prioridad desconocida: {priority}. Use: {PRIORITIES}")
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> str:
+    return _priority.get()
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """429 del proveedor (groq.RateLimitError, google ResourceExhausted)"""
+    return getattr(error, "status_code", None) == 429 or getattr(error, "code", None) == 429
+
+
+def _retry_after_from(error: Exception) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class _Bucket:
+    """Token bucket que se rellena a capacity por minuto"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def seconds_until(self, amount: float) -> float:
+        deficit = amount - self.level
+        return 0.0 if deficit <= 0 else deficit / self.rate
+
+
+class Ticket:
+    """Reserva admitida; used() corrige la estimación con el uso real"""
+
+    def __init__(self, limiter: "ProviderLimiter", tokens: float):
+        self.limiter = limiter
+        self.tokens = tokens
+        self.actual_tokens: Optional[float] = None
+
+    def used(self, tokens: Optional[float]):
+        if tokens is not None:
+            self.actual_tokens = tokens
+
+
+class ProviderLimiter:
+    """
+    Presupuestos RPM/TPM de un proveedor y cola con prioridades
+
+    La cola es estricta por prioridad y orden de llegada: un batch no se
+    adelanta a una request interactiva bloqueada aunque pida menos tokens.
+    """
+
+    def __init__(self, provider: str, rpm: float, tpm: float):
+        self.provider = provider
+        self.requests = _Bucket(rpm)
+        self.tokens = _Bucket(tpm)
+        self.blocked_until = 0.0
+        self._queue: List[tuple] = []
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def _refill(self, now: float):
+        self.requests.refill(now)
+        self.tokens.refill(now)
+
+    def _wait_for(self, requests: float, tokens: float, now: float) -> float:
+        """Segundos hasta que el presupuesto cubra requests y tokens"""
+        return max(
+            self.blocked_until - now,
+            self.requests.seconds_until(requests),
+            self.tokens.seconds_until(tokens),
+            0.0,
+        )
+
+    def estimate_wait(self, tokens: float, priority: str) -> float:
+        """Espera estimada para una llamada nueva: lo que está delante en la cola + ella"""
+        now = time.monotonic()
+        self._refill(now)
+        rank = PRIORITIES.index(priority)
+        ahead = [entry for entry in self._queue if entry[0] <= rank and not entry[2]["future"].done()]
+        return self._wait_for(len(ahead) + 1, sum(entry[2]["tokens"] for entry in ahead) + tokens, now)
+
+    def _pump(self):
+        """Admite en orden de prioridad mientras alcance el presupuesto"""
+        self._timer = None
+        now = time.monotonic()
+        self._refill(now)
+        while self._queue:
+            waiter = self._queue[0][2]
+            if waiter["future"].done():
+                heapq.heappop(self._queue)
+                continue
+            wait = self._wait_for(1, waiter["tokens"], now)
+            if wait > 0:
+                self._timer = asyncio.get_running_loop().call_later(wait, self._pump)
+                return
+            heapq.heappop(self._queue)
+            self.requests.level -= 1
+            self.tokens.level -= waiter["tokens"]
+            waiter["future"].set_result(True)
+
+    async def acquire(self, tokens: float, priority: str) -> Ticket:
+        # Una llamada más grande que el presupuesto nunca entraría
+        tokens = min(tokens, self.tokens.capacity)
+        max_wait = MAX_WAIT[priority]
+        labels = {"provider": self.provider, "priority": priority}
+
+        estimated = self.estimate_wait(tokens, priority)
+        if estimated > max_wait:
+            inc_counter("admission_decisions_total", labels={**labels, "result": "rejected"})
+            raise AdmissionRejected(self.provider, estimated, priority)
+
+        waiter = {"tokens": tokens, "future": asyncio.get_running_loop().create_future()}
+        heapq.heappush(self._queue, (PRIORITIES.index(priority), next(self._seq), waiter))
+        if self._timer is not None:
+            self._timer.cancel()
+        self._pump()
+
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter["future"]), timeout=max_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            self._abandon(waiter)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            inc_counter("admission_decisions_total", labels={**labels, "result": "timeout"})
+            raise AdmissionRejected(self.provider, self.estimate_wait(tokens, priority), priority)
+
+        observe_histogram("admission_wait_seconds", time.monotonic() - start, labels)
+        inc_counter("admission_decisions_total", labels={**labels, "result": "admitted"})
+        return Ticket(self, tokens)
+
+    def _abandon(self, waiter: Dict[str, Any]):
+        """Cancela una reserva en espera; si justo se había admitido, la devuelve"""
+        if not waiter["future"].done():
+            waiter["future"].cancel()
+        elif not waiter["future"].cancelled():
+            self.release(waiter["tokens"])
+
+    def release(self, tokens: float, requests: float = 1):
+        """Devuelve presupuesto no usado"""
+        self.requests.level = min(self.requests.capacity, self.requests.level + requests)
+        self.tokens.level = min(self.tokens.capacity, self.tokens.level + tokens)
+
+    def settle(self, ticket: Ticket):
+        """Ajusta el bucket de tokens con el uso real reportado por el proveedor"""
+        if ticket.actual_tokens is None:
+            return
+        self.tokens.level = min(self.tokens.capacity, self.tokens.level + ticket.tokens - ticket.actual_tokens)
+
+    def penalize(self, retry_after: Optional[float]):
+        """El proveedor respondió 429: nadie pasa hasta que venza el bloqueo"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + (retry_after or ADMISSION_PENALTY_SECONDS))
+        self.requests.level = min(self.requests.level, 0)
+
+    def status(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        self._refill(now)
+        return {
+            "rpm_available": round(self.requests.level, 1),
+            "tpm_available": round(self.tokens.level),
+            "queued": {p: sum(1 for entry in self._queue if entry[0] == i and not entry[2]["future"].done())
+                       for i, p in enumerate(PRIORITIES)},
+            "blocked_for": round(max(0.0, self.blocked_until - now), 1),
+        }
+
+
+_limiters: Dict[str, ProviderLimiter] = {}
+
+
+def get_limiter(provider: str) -> ProviderLimiter:
+    if provider not in _limiters:
+        # Se lee al crear el limiter: prefork_server.py fija WEB_CONCURRENCY
+        # después de importar este módulo
+        limits = PROVIDER_LIMITS[provider]
+        workers = admission_workers()
+        _limiters[provider] = ProviderLimiter(provider, limits["rpm"] / workers, limits["tpm"] / workers)
+    return _limiters[provider]
+
+
+def admission_status() -> Dict[str, Any]:
+    """Estado de los presupuestos y colas (para /metrics o depuración)"""
+    return {
+        "enabled": ADMISSION_CONTROL,
+        "workers": admission_workers(),
+        "providers": {name: get_limiter(name).status() for name in PROVIDER_LIMITS},
+    }
+
+
+@asynccontextmanager
+async def admission(provider: str, estimated_tokens: float):
+    """
+    Espera turno para una llamada al proveedor
+
+        async with admission("groq", tokens) as ticket:
+            response = ...
+            ticket.used(response.usage.total_tokens)
+
+    Raises:
+        AdmissionRejected: la espera superaría el máximo de la prioridad actual
+    """
+    if not ADMISSION_CONTROL:
+        yield Ticket(None, estimated_tokens)
+        return
+
+    limiter = get_limiter(provider)
+    ticket = await limiter.acquire(estimated_tokens, current_priority())
+    try:
+        yield ticket
+    except Exception as e:
+        if is_rate_limit_error(e):
+            # El proveedor no procesó la llamada: solo se bloquea el presupuesto
+            ticket.used(0)
+            limiter.penalize(_retry_after_from(e))
+        raise
+    finally:
+        limiter.settle(ticket)
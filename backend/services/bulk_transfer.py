@@ -0,0 +1,259 @@
+"""
+Exportación e importación masiva en NDJSON (brand_manuals,
+brand_manual_embeddings y generated_content)
+
+Sirve para migrar entre entornos o sembrar staging sin cargar tablas
+completas en memoria ni volver a generar embeddings:
+
+- Exportar recorre cada tabla por páginas (keyset sobre id, costo
+  constante por página) y emite una línea JSON por fila. Los vectores
+  viajan en la línea ("f32:<base64>" por defecto, sin pérdida), junto con
+  content_hash, así que al importar los chunks se reutilizan tal cual.
+- Importar lee línea a línea y guarda en lotes de BULK_IMPORT_BATCH_SIZE
+  filas (upsert por id). Las tablas se exportan en orden de dependencias
+  (manuales antes que sus embeddings y contenidos) y cada lote se vacía al
+  cambiar de tabla, así que las claves foráneas se respetan.
+
+Formato: una primera línea {"header": {...}} y luego {"table": ..., "row": {...}}.
+Los mismos generadores usan GET /export/ndjson, POST /import/ndjson y
+scripts/bulk_transfer.py.
+"""
+import json
+import os
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from services.embedding_spaces import ACTIVE_SPACE, EMBEDDINGS_VERSIONED
+from services.metrics_service import register_counter, inc_counter, stage_timer
+from services.vector_codec import decode_vector, embedding_column, encode_vector, parse_vector
+
+# Filas por página al exportar
+BULK_EXPORT_PAGE_SIZE = int(os.getenv("BULK_EXPORT_PAGE_SIZE", "500"))
+# Filas por insert al importar
+BULK_IMPORT_BATCH_SIZE = int(os.getenv("BULK_IMPORT_BATCH_SIZE", "200"))
+# Tamaño máximo de una línea al importar (un manual completo ocupa decenas de KB)
+BULK_IMPORT_MAX_LINE_BYTES = int(os.getenv("BULK_IMPORT_MAX_LINE_BYTES", str(8 * 1024 * 1024)))
+
+FORMAT_VERSION = 1
+
+# Orden de dependencias: primero los manuales
+EXPORT_TABLES = ("brand_manuals", "brand_manual_embeddings", "generated_content")
+# Columna que filtra cada tabla por manual
+MANUAL_COLUMN = {
+    "brand_manuals": "id",
+    "brand_manual_embeddings": "manual_id",
+    "generated_content": "manual_id",
+}
+VECTOR_FORMATS = ("json", "f32", "f16")
+IMPORT_MODES = ("upsert", "skip")
+
+register_counter("bulk_rows_total", "Filas exportadas / importadas en NDJSON")
+
+
+def _validate_tables(tables: Optional[Iterable[str]]) -> List[str]:
+    tables = list(tables or EXPORT_TABLES)
+    unknown = [t for t in tables if t not in EXPORT_TABLES]
+    if unknown:
+        raise ValueError(f"Tablas desconocidas: {unknown}. Use: {EXPORT_TABLES}")
+    # Siempre en orden de dependencias
+    return [t for t in EXPORT_TABLES if t in tables]
+
+
+def iter_table_rows(supabase_client, table: str, manual_ids: Optional[List[str]] = None,
+                    page_size: int = None, columns: str = "*",
+                    scope: Optional[Callable[[Any], Any]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Recorre una tabla por páginas ordenadas por id (keyset: cada página
+    pide id > último id visto, sin OFFSET)
+
+    scope recibe la consulta de cada página y le agrega filtros (p. ej.
+    scope_to_space)
+    """
+    page_size = page_size or BULK_EXPORT_PAGE_SIZE
+    last_id = None
+    while True:
+        query = supabase_client.table(table).select(columns)
+        if scope is not None:
+            query = scope(query)
+        if manual_ids:
+            query = query.in_(MANUAL_COLUMN[table], manual_ids)
+        if last_id is not None:
+            query = query.gt("id", last_id)
+        with stage_timer("db_fetch", table=table):
+            rows = query.order("id").limit(page_size).execute().data or []
+
+        yield from rows
+
+        if len(rows) < page_size:
+            return
+        last_id = rows[-1]["id"]
+
+
+def _export_embedding(row: Dict[str, Any], vector_format: str) -> Dict[str, Any]:
+    row = {k: v for k, v in row.items() if k != "embedding_b64"}
+    vector = parse_vector(row.get("embedding"))
+    if vector is not None:
+        row["embedding"] = vector.tolist() if vector_format == "json" else encode_vector(vector, vector_format)
+    return row
+
+
+def export_ndjson(supabase_client, tables: Optional[Iterable[str]] = None,
+                  manual_ids: Optional[List[str]] = None, vector_format: str = "f32",
+                  page_size: int = None) -> Iterator[bytes]:
+    """
+    Genera el export línea a línea (memoria constante: una página por tabla)
+
+    Args:
+        tables: subconjunto de EXPORT_TABLES (por defecto todas)
+        manual_ids: solo estos manuales y sus filas relacionadas
+        vector_format: json (lista de floats), f32 (sin pérdida) o f16
+    """
+    tables = _validate_tables(tables)
+    if vector_format not in VECTOR_FORMATS:
+        raise ValueError(f"Formato de vector desconocido: {vector_format}. Use: {VECTOR_FORMATS}")
+
+    header = {
+        "version": FORMAT_VERSION,
+        "tables": tables,
+        "manual_ids": manual_ids,
+        "vector_format": vector_format,
+        "exported_at": time.time(),
+    }
+    yield _line({"header": header})
+
+    for table in tables:
+        for row in iter_table_rows(supabase_client, table, manual_ids, page_size):
+            if table == "brand_manual_embeddings":
+                row = _export_embedding(row, vector_format)
+            inc_counter("bulk_rows_total", labels={"table": table, "op": "export"})
+            yield _line({"table": table, "row": row})
+
+
+def _line(data: Dict[str, Any]) -> bytes:
+    return (json.dumps(data, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+class NdjsonImporter:
+    """
+    Importa líneas NDJSON en lotes
+
+        importer = NdjsonImporter(client)
+        for line in lines:
+            importer.add_line(line)
+        summary = importer.finish()
+
+    Args:
+        mode: upsert (reemplaza filas con el mismo id) o skip (las conserva)
+        on_flush: callback(table, filas guardadas) después de cada lote
+    """
+
+    def __init__(self, supabase_client, batch_size: int = None, mode: str = "upsert",
+                 on_flush: Optional[Callable[[str, List[Dict[str, Any]]], None]] = None):
+        if mode not in IMPORT_MODES:
+            raise ValueError(f"Modo de importación desconocido: {mode}. Use: {IMPORT_MODES}")
+        self.client = supabase_client
+        self.batch_size = batch_size or BULK_IMPORT_BATCH_SIZE
+        self.mode = mode
+        self.on_flush = on_flush
+        self.header: Optional[Dict[str, Any]] = None
+        self._table: Optional[str] = None
+        self._batch: List[Dict[str, Any]] = []
+        self.counts = {table: 0 for table in EXPORT_TABLES}
+        self.skipped = {"other_space": 0}
+        self.lines = 0
+
+    def add_line(self, line: Any):
+        """Procesa una línea (str o bytes); las líneas vacías se ignoran"""
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        line = line.strip()
+        if not line:
+            return
+        self.lines += 1
+        try:
+            data = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Línea {self.lines}: JSON inválido ({str(e)})")
+
+        if "header" in data:
+            version = data["header"].get("version")
+            if version != FORMAT_VERSION:
+                raise ValueError(f"Versión de export no soportada: {version}")
+            self.header = data["header"]
+            return
+
+        table = data.get("table")
+        row = data.get("row")
+        if table not in EXPORT_TABLES or not isinstance(row, dict):
+            raise ValueError(f"Línea {self.lines}: se esperaba {{\"table\", \"row\"}} de {EXPORT_TABLES}")
+
+        if table == "brand_manual_embeddings":
+            row = self._import_embedding(row)
+            if row is None:
+                return
+
+        if table != self._table:
+            # Vaciar la tabla anterior antes de pasar a la que depende de ella
+            self.flush()
+            self._table = table
+        self._batch.append(row)
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def _import_embedding(self, row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Adapta el vector y el espacio a la configuración de este entorno"""
+        row = dict(row)
+        space = row.pop("embedding_space", None)
+        if EMBEDDINGS_VERSIONED:
+            if space:
+                row["embedding_space"] = space
+        elif space and space != ACTIVE_SPACE:
+            # Sin versionado solo existe el espacio activo
+            self.skipped["other_space"] += 1
+            return None
+
+        value = row.pop("embedding", None)
+        if value is None:
+            return row
+        if isinstance(value, str) and ":" in value:
+            vector = decode_vector(value)
+        else:
+            vector = parse_vector(value)
+        # Lista de floats o base64 según VECTOR_TRANSPORT de este entorno
+        row.update(embedding_column(vector))
+        return row
+
+    def flush(self):
+        if not self._batch:
+            return
+        table, rows = self._table, self._batch
+        self._batch = []
+        with stage_timer("insert", table=table):
+            result = self.client.table(table).upsert(
+                rows, on_conflict="id", ignore_duplicates=self.mode == "skip"
+            ).execute()
+        # Con skip PostgREST solo retorna las filas insertadas
+        saved = result.data if result.data is not None else rows
+        self.counts[table] += len(saved)
+        inc_counter("bulk_rows_total", value=len(saved), labels={"table": table, "op": "import"})
+        if self.on_flush:
+            self.on_flush(table, saved)
+
+    def finish(self) -> Dict[str, Any]:
+        self.flush()
+        return {
+            "lines": self.lines,
+            "rows": dict(self.counts),
+            "skipped": dict(self.skipped),
+            "mode": self.mode,
+            "source": self.header,
+        }
+
+
+def import_ndjson(lines: Iterable[Any], supabase_client, batch_size: int = None,
+                  mode: str = "upsert", on_flush=None) -> Dict[str, Any]:
+    """Importa un iterable de líneas NDJSON (p. ej. un archivo abierto)"""
+    importer = NdjsonImporter(supabase_client, batch_size, mode, on_flush)
+    for line in lines:
+        importer.add_line(line)
+    return importer.finish()
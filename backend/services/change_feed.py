@@ -0,0 +1,288 @@
+"""
+Feed de cambios de brand_manuals y generated_content
+
+Los endpoints publican eventos compactos (create / update / delete con los
+campos de resumen de la fila) y los dashboards los reciben por SSE en
+GET /changes/stream, aplicando deltas en lugar de volver a descargar la
+lista completa después de cada acción.
+
+Cada evento tiene un cursor. El cliente lo reenvía al reconectarse
+(Last-Event-ID o ?cursor=) y recibe solo lo que se perdió; si el cursor ya
+no está disponible recibe un evento "reset" y debe recargar la lista.
+
+Backends (CHANGE_FEED_BACKEND):
+- memory: buffer en memoria del proceso (un solo worker). El cursor
+  incluye un identificador del proceso, así que tras un reinicio el
+  cliente recibe "reset".
+- table:  tabla change_events en Supabase (migración 4 de
+  docs/SUPABASE_RAG_SETUP.sql). Un poller por proceso lee los eventos
+  nuevos y los reparte a sus suscriptores, así que funciona con varios
+  workers y los cursores sobreviven reinicios.
+"""
+import asyncio
+import os
+import time
+import uuid
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from services.metrics_service import register_counter, inc_counter
+
+CHANGE_FEED_BACKEND = os.getenv("CHANGE_FEED_BACKEND", "memory").lower()
+# Eventos que se conservan en memoria para reanudar
+CHANGE_FEED_BUFFER = int(os.getenv("CHANGE_FEED_BUFFER", "1000"))
+# Intervalo del poller del backend table (segundos)
+CHANGE_FEED_POLL_INTERVAL = float(os.getenv("CHANGE_FEED_POLL_INTERVAL", "1.0"))
+# Intervalo de los comentarios keep-alive del stream SSE (segundos)
+CHANGE_FEED_HEARTBEAT = float(os.getenv("CHANGE_FEED_HEARTBEAT", "15"))
+
+# Campos que viajan en los eventos (sin full_manual ni textos largos)
+SUMMARY_FIELDS = {
+    "brand_manuals": ("id", "name", "description", "product_type", "tone",
+                      "target_audience", "created_at", "updated_at"),
+    "generated_content": ("id", "manual_id", "content_type", "status", "created_at"),
+}
+
+register_counter("change_events_total", "Eventos publicados en el feed de cambios")
+
+
+def summarize(table: str, row: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Campos de resumen de una fila para el evento"""
+    if row is None:
+        return None
+    data = {field: row.get(field) for field in SUMMARY_FIELDS.get(table, ()) if field in row}
+    if table == "brand_manuals" and "full_manual" in row:
+        data["has_full_manual"] = bool(row["full_manual"])
+    return data
+
+
+class ChangeFeed:
+    """
+    Buffer de eventos con cursor y notificación a los suscriptores
+    """
+
+    def __init__(self, backend: str = CHANGE_FEED_BACKEND, buffer_size: int = CHANGE_FEED_BUFFER):
+        self.backend = backend
+        # En memoria el cursor lleva el id del proceso para detectar reinicios
+        self.epoch = uuid.uuid4().hex[:8] if backend == "memory" else "db"
+        self._events: deque = deque(maxlen=buffer_size)
+        self._seq = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._poll_now: Optional[asyncio.Event] = None
+        self._poller: Optional[asyncio.Task] = None
+        self._supabase = None
+        self._listeners: List[Callable[[Dict[str, Any]], None]] = []
+        # Backend table: secuencia inicial ya leída de la tabla
+        self._seq_loaded = False
+        # Backend table: eventos publicados (y ya despachados) por este proceso
+        self._local_seqs: set = set()
+
+    # ---------- cursores ----------
+
+    def current_cursor(self) -> str:
+        """Cursor de "ahora": los eventos posteriores aún no ocurrieron"""
+        return f"{self.epoch}-{self._seq}"
+
+    def _parse_cursor(self, cursor: Optional[str]) -> Optional[int]:
+        """Secuencia del cursor, o None si es de otro proceso o inválido"""
+        if not cursor:
+            return None
+        epoch, _, seq = cursor.rpartition("-")
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def add_listener(self, callback: Callable[[Dict[str, Any]], None]):
+        """
+        Registra una función que recibe cada evento en este proceso (por
+        ejemplo para invalidar cachés), una sola vez por evento. Con el
+        backend table recibe también los eventos de otros workers mientras
+        el poller está activo (ver start).
+        """
+        if callback not in self._listeners:
+            self._listeners.append(callback)
+
+    def _dispatch(self, event: Dict[str, Any]):
+        for callback in self._listeners:
+            try:
+                callback(event)
+            except Exception as e:
+                print(f"Warning: error en listener del feed de cambios: {e}")
+
+    def _notify(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+        self._wakeup = asyncio.Event()
+
+    # ---------- publicación ----------
+
+    def publish(self, table: str, op: str, row_id: Any, row: Optional[Dict[str, Any]] = None,
+                supabase_client=None):
+        """
+        Publica un cambio (op: create, update o delete)
+
+        Con el backend table el evento se inserta en change_events y llega a
+        los suscriptores a través del poller (en el orden de la tabla).
+        """
+        event = {"table": table, "op": op, "row_id": str(row_id), "data": summarize(table, row)}
+        inc_counter("change_events_total", labels={"table": table, "op": op})
+        # Los listeners locales se enteran de inmediato en ambos backends
+        self._dispatch(event)
+
+        if self.backend == "table":
+            try:
+                result = (supabase_client or self._supabase).table("change_events").insert(event).execute()
+                # El poller no vuelve a despachar lo que ya recibieron los listeners
+                self._local_seqs.update(row["seq"] for row in result.data or [] if "seq" in row)
+                if self._poll_now is not None:
+                    self._poll_now.set()
+            except Exception as e:
+                print(f"Warning: no se pudo publicar el evento de cambio: {e}")
+            return
+
+        self._seq += 1
+        self._events.append({**event, "seq": self._seq, "ts": time.time()})
+        self._notify()
+
+    # ---------- lectura ----------
+
+    def _pending(self, after: int, topics: Optional[set]) -> List[Dict[str, Any]]:
+        return [e for e in self._events if e["seq"] > after and (not topics or e["table"] in topics)]
+
+    def _can_resume(self, after: int) -> bool:
+        oldest = self._events[0]["seq"] if self._events else self._seq + 1
+        return after >= oldest - 1
+
+    def _replay_from_table(self, after: int, topics: Optional[set]) -> Optional[List[Dict[str, Any]]]:
+        """Eventos más viejos que el buffer, leídos de change_events (None si son demasiados)"""
+        limit = self._events.maxlen
+        query = self._supabase.table("change_events").select("*").gt("seq", after)
+        if topics:
+            query = query.in_("table", sorted(topics))
+        rows = query.order("seq").limit(limit + 1).execute().data or []
+        return None if len(rows) > limit else rows
+
+    async def _poll_loop(self):
+        """Backend table: trae los eventos nuevos de la tabla y despierta a los suscriptores"""
+        while True:
+            try:
+                # El cliente de Supabase es síncrono: la consulta corre en un hilo
+                page = await asyncio.to_thread(
+                    self._supabase.table("change_events")
+                    .select("*")
+                    .gt("seq", self._seq)
+                    .order("seq")
+                    .limit(500)
+                    .execute
+                )
+                rows = page.data or []
+                for row in rows:
+                    self._events.append(row)
+                    self._seq = row["seq"]
+                    if row["seq"] in self._local_seqs:
+                        self._local_seqs.discard(row["seq"])
+                    else:
+                        self._dispatch(row)
+                if rows:
+                    self._notify()
+                    continue
+            except Exception as e:
+                print(f"Warning: error leyendo change_events: {e}")
+            try:
+                await asyncio.wait_for(self._poll_now.wait(), timeout=CHANGE_FEED_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._poll_now.clear()
+
+    def _load_seq(self, supabase_client):
+        """
+        Backend table: arranca desde el último evento existente (los
+        anteriores se sirven con _replay_from_table), así que los cursores
+        entregados nunca son "db-0"
+        """
+        if self._seq_loaded:
+            return
+        self._supabase = supabase_client
+        last = supabase_client.table("change_events").select("seq").order("seq", desc=True).limit(1).execute()
+        self._seq = max(self._seq, last.data[0]["seq"] if last.data else 0)
+        # Lo publicado antes de esta lectura ya no pasa por el poller
+        self._local_seqs = {seq for seq in self._local_seqs if seq > self._seq}
+        self._seq_loaded = True
+
+    def _ensure_poller(self, supabase_client):
+        """Lanza el poller (requiere la secuencia ya cargada con _load_seq)"""
+        if self.backend != "table" or (self._poller is not None and not self._poller.done()):
+            return
+        if self._poll_now is None:
+            self._poll_now = asyncio.Event()
+        self._poller = asyncio.create_task(self._poll_loop())
+
+    async def start(self, supabase_client):
+        """
+        Al arrancar la app: con el backend table lee la secuencia actual
+        (fuera del event loop), así los cursores son válidos desde el
+        inicio. El poller arranca ya si hay listeners (deben enterarse de
+        los cambios de otros workers); si no, con la primera suscripción SSE.
+        """
+        if self.backend != "table":
+            return
+        await asyncio.to_thread(self._load_seq, supabase_client)
+        if self._listeners:
+            self._ensure_poller(supabase_client)
+
+    async def subscribe(self, cursor: Optional[str], topics: Optional[set] = None,
+                        supabase_client=None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Genera los eventos posteriores al cursor y luego los nuevos a medida
+        que llegan. Un evento {"op": "reset"} indica que el cliente debe
+        recargar su estado completo. Cada HEARTBEAT sin eventos genera None.
+        """
+        if self.backend == "table" and not self._seq_loaded:
+            await asyncio.to_thread(self._load_seq, supabase_client)
+        self._ensure_poller(supabase_client)
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+
+        after = self._parse_cursor(cursor)
+        if after is None or after > self._seq:
+            if cursor:
+                yield {"op": "reset", "cursor": self.current_cursor()}
+            after = self._seq
+        elif not self._can_resume(after):
+            replay = None
+            if self.backend == "table":
+                replay = await asyncio.to_thread(self._replay_from_table, after, topics)
+            if replay is None:
+                yield {"op": "reset", "cursor": self.current_cursor()}
+                after = self._seq
+            else:
+                for event in replay:
+                    after = event["seq"]
+                    yield {**event, "cursor": f"{self.epoch}-{after}"}
+
+        while True:
+            wakeup = self._wakeup
+            for event in self._pending(after, topics):
+                yield {**event, "cursor": f"{self.epoch}-{event['seq']}"}
+            # Avanzar aunque los eventos fueran de otros tópicos
+            after = max(after, self._seq)
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout=CHANGE_FEED_HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield None
+
+
+_feed: Optional[ChangeFeed] = None
+
+
+def get_change_feed() -> ChangeFeed:
+    global _feed
+    if _feed is None:
+        _feed = ChangeFeed()
+    return _feed
+
+
+def publish_change(table: str, op: str, row_id: Any, row: Optional[Dict[str, Any]] = None,
+                   supabase_client=None):
+    """Atajo para publicar desde los endpoints"""
+    get_change_feed().publish(table, op, row_id, row, supabase_client)
@@ -0,0 +1,321 @@
+"""
+Chunking declarativo del manual de marca
+
+El esquema MANUAL_CHUNK_SCHEMA describe cómo se parte cada sección del JSON
+del manual en sub-secciones. Cada sub-sección se convierte en uno o más
+chunks que respetan un presupuesto de tokens (MiniLM trunca a 256), y cada
+chunk guarda la sección padre para poder reensamblar el contexto.
+
+El resultado es determinista: el mismo manual produce los mismos chunks en
+el mismo orden y con el mismo content_hash, lo que permite reutilizar los
+embeddings de los chunks que no cambiaron.
+"""
+import hashlib
+import json
+import os
+import re
+from typing import Any, Callable, Dict, List, Optional
+
+# Presupuesto por chunk (tokens WordPiece). Deja margen bajo el límite de
+# 256 del modelo para los tokens especiales y el encabezado.
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "200"))
+
+
+def _tecnicismos(value: Any) -> str:
+    if isinstance(value, str):
+        value = value.strip().lower() in ("true", "sí", "si", "permitido")
+    return "Permitido" if value else "Prohibido"
+
+
+# Esquema del manual: sección -> título y grupos de campos (sub-secciones).
+# Los campos usan rutas con puntos dentro de la sección; el formato se
+# infiere del tipo de valor salvo que se indique un formatter.
+MANUAL_CHUNK_SCHEMA: List[Dict[str, Any]] = [
+    {
+        "section": "identidad_marca",
+        "title": "IDENTIDAD DE MARCA",
+        "groups": [
+            {"name": "proposito", "fields": [("proposito", "Propósito"), ("diferenciador", "Diferenciador")]},
+            {"name": "personalidad", "fields": [("valores", "Valores"), ("personalidad", "Personalidad")]},
+        ],
+    },
+    {
+        "section": "tono_comunicacion",
+        "title": "TONO DE COMUNICACIÓN",
+        "groups": [
+            {"name": "estilo", "fields": [
+                ("descripcion_general", "Descripción"),
+                ("estilo_redaccion", "Estilo"),
+                ("uso_tecnicismos", "Uso de tecnicismos", _tecnicismos),
+            ]},
+            {"name": "palabras_permitidas", "fields": [("palabras_permitidas", "Palabras permitidas")]},
+            {"name": "palabras_prohibidas", "fields": [("palabras_prohibidas", "Palabras prohibidas")]},
+            {"name": "ejemplos", "fields": [("ejemplos_buenos", "Ejemplos buenos"), ("ejemplos_malos", "Ejemplos malos")]},
+        ],
+    },
+    {
+        "section": "elementos_visuales",
+        "title": "ELEMENTOS VISUALES",
+        "groups": [
+            {"name": "colores", "fields": [
+                ("colores_principales", "Colores principales"),
+                ("colores_secundarios", "Colores secundarios"),
+            ]},
+            {"name": "tipografia", "fields": [
+                ("tipografia_principal", "Tipografía principal"),
+                ("tipografia_secundaria", "Tipografía secundaria"),
+            ]},
+            {"name": "uso_logo", "fields": [
+                ("uso_logo.tamano_minimo", "Tamaño mínimo del logo"),
+                ("uso_logo.espaciado_minimo", "Espaciado mínimo del logo"),
+                ("uso_logo.espaciado", "Espaciado del logo"),
+                ("uso_logo.posicion_permitida", "Posiciones permitidas del logo"),
+                ("uso_logo.fondos_permitidos", "Fondos permitidos"),
+                ("uso_logo.fondos_prohibidos", "Fondos prohibidos"),
+                ("uso_logo.elementos_adicionales", "Elementos adicionales del logo"),
+            ]},
+            {"name": "estilo_fotografico", "fields": [
+                ("estilo_fotografico", "Estilo fotográfico"),
+                ("composicion_visual", "Composición visual"),
+                ("iconografia", "Iconografía"),
+            ]},
+            {"name": "elementos", "fields": [
+                ("elementos_obligatorios", "Elementos obligatorios"),
+                ("elementos_prohibidos", "Elementos prohibidos"),
+            ]},
+        ],
+    },
+    {
+        "section": "publico_objetivo",
+        "title": "PÚBLICO OBJETIVO",
+        "groups": [
+            {"name": "demografia", "fields": [
+                ("demografia.edad", "Edad"),
+                ("demografia.genero", "Género"),
+                ("demografia.ubicacion", "Ubicación"),
+                ("demografia.nivel_socioeconomico", "Nivel socioeconómico"),
+            ]},
+            {"name": "psicografia", "fields": [
+                ("psicografia.intereses", "Intereses"),
+                ("psicografia.valores", "Valores"),
+                ("psicografia.estilo_vida", "Estilo de vida"),
+            ]},
+            {"name": "motivaciones", "fields": [("pain_points", "Pain Points"), ("aspiraciones", "Aspiraciones")]},
+        ],
+    },
+    {
+        "section": "directrices_contenido",
+        "title": "DIRECTRICES DE CONTENIDO",
+        "groups": [
+            {"name": "mensajes", "fields": [
+                ("mensajes_clave", "Mensajes clave"),
+                ("palabras_clave_seo", "Palabras clave SEO"),
+            ]},
+            {"name": "redes_sociales", "fields": [("tipos_contenido.redes_sociales", "Redes sociales")]},
+            {"name": "blog_articulos", "fields": [("tipos_contenido.blog_articulos", "Blog y artículos")]},
+            {"name": "email_marketing", "fields": [("tipos_contenido.email_marketing", "Email marketing")]},
+        ],
+    },
+    {
+        "section": "ejemplos_aplicacion",
+        "title": "EJEMPLOS DE APLICACIÓN",
+        "groups": [
+            {"name": "descripcion_producto", "fields": [
+                ("descripcion_producto_buena", "✅ Descripción de producto BUENA"),
+                ("descripcion_producto_mala", "❌ Descripción de producto MALA"),
+            ]},
+            {"name": "post_redes", "fields": [
+                ("post_redes_bueno", "✅ Post en redes sociales BUENO"),
+                ("post_redes_malo", "❌ Post en redes sociales MALO"),
+            ]},
+        ],
+    },
+]
+
+
+# ============================================
+# CONTEO DE TOKENS
+# ============================================
+
+_WORDPIECE_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimación barata de tokens WordPiece cuando no hay tokenizer local:
+    las palabras largas y con tildes se parten en varias piezas.
+    """
+    total = 0
+    for piece in _WORDPIECE_RE.findall(text):
+        total += 1 + len(piece) // 6
+    return total
+
+
+# ============================================
+# FORMATO DE CAMPOS
+# ============================================
+
+def _get_path(data: Dict[str, Any], path: str) -> Any:
+    value: Any = data
+    for key in path.split("."):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+
+def _format_value(value: Any) -> List[str]:
+    """Convierte un valor del manual en líneas de texto"""
+    if isinstance(value, list):
+        if all(not isinstance(v, (dict, list)) for v in value):
+            return [", ".join(str(v) for v in value)]
+        return ["- " + json.dumps(v, ensure_ascii=False, sort_keys=True) for v in value]
+    if isinstance(value, dict):
+        lines = []
+        for key in sorted(value):
+            sub = _format_value(value[key])
+            label = key.replace("_", " ")
+            if len(sub) == 1 and not isinstance(value[key], dict):
+                lines.append(f"- {label}: {sub[0]}")
+            else:
+                lines.append(f"- {label}:")
+                lines.extend("  " + line for line in sub)
+        return lines
+    if isinstance(value, bool):
+        return ["Sí" if value else "No"]
+    return [str(value)]
+
+
+def _format_field(label: str, value: Any, formatter: Optional[Callable] = None) -> List[str]:
+    if formatter is not None:
+        return [f"{label}: {formatter(value)}"]
+    lines = _format_value(value)
+    if len(lines) == 1 and not isinstance(value, dict):
+        return [f"{label}: {lines[0]}"]
+    return [f"{label}:"] + lines
+
+
+# ============================================
+# PARTICIÓN POR PRESUPUESTO
+# ============================================
+
+def _split_words(line: str, budget: int, count_tokens: Callable[[str], int]) -> List[str]:
+    """Parte una línea demasiado larga por palabras"""
+    pieces, current, used = [], [], 0
+    for word in line.split():
+        # WordPiece tokeniza palabra por palabra: el conteo es aditivo
+        tokens = count_tokens(word)
+        if current and used + tokens > budget:
+            pieces.append(" ".join(current))
+            current, used = [], 0
+        current.append(word)
+        used += tokens
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+
+def _pack_lines(header: str, lines: List[str], max_tokens: int,
+                count_tokens: Callable[[str], int]) -> List[str]:
+    """
+    Agrupa líneas en bloques que (con el encabezado) no superen max_tokens
+    """
+    budget = max(max_tokens - count_tokens(header), 16)
+
+    expanded = []
+    for line in lines:
+        tokens = count_tokens(line)
+        if tokens > budget:
+            expanded.extend((piece, count_tokens(piece)) for piece in _split_words(line, budget, count_tokens))
+        else:
+            expanded.append((line, tokens))
+
+    blocks, current, used = [], [], 0
+    for line, tokens in expanded:
+        if current and used + tokens > budget:
+            blocks.append(current)
+            current, used = [], 0
+        current.append(line)
+        used += tokens
+    if current:
+        blocks.append(current)
+
+    return [f"{header}\n" + "\n".join(block) for block in blocks]
+
+
+def content_hash(content: str) -> str:
+    """Hash estable del contenido de un chunk"""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()[:32]
+
+
+def chunk_manual(manual: Dict[str, Any],
+                 max_tokens: int = CHUNK_MAX_TOKENS,
+                 count_tokens: Callable[[str], int] = estimate_tokens,
+                 schema: List[Dict[str, Any]] = MANUAL_CHUNK_SCHEMA) -> List[Dict[str, Any]]:
+    """
+    Divide el manual en chunks según el esquema
+
+    Returns:
+        List[Dict]: chunks con section ("seccion.subseccion"), parent_section,
+        chunk_index, content y content_hash
+    """
+    chunks = []
+
+    for spec in schema:
+        section = spec["section"]
+        data = manual.get(section)
+        if not isinstance(data, dict):
+            continue
+
+        covered = set()
+
+        for group in spec["groups"]:
+            lines = []
+            for field in group["fields"]:
+                path, label = field[0], field[1]
+                formatter = field[2] if len(field) > 2 else None
+                covered.add(path)
+                value = _get_path(data, path)
+                if value in (None, "", [], {}):
+                    continue
+                lines.extend(_format_field(label, value, formatter))
+            _append_group(chunks, spec, group["name"], lines, max_tokens, count_tokens)
+
+        # Campos no descritos en el esquema: no se pierden, van a "otros"
+        extra = _uncovered_fields(data, covered)
+        if extra:
+            _append_group(chunks, spec, "otros", _format_value(extra), max_tokens, count_tokens)
+
+    return chunks
+
+
+def _uncovered_fields(data: Dict[str, Any], covered: set) -> Dict[str, Any]:
+    """Campos (hasta un nivel de anidación) que el esquema no menciona"""
+    extra = {}
+    for key in sorted(data):
+        if key in covered:
+            continue
+        prefix = key + "."
+        nested = {path[len(prefix):].split(".")[0] for path in covered if path.startswith(prefix)}
+        if nested and isinstance(data[key], dict):
+            for sub_key in sorted(data[key]):
+                if sub_key not in nested:
+                    extra[f"{key}.{sub_key}"] = data[key][sub_key]
+        elif not nested:
+            extra[key] = data[key]
+    return extra
+
+
+def _append_group(chunks: List[Dict[str, Any]], spec: Dict[str, Any], group_name: str,
+                  lines: List[str], max_tokens: int, count_tokens: Callable[[str], int]):
+    if not lines:
+        return
+    header = f"{spec['title']} > {group_name.replace('_', ' ').upper()}:"
+    for index, content in enumerate(_pack_lines(header, lines, max_tokens, count_tokens)):
+        chunks.append({
+            "section": f"{spec['section']}.{group_name}",
+            "parent_section": spec["section"],
+            "chunk_index": index,
+            "content": content,
+            "content_hash": content_hash(content),
+        })
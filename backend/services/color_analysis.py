@@ -0,0 +1,333 @@
+"""
+Análisis local y determinista de la paleta de colores de una imagen
+
+Extrae los colores dominantes de la imagen reducida (k-means en espacio
+Lab), los compara con los códigos HEX del manual usando ΔE CIEDE2000 y
+calcula un score de color reproducible en milisegundos, sin llamar a
+Gemini. El resultado se agrega al prompt de la auditoría y, si se
+configura, permite rechazar de inmediato imágenes que no usan la paleta.
+"""
+import re
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# Lado máximo de la imagen analizada (la paleta no necesita más resolución)
+COLOR_SAMPLE_SIDE = 64
+
+# Número de colores dominantes a extraer
+COLOR_CLUSTERS = 6
+KMEANS_ITERATIONS = 12
+
+# ΔE00 por debajo del cual un color se considera "de la paleta".
+# ~10 es una diferencia apreciable pero del mismo tono (la auditoría acepta
+# tonos similares, no el HEX exacto)
+MATCH_DELTA_E = 12.0
+
+# Peso mínimo de un cluster para contar como presencia de un color principal
+MIN_PRESENCE = 0.02
+
+# Peso de la categoría colores en el score de la auditoría
+COLOR_CATEGORY_POINTS = 25
+
+_HEX_RE = re.compile(r"#([0-9a-fA-F]{6}|[0-9a-fA-F]{3})\b|\b([0-9a-fA-F]{6})\b")
+
+
+# ============================================
+# PALETA DEL MANUAL
+# ============================================
+
+def _collect_strings(value: Any) -> List[str]:
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, dict):
+        return [s for v in value.values() for s in _collect_strings(v)]
+    if isinstance(value, (list, tuple)):
+        return [s for v in value for s in _collect_strings(v)]
+    return []
+
+
+def parse_hex_colors(value: Any) -> List[str]:
+    """
+    Extrae los códigos HEX (normalizados a "#RRGGBB") de un campo del manual,
+    sea texto, lista o dict. Los HEX sin '#' solo se aceptan si tienen algún
+    dígito, para no confundir palabras como "facade".
+    """
+    colors = []
+    for text in _collect_strings(value):
+        for match in _HEX_RE.finditer(text):
+            code = match.group(1) or match.group(2)
+            if match.group(2) and not any(c.isdigit() for c in code):
+                continue
+            if len(code) == 3:
+                code = "".join(c * 2 for c in code)
+            code = "#" + code.upper()
+            if code not in colors:
+                colors.append(code)
+    return colors
+
+
+def manual_palette(manual_content: dict) -> Dict[str, List[str]]:
+    """Colores principales y secundarios (HEX) del manual"""
+    visuals = manual_content.get("elementos_visuales", {}) or {}
+    primary = parse_hex_colors(visuals.get("colores_principales"))
+    secondary = [c for c in parse_hex_colors(visuals.get("colores_secundarios")) if c not in primary]
+    return {"primary": primary, "secondary": secondary}
+
+
+def hex_to_rgb(codes: List[str]) -> np.ndarray:
+    return np.array([[int(c[i:i + 2], 16) for i in (1, 3, 5)] for c in codes], dtype=np.float64).reshape(-1, 3)
+
+
+def rgb_to_hex(rgb: np.ndarray) -> str:
+    r, g, b = (int(round(v)) for v in np.clip(rgb, 0, 255))
+    return f"#{r:02X}{g:02X}{b:02X}"
+
+
+# ============================================
+# ESPACIO DE COLOR
+# ============================================
+
+# sRGB (D65) -> XYZ
+_RGB_TO_XYZ = np.array([
+    [0.4124564, 0.3575761, 0.1804375],
+    [0.2126729, 0.7151522, 0.0721750],
+    [0.0193339, 0.1191920, 0.9503041],
+])
+_WHITE_D65 = np.array([0.95047, 1.0, 1.08883])
+
+
+def rgb_to_lab(rgb: np.ndarray) -> np.ndarray:
+    """Convierte (N, 3) sRGB 0-255 a CIELAB (D65), vectorizado"""
+    c = np.asarray(rgb, dtype=np.float64) / 255.0
+    linear = np.where(c <= 0.04045, c / 12.92, ((c + 0.055) / 1.055) ** 2.4)
+    xyz = linear @ _RGB_TO_XYZ.T / _WHITE_D65
+
+    epsilon, kappa = 216 / 24389, 24389 / 27
+    f = np.where(xyz > epsilon, np.cbrt(xyz), (kappa * xyz + 16) / 116)
+
+    L = 116 * f[:, 1] - 16
+    a = 500 * (f[:, 0] - f[:, 1])
+    b = 200 * (f[:, 1] - f[:, 2])
+    return np.stack([L, a, b], axis=1)
+
+
+def lab_to_rgb(lab: np.ndarray) -> np.ndarray:
+    """Inversa de rgb_to_lab (para reportar los colores dominantes en HEX)"""
+    lab = np.asarray(lab, dtype=np.float64)
+    fy = (lab[:, 0] + 16) / 116
+    fx = fy + lab[:, 1] / 500
+    fz = fy - lab[:, 2] / 200
+    f = np.stack([fx, fy, fz], axis=1)
+
+    epsilon, kappa = 216 / 24389, 24389 / 27
+    xyz = np.where(f ** 3 > epsilon, f ** 3, (116 * f - 16) / kappa) * _WHITE_D65
+    linear = np.clip(xyz @ np.linalg.inv(_RGB_TO_XYZ).T, 0, 1)
+    c = np.where(linear <= 0.0031308, 12.92 * linear, 1.055 * linear ** (1 / 2.4) - 0.055)
+    return c * 255
+
+
+def delta_e_2000(lab1: np.ndarray, lab2: np.ndarray) -> np.ndarray:
+    """
+    ΔE CIEDE2000 entre todos los pares: (N, 3) x (M, 3) -> (N, M)
+    """
+    L1, a1, b1 = (lab1[:, None, i] for i in range(3))
+    L2, a2, b2 = (lab2[None, :, i] for i in range(3))
+
+    C1 = np.hypot(a1, b1)
+    C2 = np.hypot(a2, b2)
+    C_mean7 = ((C1 + C2) / 2) ** 7
+    G = 0.5 * (1 - np.sqrt(C_mean7 / (C_mean7 + 25 ** 7)))
+
+    a1p, a2p = (1 + G) * a1, (1 + G) * a2
+    C1p, C2p = np.hypot(a1p, b1), np.hypot(a2p, b2)
+    h1p = np.degrees(np.arctan2(b1, a1p)) % 360
+    h2p = np.degrees(np.arctan2(b2, a2p)) % 360
+
+    dLp = L2 - L1
+    dCp = C2p - C1p
+    dhp = h2p - h1p
+    dhp = np.where(dhp > 180, dhp - 360, np.where(dhp < -180, dhp + 360, dhp))
+    dhp = np.where(C1p * C2p == 0, 0, dhp)
+    dHp = 2 * np.sqrt(C1p * C2p) * np.sin(np.radians(dhp / 2))
+
+    Lp_mean = (L1 + L2) / 2
+    Cp_mean = (C1p + C2p) / 2
+    h_sum = h1p + h2p
+    hp_mean = np.where(
+        C1p * C2p == 0, h_sum,
+        np.where(np.abs(h1p - h2p) <= 180, h_sum / 2,
+                 np.where(h_sum < 360, (h_sum + 360) / 2, (h_sum - 360) / 2))
+    )
+
+    T = (1 - 0.17 * np.cos(np.radians(hp_mean - 30))
+         + 0.24 * np.cos(np.radians(2 * hp_mean))
+         + 0.32 * np.cos(np.radians(3 * hp_mean + 6))
+         - 0.20 * np.cos(np.radians(4 * hp_mean - 63)))
+    d_theta = 30 * np.exp(-(((hp_mean - 275) / 25) ** 2))
+    Cp_mean7 = Cp_mean ** 7
+    R_C = 2 * np.sqrt(Cp_mean7 / (Cp_mean7 + 25 ** 7))
+    S_L = 1 + 0.015 * (Lp_mean - 50) ** 2 / np.sqrt(20 + (Lp_mean - 50) ** 2)
+    S_C = 1 + 0.045 * Cp_mean
+    S_H = 1 + 0.015 * Cp_mean * T
+    R_T = -np.sin(np.radians(2 * d_theta)) * R_C
+
+    return np.sqrt(
+        (dLp / S_L) ** 2 + (dCp / S_C) ** 2 + (dHp / S_H) ** 2
+        + R_T * (dCp / S_C) * (dHp / S_H)
+    )
+
+
+# ============================================
+# COLORES DOMINANTES
+# ============================================
+
+def dominant_colors(pixels_lab: np.ndarray, k: int = COLOR_CLUSTERS,
+                    iterations: int = KMEANS_ITERATIONS) -> Dict[str, np.ndarray]:
+    """
+    k-means determinista en Lab
+
+    Los centros iniciales son los k bins más poblados de un histograma
+    grueso (8x8x8) del espacio Lab, así el resultado no depende de semillas.
+
+    Returns:
+        dict: centers (k, 3) en Lab y weights (k,) con la fracción de píxeles
+    """
+    # Histograma grueso para la inicialización
+    lo = np.array([0.0, -128.0, -128.0])
+    span = np.array([100.0, 256.0, 256.0])
+    bins = np.clip(((pixels_lab - lo) / span * 8).astype(np.int64), 0, 7)
+    bin_ids = bins[:, 0] * 64 + bins[:, 1] * 8 + bins[:, 2]
+    counts = np.bincount(bin_ids, minlength=512)
+    top_bins = np.argsort(-counts, kind="stable")[:k]
+    top_bins = top_bins[counts[top_bins] > 0]
+
+    centers = np.stack([pixels_lab[bin_ids == b].mean(axis=0) for b in top_bins])
+
+    for _ in range(iterations):
+        distances = ((pixels_lab[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+        labels = distances.argmin(axis=1)
+        new_centers = np.array([
+            pixels_lab[labels == i].mean(axis=0) if np.any(labels == i) else centers[i]
+            for i in range(len(centers))
+        ])
+        if np.allclose(new_centers, centers, atol=1e-3):
+            break
+        centers = new_centers
+
+    distances = ((pixels_lab[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+    weights = np.bincount(distances.argmin(axis=1), minlength=len(centers)) / len(pixels_lab)
+
+    order = np.argsort(-weights, kind="stable")
+    keep = weights[order] > 0
+    return {"centers": centers[order][keep], "weights": weights[order][keep]}
+
+
+def image_pixels(image, max_side: int = COLOR_SAMPLE_SIDE) -> np.ndarray:
+    """Reduce una imagen PIL y retorna sus píxeles (N, 3) en RGB"""
+    small = image.convert("RGB")
+    small.thumbnail((max_side, max_side))
+    return np.asarray(small, dtype=np.uint8).reshape(-1, 3)
+
+
+# ============================================
+# SCORE DE COLOR
+# ============================================
+
+def score_palette(pixels_rgb: np.ndarray, palette: Dict[str, List[str]],
+                  match_delta_e: float = MATCH_DELTA_E,
+                  dominant: Optional[Dict[str, np.ndarray]] = None) -> Optional[Dict[str, Any]]:
+    """
+    Compara los colores dominantes de la imagen con la paleta del manual
+
+    dominant permite reutilizar el k-means de la imagen (ver
+    image_dominant_colors) al comparar contra varios manuales.
+
+    El score (0-100) combina:
+    - 60%: fracción de colores principales presentes (algún cluster con
+      peso >= MIN_PRESENCE a menos de match_delta_e)
+    - 40%: fracción de la imagen cubierta por colores de la paleta
+
+    Returns:
+        dict con score, category_points (sobre 25) y el detalle, o None si
+        el manual no define colores en HEX
+    """
+    codes = palette["primary"] + palette["secondary"]
+    if not codes:
+        return None
+
+    start = time.perf_counter()
+    if dominant is None:
+        dominant = dominant_colors(rgb_to_lab(pixels_rgb))
+    centers, weights = dominant["centers"], dominant["weights"]
+
+    palette_lab = rgb_to_lab(hex_to_rgb(codes))
+    delta = delta_e_2000(centers, palette_lab)  # (clusters, colores del manual)
+
+    nearest = delta.argmin(axis=1)
+    nearest_delta = delta[np.arange(len(centers)), nearest]
+    coverage = float(weights[nearest_delta <= match_delta_e].sum())
+
+    n_primary = len(palette["primary"])
+    present = weights >= MIN_PRESENCE
+    primary_matched, primary_missing = [], []
+    for j, code in enumerate(palette["primary"]):
+        if np.any(present & (delta[:, j] <= match_delta_e)):
+            primary_matched.append(code)
+        else:
+            primary_missing.append(code)
+
+    if n_primary:
+        score = 60 * len(primary_matched) / n_primary + 40 * coverage
+    else:
+        score = 100 * coverage
+
+    rgb_centers = lab_to_rgb(centers)
+    return {
+        "score": round(score, 1),
+        "category_points": round(score * COLOR_CATEGORY_POINTS / 100, 1),
+        "coverage": round(coverage, 3),
+        "primary_matched": primary_matched,
+        "primary_missing": primary_missing,
+        "dominant_colors": [
+            {
+                "hex": rgb_to_hex(rgb_centers[i]),
+                "weight": round(float(weights[i]), 3),
+                "nearest": codes[nearest[i]],
+                "delta_e": round(float(nearest_delta[i]), 1),
+            }
+            for i in range(len(centers))
+        ],
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 2),
+    }
+
+
+def image_dominant_colors(image) -> Dict[str, np.ndarray]:
+    """Colores dominantes (Lab) de una imagen PIL, para reutilizar entre manuales"""
+    return dominant_colors(rgb_to_lab(image_pixels(image)))
+
+
+def analyze_image_colors(image, manual_content: dict,
+                         dominant: Optional[Dict[str, np.ndarray]] = None) -> Optional[Dict[str, Any]]:
+    """
+    Análisis de color de una imagen PIL contra la paleta del manual
+    """
+    if dominant is not None:
+        return score_palette(None, manual_palette(manual_content), dominant=dominant)
+    return score_palette(image_pixels(image), manual_palette(manual_content))
+
+
+def describe_color_analysis(result: Dict[str, Any]) -> str:
+    """Resumen en texto para incluir en el prompt de la auditoría"""
+    dominant = ", ".join(
+        f"{c['hex']} ({c['weight']:.0%}, ΔE {c['delta_e']} vs {c['nearest']})"
+        for c in result["dominant_colors"]
+    )
+    return (
+        f"Colores dominantes medidos: {dominant}\n"
+        f"Principales presentes: {', '.join(result['primary_matched']) or 'ninguno'}; "
+        f"ausentes: {', '.join(result['primary_missing']) or 'ninguno'}\n"
+        f"Cobertura de la paleta: {result['coverage']:.0%}. "
+        f"Score de color medido: {result['category_points']}/{COLOR_CATEGORY_POINTS}"
+    )
@@ -0,0 +1,245 @@
+"""
+Escáner local de cumplimiento del texto generado
+
+Compila las reglas de tono del manual (palabras_prohibidas,
+palabras_permitidas y uso_tecnicismos) en una sola expresión regular por
+versión de las reglas y busca coincidencias sin tildes ni mayúsculas,
+retornando la posición exacta de cada una en el texto original.
+
+StreamScanner aplica el mismo escaneo sobre un texto que llega por
+fragmentos (streaming de Groq) y reporta cada coincidencia en cuanto se
+puede confirmar, para poder cortar la generación antes de que termine.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+# Tecnicismos que se marcan cuando el manual dice uso_tecnicismos = false.
+# Se puede ampliar con COMPLIANCE_TECH_TERMS ("termino1,termino2")
+DEFAULT_TECH_TERMS = [
+    "algoritmo", "apalancar", "b2b", "b2c", "benchmark", "disruptivo",
+    "escalable", "framework", "holistico", "kpi", "know-how", "omnicanal",
+    "optimizacion", "paradigma", "proactivo", "roi", "sinergia", "stakeholder",
+    "workflow", "biodisponibilidad", "micronutrientes", "formulacion",
+]
+
+TECH_TERMS = DEFAULT_TECH_TERMS + [
+    t.strip() for t in os.getenv("COMPLIANCE_TECH_TERMS", "").split(",") if t.strip()
+]
+
+# Versiones de reglas compiladas en memoria
+RULES_CACHE_SIZE = 256
+
+# Severidad por tipo de regla: las "error" invalidan el contenido
+SEVERITY = {
+    "palabra_prohibida": "error",
+    "tecnicismo": "warning",
+}
+
+_cache: "OrderedDict[str, CompiledRules]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _fold_char(char: str) -> str:
+    """Minúscula y sin tildes (puede quedar vacío o tener más de un carácter)"""
+    decomposed = unicodedata.normalize("NFD", char.lower())
+    return "".join(c for c in decomposed if unicodedata.category(c) != "Mn")
+
+
+def fold(text: str) -> str:
+    return "".join(_fold_char(c) for c in text)
+
+
+def _term_key(word: str) -> str:
+    return " ".join(fold(word).split())
+
+
+def _as_list(value: Any) -> List[str]:
+    if isinstance(value, str):
+        return [v.strip() for v in value.split(",") if v.strip()]
+    if isinstance(value, (list, tuple)):
+        return [str(v).strip() for v in value if str(v).strip()]
+    return []
+
+
+def _tecnicismos_allowed(value: Any) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() in ("true", "sí", "si", "permitido")
+    # Si el manual no lo dice, no se restringe
+    return True if value is None else bool(value)
+
+
+def extract_rules(manual_content: dict) -> Dict[str, Any]:
+    """Reglas de texto del manual (sección tono_comunicacion)"""
+    tono = (manual_content or {}).get("tono_comunicacion", {}) or {}
+    return {
+        "palabras_prohibidas": _as_list(tono.get("palabras_prohibidas")),
+        "palabras_permitidas": _as_list(tono.get("palabras_permitidas")),
+        "uso_tecnicismos": _tecnicismos_allowed(tono.get("uso_tecnicismos")),
+    }
+
+
+class CompiledRules:
+    """
+    Reglas de un manual compiladas en una sola regex sobre texto normalizado
+    """
+
+    def __init__(self, rules: Dict[str, Any]):
+        allowed = {_term_key(w) for w in rules["palabras_permitidas"]}
+
+        terms: Dict[str, Tuple[str, str]] = {}
+        for word in rules["palabras_prohibidas"]:
+            key = _term_key(word)
+            if key and key not in allowed:
+                terms[key] = ("palabra_prohibida", word)
+        if not rules["uso_tecnicismos"]:
+            for word in TECH_TERMS:
+                key = _term_key(word)
+                # Las palabras permitidas explícitamente ganan a la lista genérica
+                if key and key not in allowed and key not in terms:
+                    terms[key] = ("tecnicismo", word)
+
+        self.terms = terms
+        # Largo del término más largo: cuánto texto hay que retener en streaming
+        self.max_term_length = max((len(t) for t in terms), default=0)
+        self.pattern: Optional[re.Pattern] = None
+        if terms:
+            # Más largos primero para que "sin azúcar añadida" gane a "sin azúcar"
+            alternatives = sorted(terms, key=len, reverse=True)
+            body = "|".join(r"\s+".join(re.escape(part) for part in t.split()) for t in alternatives)
+            self.pattern = re.compile(rf"(?<!\w)(?:{body})(?!\w)")
+
+    def _violation(self, match: re.Match, original: str, offsets: List[int]) -> Dict[str, Any]:
+        key = re.sub(r"\s+", " ", match.group(0))
+        kind, term = self.terms[key]
+        start = offsets[match.start()]
+        end = offsets[match.end() - 1] + 1
+        return {
+            "term": term,
+            "rule": kind,
+            "severity": SEVERITY[kind],
+            "start": start,
+            "end": end,
+            "text": original[start:end],
+        }
+
+    def scan(self, text: str) -> List[Dict[str, Any]]:
+        """Coincidencias con posiciones (start, end) sobre el texto original"""
+        if self.pattern is None or not text:
+            return []
+        folded, offsets = _fold_with_offsets(text)
+        return [self._violation(m, text, offsets) for m in self.pattern.finditer(folded)]
+
+
+def _fold_with_offsets(text: str) -> Tuple[str, List[int]]:
+    """Texto normalizado y, por cada carácter, su índice en el original"""
+    folded, offsets = [], []
+    for index, char in enumerate(text):
+        piece = _fold_char(char)
+        folded.append(piece)
+        offsets.extend([index] * len(piece))
+    return "".join(folded), offsets
+
+
+def rules_version(rules: Dict[str, Any]) -> str:
+    payload = json.dumps(rules, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def get_compiled_rules(manual_content: dict) -> CompiledRules:
+    """
+    Reglas compiladas del manual, cacheadas por versión (hash de las reglas):
+    un manual regenerado con otras palabras produce una entrada nueva
+    """
+    rules = extract_rules(manual_content)
+    version = rules_version(rules)
+    with _cache_lock:
+        compiled = _cache.get(version)
+        if compiled is not None:
+            _cache.move_to_end(version)
+            return compiled
+
+    compiled = CompiledRules(rules)
+    with _cache_lock:
+        _cache[version] = compiled
+        while len(_cache) > RULES_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return compiled
+
+
+def build_report(matches: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Resumen del escaneo: compliant es False si hay alguna violación "error" """
+    violations = [m for m in matches if m["severity"] == "error"]
+    warnings = [m for m in matches if m["severity"] != "error"]
+    return {
+        "compliant": not violations,
+        "violations": violations,
+        "warnings": warnings,
+    }
+
+
+def scan_text(text: str, manual_content: dict) -> Dict[str, Any]:
+    """Escanea un texto completo contra las reglas del manual"""
+    return build_report(get_compiled_rules(manual_content).scan(text))
+
+
+class StreamScanner:
+    """
+    Escaneo incremental de un texto que llega por fragmentos
+
+    Una coincidencia solo se confirma cuando empieza al menos
+    max_term_length caracteres antes del final recibido: así un término
+    cortado entre dos fragmentos, o uno más largo que lo contiene, no se
+    reporta a medias.
+    """
+
+    def __init__(self, compiled: CompiledRules):
+        self.compiled = compiled
+        self.text = ""
+        self.matches: List[Dict[str, Any]] = []
+        self._folded = ""
+        self._offsets: List[int] = []
+        self._position = 0
+
+    def feed(self, fragment: str) -> List[Dict[str, Any]]:
+        """Agrega un fragmento y retorna las coincidencias nuevas confirmadas"""
+        base = len(self.text)
+        self.text += fragment
+        for index, char in enumerate(fragment, start=base):
+            piece = _fold_char(char)
+            self._folded += piece
+            self._offsets.extend([index] * len(piece))
+        return self._scan(final=False)
+
+    def finish(self) -> List[Dict[str, Any]]:
+        """Confirma lo pendiente al terminar el stream"""
+        return self._scan(final=True)
+
+    def _scan(self, final: bool) -> List[Dict[str, Any]]:
+        pattern = self.compiled.pattern
+        if pattern is None:
+            return []
+
+        folded = self._folded
+        limit = len(folded) if final else len(folded) - self.compiled.max_term_length - 1
+        if limit <= self._position:
+            return []
+
+        new = []
+        for match in pattern.finditer(folded, self._position):
+            if match.start() >= limit:
+                break
+            new.append(self.compiled._violation(match, self.text, self._offsets))
+            self._position = match.end()
+        self._position = max(self._position, limit)
+
+        self.matches.extend(new)
+        return new
+
+    def report(self) -> Dict[str, Any]:
+        return build_report(self.matches)
@@ -0,0 +1,126 @@
+"""
+Ensamblado del contexto RAG con presupuesto de tokens
+
+Ordena los chunks recuperados por score, elimina contenido repetido entre
+chunks y recorta al presupuesto del tipo de contenido, para que el prompt
+que llega a Groq tenga un tamaño predecible.
+"""
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+from services.token_counter import count_llm_tokens
+
+# Presupuesto de tokens del contexto RAG por tipo de contenido
+DEFAULT_CONTEXT_BUDGETS = {
+    "product_description": 600,
+    "video_script": 700,
+    "image_prompt": 1200,
+}
+
+# Si el espacio que queda es menor a esto, no se agregan chunks recortados
+MIN_PARTIAL_TOKENS = 40
+
+
+def _parse_budgets(raw: str) -> Dict[str, int]:
+    """Parsea RAG_CONTEXT_BUDGETS con formato "tipo=tokens,tipo=tokens" """
+    budgets = dict(DEFAULT_CONTEXT_BUDGETS)
+    for item in raw.split(","):
+        if "=" not in item:
+            continue
+        name, value = item.split("=", 1)
+        try:
+            budgets[name.strip()] = int(value)
+        except ValueError:
+            print(f"Warning: presupuesto inválido para '{name.strip()}': {value}")
+    return budgets
+
+
+CONTEXT_BUDGETS = _parse_budgets(os.getenv("RAG_CONTEXT_BUDGETS", ""))
+
+
+def _normalize_line(line: str) -> str:
+    return re.sub(r"\s+", " ", line.strip().lower())
+
+
+def _relevance(chunk: Dict[str, Any]) -> float:
+    # En modo hybrid manda el score fusionado; si no, la similitud coseno
+    if chunk.get("score") is not None:
+        return chunk["score"]
+    return chunk.get("similarity") or 0.0
+
+
+def assemble_rag_context(results: List[Dict[str, Any]], content_type: str,
+                         budget: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Construye el contexto RAG dentro del presupuesto de tokens
+
+    Args:
+        results: Chunks de search_similar_content
+        content_type: Tipo de contenido (define el presupuesto por defecto)
+        budget: Presupuesto explícito (opcional)
+
+    Returns:
+        dict: context (texto), context_tokens, chunks_used, chunks_dropped y budget
+    """
+    budget = budget or CONTEXT_BUDGETS.get(content_type, DEFAULT_CONTEXT_BUDGETS["product_description"])
+
+    seen_lines = set()
+    blocks = []
+    used_tokens = 0
+    chunks_used = []
+    dropped = 0
+
+    for chunk in sorted(results, key=_relevance, reverse=True):
+        lines = chunk["content"].split("\n")
+        header, body = lines[0], lines[1:]
+
+        # Quitar líneas ya incluidas por chunks mejor rankeados
+        fresh = []
+        for line in body:
+            key = _normalize_line(line)
+            if key and key in seen_lines:
+                continue
+            fresh.append(line)
+        if not any(line.strip() for line in fresh):
+            dropped += 1
+            continue
+
+        block_header = f"[SECCIÓN: {chunk['section']}]\n{header}"
+        block = block_header + "\n" + "\n".join(fresh)
+        # +1 por el separador entre bloques
+        block_tokens = count_llm_tokens(block) + 1
+
+        if used_tokens + block_tokens > budget:
+            # Recortar por líneas si queda un espacio razonable
+            remaining = budget - used_tokens - count_llm_tokens(block_header) - 1
+            if remaining < MIN_PARTIAL_TOKENS:
+                dropped += 1
+                continue
+            kept = []
+            for line in fresh:
+                line_tokens = count_llm_tokens(line) + 1
+                if line_tokens > remaining:
+                    break
+                kept.append(line)
+                remaining -= line_tokens
+            if not kept:
+                dropped += 1
+                continue
+            fresh = kept
+            block = block_header + "\n" + "\n".join(fresh)
+            block_tokens = count_llm_tokens(block) + 1
+
+        for line in fresh:
+            seen_lines.add(_normalize_line(line))
+        blocks.append(block)
+        used_tokens += block_tokens
+        chunks_used.append(chunk)
+
+    return {
+        "context": "\n\n".join(blocks),
+        "context_tokens": used_tokens,
+        "chunks_used": chunks_used,
+        "chunks_dropped": dropped,
+        "budget": budget,
+    }
@@ -0,0 +1,215 @@
+"""
+Backends de inferencia para el modelo de embeddings
+
+- torch: SentenceTransformer (PyTorch fp32), el comportamiento original
+- onnx: ONNX Runtime con cuantización dinámica int8, sin cargar torch.
+  Requiere haber exportado el modelo con scripts/export_onnx_embeddings.py
+  en models_onnx/<modelo> (un directorio por modelo, así cada espacio de
+  embeddings carga el suyo)
+"""
+import os
+from functools import lru_cache
+from typing import Callable, List, Dict, Any, Optional
+
+import numpy as np
+
+# Modelo por defecto: 'all-MiniLM-L6-v2' (384 dimensiones)
+DEFAULT_MODEL_NAME = "all-MiniLM-L6-v2"
+
+# Longitud máxima de secuencia de all-MiniLM-L6-v2
+MAX_SEQ_LENGTH = 256
+
+
+class TorchEmbeddingBackend:
+    """
+    Backend original basado en sentence-transformers (PyTorch)
+    """
+    name = "torch"
+
+    def __init__(self, model_name: str = DEFAULT_MODEL_NAME):
+        import torch
+        from sentence_transformers import SentenceTransformer
+        self._torch = torch
+        self.model = SentenceTransformer(model_name)
+        self.tokenizer = self.model.tokenizer
+
+    def freeze(self):
+        """
+        Deja el modelo solo para inferencia: sin gradientes ni buffers de
+        autograd, para que los pesos no se escriban después de cargarse
+        """
+        self.model.eval()
+        for param in self.model.parameters():
+            param.requires_grad_(False)
+        self._torch.set_grad_enabled(False)
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Retorna una matriz float32 (n_textos, dimensión)"""
+        with self._torch.inference_mode():
+            vectors = self.model.encode(texts, convert_to_numpy=True)
+        return vectors.astype(np.float32, copy=False)
+
+    def count_tokens(self, text: str) -> int:
+        """Tokens WordPiece (sin tokens especiales)"""
+        return len(self.tokenizer.tokenize(text))
+
+
+class OnnxEmbeddingBackend:
+    """
+    Backend ONNX Runtime (CPU) con cuantización dinámica int8
+
+    Reproduce el pipeline de all-MiniLM-L6-v2: tokenización WordPiece,
+    mean pooling con la máscara de atención y normalización L2.
+    """
+    name = "onnx"
+
+    def __init__(self, model_dir: str, quantize: bool = True, num_threads: int = 0):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        base_model = os.path.join(model_dir, "model.onnx")
+        model_path = base_model
+        if quantize:
+            model_path = os.path.join(model_dir, "model_quantized.onnx")
+            if not os.path.exists(model_path):
+                quantize_onnx_model(base_model, model_path)
+
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(
+                f"No existe {model_path}. Ejecuta scripts/export_onnx_embeddings.py primero"
+            )
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=MAX_SEQ_LENGTH)
+        self.tokenizer.enable_padding()
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads > 0:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(
+            model_path,
+            sess_options=options,
+            providers=["CPUExecutionProvider"]
+        )
+        self._input_names = {i.name for i in self.session.get_inputs()}
+
+    def freeze(self):
+        """La sesión de ONNX Runtime ya es solo de inferencia"""
+
+    def count_tokens(self, text: str) -> int:
+        """Tokens WordPiece (sin tokens especiales, acotado a MAX_SEQ_LENGTH)"""
+        return len(self.tokenizer.encode(text, add_special_tokens=False).ids)
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Retorna una matriz float32 (n_textos, dimensión) normalizada"""
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self._input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+
+        token_embeddings = self.session.run(None, feeds)[0]
+
+        # Mean pooling respetando el padding
+        mask = attention_mask[..., None].astype(np.float32)
+        summed = (token_embeddings * mask).sum(axis=1)
+        counts = np.clip(mask.sum(axis=1), 1e-9, None)
+        embeddings = summed / counts
+
+        # Normalización L2 (igual que el módulo Normalize del modelo original)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return (embeddings / np.clip(norms, 1e-12, None)).astype(np.float32, copy=False)
+
+
+def quantize_onnx_model(input_path: str, output_path: str):
+    """
+    Cuantización dinámica int8 de los pesos (las activaciones se cuantizan en runtime)
+    """
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    quantize_dynamic(input_path, output_path, weight_type=QuantType.QInt8)
+
+
+def onnx_model_dir(model_name: str = DEFAULT_MODEL_NAME) -> str:
+    """
+    Directorio del modelo ONNX exportado: models_onnx/<modelo>
+
+    EMBEDDINGS_ONNX_DIR solo reemplaza al del modelo por defecto, para que
+    cada espacio de embeddings cargue su propio modelo.
+    """
+    if model_name == DEFAULT_MODEL_NAME and os.getenv("EMBEDDINGS_ONNX_DIR"):
+        return os.getenv("EMBEDDINGS_ONNX_DIR")
+    return os.path.join("models_onnx", model_name)
+
+
+@lru_cache(maxsize=None)
+def load_token_counter(model_name: str = DEFAULT_MODEL_NAME) -> Optional[Callable[[str], int]]:
+    """
+    Contador de tokens con el tokenizer exportado del modelo (tokenizer.json),
+    sin cargar el modelo. None si no está exportado o falta tokenizers.
+    """
+    path = os.path.join(onnx_model_dir(model_name), "tokenizer.json")
+    if not os.path.exists(path):
+        return None
+    try:
+        from tokenizers import Tokenizer
+    except ImportError:
+        return None
+    tokenizer = Tokenizer.from_file(path)
+    tokenizer.enable_truncation(max_length=MAX_SEQ_LENGTH)
+    return lambda text: len(tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+def load_embedding_backend(backend: str = None, model_name: str = DEFAULT_MODEL_NAME):
+    """
+    Crea el backend configurado en EMBEDDINGS_BACKEND ("torch" u "onnx")
+    """
+    backend = (backend or os.getenv("EMBEDDINGS_BACKEND", "torch")).lower()
+    if backend == "torch":
+        return TorchEmbeddingBackend(model_name)
+    if backend == "onnx":
+        return OnnxEmbeddingBackend(
+            model_dir=onnx_model_dir(model_name),
+            quantize=os.getenv("EMBEDDINGS_ONNX_QUANTIZE", "true").lower() == "true",
+            num_threads=int(os.getenv("EMBEDDINGS_ONNX_THREADS", "0"))
+        )
+    raise ValueError(f"Backend de embeddings desconocido: {backend}. Use 'torch' u 'onnx'")
+
+
+def check_backend_parity(reference, candidate, texts: List[str]) -> Dict[str, Any]:
+    """
+    Compara dos backends sobre los mismos textos
+
+    Mide tanto la similitud coseno entre los vectores de cada backend
+    como la diferencia entre sus matrices de similitud (lo que realmente
+    afecta al ranking de la búsqueda RAG).
+
+    Returns:
+        dict: min/mean coseno entre backends y máxima diferencia de similitudes
+    """
+    ref = reference.encode(texts)
+    cand = candidate.encode(texts)
+
+    ref = ref / np.linalg.norm(ref, axis=1, keepdims=True)
+    cand = cand / np.linalg.norm(cand, axis=1, keepdims=True)
+
+    pairwise = (ref * cand).sum(axis=1)
+    sim_diff = np.abs(ref @ ref.T - cand @ cand.T)
+
+    # Coincidencia del vecino más cercano de cada texto (excluyéndose a sí mismo)
+    ref_sims = ref @ ref.T
+    cand_sims = cand @ cand.T
+    np.fill_diagonal(ref_sims, -np.inf)
+    np.fill_diagonal(cand_sims, -np.inf)
+    top1_agreement = float((ref_sims.argmax(axis=1) == cand_sims.argmax(axis=1)).mean())
+
+    return {
+        "texts": len(texts),
+        "min_cosine": float(pairwise.min()),
+        "mean_cosine": float(pairwise.mean()),
+        "max_similarity_diff": float(sim_diff.max()),
+        "mean_similarity_diff": float(sim_diff.mean()),
+        "top1_agreement": top1_agreement
+    }
@@ -0,0 +1,108 @@
+"""
+Backfill de un espacio de embeddings en segundo plano
+
+Recorre los manuales con full_manual por páginas y sincroniza sus
+embeddings en el espacio destino, sin tocar el espacio activo (las
+búsquedas siguen funcionando durante todo el proceso). Es idempotente:
+los chunks que ya existen en el espacio se reutilizan por content_hash,
+así que se puede relanzar si el proceso se reinicia a mitad.
+"""
+import asyncio
+import os
+import time
+from typing import Any, Dict, Optional
+
+from services.embeddings_service import sync_manual_embeddings
+from services.embedding_spaces import EMBEDDINGS_VERSIONED, get_space
+
+# Manuales por página al recorrer brand_manuals
+BACKFILL_PAGE_SIZE = int(os.getenv("EMBEDDINGS_BACKFILL_PAGE_SIZE", "20"))
+
+# Errores que se conservan en el estado (los demás solo se cuentan)
+MAX_REPORTED_ERRORS = 20
+
+_status: Dict[str, Dict[str, Any]] = {}
+_tasks: Dict[str, asyncio.Task] = {}
+
+
+def get_backfill_status(space: Optional[str] = None) -> Dict[str, Any]:
+    """Estado del backfill de un espacio, o de todos"""
+    if space:
+        return _status.get(space, {"space": space, "state": "idle"})
+    return dict(_status)
+
+
+def start_backfill(space: str, supabase_client) -> Dict[str, Any]:
+    """
+    Lanza el backfill de un espacio como tarea de fondo
+
+    Raises:
+        ValueError: versionado desactivado o espacio desconocido
+        RuntimeError: ya hay un backfill en curso para ese espacio
+    """
+    if not EMBEDDINGS_VERSIONED:
+        raise ValueError("El backfill requiere EMBEDDINGS_VERSIONED=true (migración 3)")
+    get_space(space)
+
+    task = _tasks.get(space)
+    if task is not None and not task.done():
+        raise RuntimeError(f"Ya hay un backfill en curso para {space}")
+
+    _status[space] = {
+        "space": space,
+        "state": "running",
+        "started_at": time.time(),
+        "finished_at": None,
+        "manuals_done": 0,
+        "manuals_failed": 0,
+        "chunks_created": 0,
+        "chunks_reused": 0,
+        "errors": [],
+    }
+    _tasks[space] = asyncio.create_task(_run_backfill(space, supabase_client))
+    return _status[space]
+
+
+async def _run_backfill(space: str, supabase_client):
+    status = _status[space]
+    offset = 0
+    try:
+        while True:
+            # Las lecturas y escrituras en Supabase corren en hilos (también
+            # las de sync_manual_embeddings) para no bloquear las requests
+            page = await asyncio.to_thread(
+                supabase_client.table("brand_manuals")
+                .select("id, full_manual")
+                .not_.is_("full_manual", "null")
+                .order("id")
+                .range(offset, offset + BACKFILL_PAGE_SIZE - 1)
+                .execute
+            )
+            rows = page.data or []
+
+            for row in rows:
+                try:
+                    result = await sync_manual_embeddings(
+                        manual_id=row["id"],
+                        manual_data=row["full_manual"],
+                        supabase_client=supabase_client,
+                        space=space
+                    )
+                    status["manuals_done"] += 1
+                    status["chunks_created"] += result["chunks_created"]
+                    status["chunks_reused"] += result["chunks_reused"]
+                except Exception as e:
+                    status["manuals_failed"] += 1
+                    if len(status["errors"]) < MAX_REPORTED_ERRORS:
+                        status["errors"].append({"manual_id": row["id"], "error": str(e)})
+
+            if len(rows) < BACKFILL_PAGE_SIZE:
+                break
+            offset += BACKFILL_PAGE_SIZE
+
+        status["state"] = "completed" if not status["manuals_failed"] else "completed_with_errors"
+    except Exception as e:
+        status["state"] = "failed"
+        status["errors"].append({"manual_id": None, "error": str(e)})
+    finally:
+        status["finished_at"] = time.time()
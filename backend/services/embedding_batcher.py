@@ -0,0 +1,154 @@
+"""
+Micro-batching dinámico de peticiones de embeddings concurrentes
+
+Las peticiones concurrentes (por ejemplo varias búsquedas RAG a la vez) se
+juntan en un solo encode y cada llamador recibe sus filas.
+
+Para no penalizar la latencia de una petición aislada:
+- Si no hay carga, el lote sale de inmediato (sin esperar la ventana)
+- Mientras un encode está en curso, las peticiones nuevas se acumulan y
+  salen juntas en el siguiente lote
+- Solo se espera hasta max_wait_ms cuando el lote anterior ya fue
+  concurrente (señal de que hay tráfico y vale la pena agrupar)
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from services.metrics_service import register_histogram, observe_histogram, BATCH_SIZE_BUCKETS
+
+register_histogram(
+    "embedding_microbatch_requests",
+    "Número de peticiones agrupadas en cada lote del micro-batcher",
+    buckets=BATCH_SIZE_BUCKETS
+)
+
+
+class MicroBatcher:
+    """
+    Agrupa llamadas a encode_fn(texts) -> np.ndarray
+
+    Args:
+        encode_fn: Función síncrona (CPU-bound) que codifica una lista de textos
+        max_batch_size: Máximo de textos por encode
+        max_wait_ms: Espera máxima para completar un lote bajo carga
+    """
+
+    def __init__(self, encode_fn: Callable[[List[str]], np.ndarray],
+                 max_batch_size: int = 32, max_wait_ms: float = 2.0):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        # Un solo hilo: los encodes se serializan y la cola se llena mientras tanto
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embeddings")
+        self._queue: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._last_batch_requests = 1
+        # Petición que no entró en el lote anterior (abre el siguiente)
+        self._carry: Optional[tuple] = None
+        # Lote en armado o en encode (para fallarlo si el loop muere)
+        self._batch: list = []
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task is None or self._task.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._carry = None
+            self._task = loop.create_task(self._run())
+
+    async def submit(self, texts: List[str]) -> np.ndarray:
+        """
+        Encola los textos y espera sus vectores (matriz len(texts) x dim)
+
+        Una petición de más de max_batch_size textos se parte en varias
+        """
+        if len(texts) > self.max_batch_size:
+            parts = [texts[i:i + self.max_batch_size] for i in range(0, len(texts), self.max_batch_size)]
+            return np.concatenate(await asyncio.gather(*(self.submit(part) for part in parts)))
+
+        self._ensure_started()
+        future = self._loop.create_future()
+        await self._queue.put((texts, future))
+        return await future
+
+    async def _collect(self) -> list:
+        if self._carry is not None:
+            batch, self._carry = [self._carry], None
+        else:
+            batch = [await self._queue.get()]
+        self._batch = batch
+        size = len(batch[0][0])
+
+        def fits(item) -> bool:
+            # Lo que no entra queda para el próximo lote
+            if size + len(item[0]) > self.max_batch_size:
+                self._carry = item
+                return False
+            batch.append(item)
+            return True
+
+        # 1. Todo lo que ya esté esperando
+        while size < self.max_batch_size and not self._queue.empty():
+            item = self._queue.get_nowait()
+            if not fits(item):
+                return batch
+            size += len(item[0])
+
+        # 2. Bajo carga, esperar un poco más para llenar el lote
+        if self.max_wait > 0 and size < self.max_batch_size and (
+            len(batch) > 1 or self._last_batch_requests > 1
+        ):
+            deadline = self._loop.time() + self.max_wait
+            while size < self.max_batch_size:
+                timeout = deadline - self._loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if not fits(item):
+                    break
+                size += len(item[0])
+
+        return batch
+
+    async def _run(self):
+        try:
+            while True:
+                batch = await self._collect()
+                self._last_batch_requests = len(batch)
+                observe_histogram("embedding_microbatch_requests", len(batch))
+
+                texts = [text for item_texts, _ in batch for text in item_texts]
+                try:
+                    vectors = await self._loop.run_in_executor(self._executor, self.encode_fn, texts)
+                except Exception as e:
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+
+                offset = 0
+                for item_texts, future in batch:
+                    rows = vectors[offset:offset + len(item_texts)]
+                    offset += len(item_texts)
+                    if not future.done():
+                        future.set_result(rows)
+        finally:
+            # Si el loop del batcher muere (p. ej. cancelado al apagar), nadie
+            # más resolvería las peticiones pendientes
+            pending = list(self._batch)
+            self._batch = []
+            if self._carry is not None:
+                pending.append(self._carry)
+                self._carry = None
+            while not self._queue.empty():
+                pending.append(self._queue.get_nowait())
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(RuntimeError("El micro-batcher de embeddings se detuvo"))
@@ -0,0 +1,174 @@
+"""
+Servidor local de embeddings compartido por todos los workers de la API
+
+Un solo proceso carga el modelo y atiende por un Unix socket. Las
+peticiones que llegan de distintos workers se agrupan en un único encode
+(ver services/embedding_batcher.py).
+
+Ejecutar (desde backend/, solo Linux/macOS):
+    python -m services.embedding_server
+
+Y en los workers de la API:
+    EMBEDDINGS_SERVER_SOCKET=/tmp/alicorp-embeddings.sock
+
+El servidor carga el modelo de EMBEDDINGS_ACTIVE_SPACE y rechaza las
+peticiones de otro espacio: en un cambio de espacio debe reiniciarse con
+la nueva configuración junto con los workers (mientras tanto los workers
+usan su modelo local).
+
+Protocolo (por conexión persistente, petición → respuesta):
+    petición:  uint32 big-endian (largo) + JSON {"texts": [...], "space": "..."}
+    respuesta: uint8 status + uint32 n + uint32 dim + n*dim float32 (little-endian)
+               si status != 0: uint8 status + uint32 largo + mensaje UTF-8
+"""
+import asyncio
+import json
+import os
+import struct
+from typing import List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+from services.embedding_batcher import MicroBatcher
+
+load_dotenv()
+
+DEFAULT_SOCKET_PATH = "/tmp/alicorp-embeddings.sock"
+
+# Ventana de agrupación y tamaño máximo de lote
+BATCH_WINDOW_MS = float(os.getenv("EMBEDDINGS_SERVER_BATCH_WINDOW_MS", "5"))
+MAX_BATCH_SIZE = int(os.getenv("EMBEDDINGS_SERVER_MAX_BATCH", "64"))
+
+# Límite de tamaño de una petición (protege al servidor de payloads absurdos)
+MAX_REQUEST_BYTES = 8 * 1024 * 1024
+
+_HEADER = struct.Struct(">BII")
+_LENGTH = struct.Struct(">I")
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+STATUS_SPACE_MISMATCH = 2
+
+
+class EmbeddingSpaceMismatch(Exception):
+    """El servidor sirve otro espacio de embeddings que el pedido"""
+
+
+# ============================================
+# CODIFICACIÓN DEL PROTOCOLO
+# ============================================
+
+def encode_request(texts: List[str], space: Optional[str] = None) -> bytes:
+    payload = json.dumps({"texts": texts, "space": space}, ensure_ascii=False).encode("utf-8")
+    return _LENGTH.pack(len(payload)) + payload
+
+
+async def read_response(reader: asyncio.StreamReader) -> np.ndarray:
+    """Lee una respuesta del servidor y la convierte en matriz float32"""
+    status, n, dim = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    if status != STATUS_OK:
+        # En errores, 'n' es el largo del mensaje y 'dim' no se usa
+        message = (await reader.readexactly(n)).decode("utf-8")
+        if status == STATUS_SPACE_MISMATCH:
+            raise EmbeddingSpaceMismatch(message)
+        raise Exception(f"Servidor de embeddings: {message}")
+    data = await reader.readexactly(n * dim * 4)
+    return np.frombuffer(data, dtype="<f4").reshape(n, dim)
+
+
+def _encode_response(vectors: np.ndarray) -> bytes:
+    vectors = np.ascontiguousarray(vectors, dtype="<f4")
+    n, dim = vectors.shape
+    return _HEADER.pack(STATUS_OK, n, dim) + vectors.tobytes()
+
+
+def _encode_error(message: str, status: int = STATUS_ERROR) -> bytes:
+    data = message.encode("utf-8")
+    return _HEADER.pack(status, len(data), 0) + data
+
+
+# ============================================
+# SERVIDOR
+# ============================================
+
+class EmbeddingServer:
+    """
+    Dueño del modelo: agrupa peticiones concurrentes y ejecuta un solo encode
+    """
+
+    def __init__(self, model, space: str, batch_window_ms: float = BATCH_WINDOW_MS,
+                 max_batch_size: int = MAX_BATCH_SIZE):
+        self.model = model
+        self.space = space
+        self.batcher = MicroBatcher(model.encode, max_batch_size=max_batch_size, max_wait_ms=batch_window_ms)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    (length,) = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))
+                except asyncio.IncompleteReadError:
+                    break  # El cliente cerró la conexión
+
+                if length > MAX_REQUEST_BYTES:
+                    writer.write(_encode_error(f"Petición demasiado grande ({length} bytes)"))
+                    await writer.drain()
+                    break
+
+                try:
+                    request = json.loads(await reader.readexactly(length))
+                    texts = request["texts"]
+                    if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+                        raise ValueError("'texts' debe ser una lista de strings")
+                except Exception as e:
+                    writer.write(_encode_error(f"Petición inválida: {e}"))
+                    await writer.drain()
+                    continue
+
+                # Vectores de otro modelo romperían la búsqueda sin error visible
+                space = request.get("space")
+                if space and space != self.space:
+                    writer.write(_encode_error(
+                        f"el servidor sirve el espacio {self.space}, no {space}", STATUS_SPACE_MISMATCH
+                    ))
+                    await writer.drain()
+                    continue
+
+                try:
+                    writer.write(_encode_response(await self.batcher.submit(texts)))
+                except Exception as e:
+                    writer.write(_encode_error(str(e)))
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, socket_path: str):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+        server = await asyncio.start_unix_server(self._handle_connection, path=socket_path)
+        print(f"Servidor de embeddings ({self.space}) escuchando en {socket_path} "
+              f"(ventana {self.batcher.max_wait * 1000:.1f} ms, lote máx {self.batcher.max_batch_size})")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+
+
+def main():
+    from services.embedding_backends import load_embedding_backend
+    from services.embedding_spaces import ACTIVE_SPACE, get_space
+
+    socket_path = os.getenv("EMBEDDINGS_SERVER_SOCKET", DEFAULT_SOCKET_PATH)
+    model = load_embedding_backend(model_name=get_space(ACTIVE_SPACE)["model"])
+    try:
+        asyncio.run(EmbeddingServer(model, ACTIVE_SPACE).serve(socket_path))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Espacios de embeddings versionados
+
+Cada fila de brand_manual_embeddings guarda el espacio (modelo y versión)
+que generó su vector. Varios espacios conviven en la tabla, así que un
+cambio de modelo no requiere borrar nada:
+
+1. Registrar el nuevo espacio en EMBEDDINGS_SPACES
+2. EMBEDDINGS_BACKFILL_SPACE=<nuevo>: las escrituras van a ambos espacios y
+   POST /embeddings/spaces/<nuevo>/backfill completa los manuales existentes
+   en segundo plano; las búsquedas siguen en el espacio activo
+3. EMBEDDINGS_ACTIVE_SPACE=<nuevo> en el siguiente deploy: el corte es
+   atómico por deployment (cada proceso lee un solo espacio)
+4. DELETE /embeddings/spaces/<anterior> cuando ya no hay procesos viejos
+
+Requiere la migración 3 de docs/SUPABASE_RAG_SETUP.sql y
+EMBEDDINGS_VERSIONED=true; sin ella todo funciona como antes (un solo
+espacio, sin columna embedding_space).
+"""
+import os
+from typing import Any, Dict, List
+
+from services.embedding_backends import DEFAULT_MODEL_NAME
+
+# Espacio de los vectores existentes (el valor por defecto de la columna)
+DEFAULT_SPACE = DEFAULT_MODEL_NAME
+
+EMBEDDINGS_VERSIONED = os.getenv("EMBEDDINGS_VERSIONED", "false").lower() == "true"
+
+
+def _parse_spaces(raw: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Parsea EMBEDDINGS_SPACES: "id=modelo:dimensión,id2=modelo2:dimensión2"
+    """
+    spaces = {DEFAULT_SPACE: {"id": DEFAULT_SPACE, "model": DEFAULT_MODEL_NAME, "dimension": 384}}
+    for item in raw.split(","):
+        if "=" not in item:
+            continue
+        space_id, spec = (part.strip() for part in item.split("=", 1))
+        model, _, dimension = spec.rpartition(":")
+        try:
+            spaces[space_id] = {"id": space_id, "model": model or spec, "dimension": int(dimension)}
+        except ValueError:
+            print(f"Warning: espacio de embeddings inválido '{item.strip()}' (formato id=modelo:dimensión)")
+    return spaces
+
+
+EMBEDDING_SPACES = _parse_spaces(os.getenv("EMBEDDINGS_SPACES", ""))
+
+# Espacio que usan las búsquedas (y las escrituras) de este deployment
+ACTIVE_SPACE = os.getenv("EMBEDDINGS_ACTIVE_SPACE", DEFAULT_SPACE)
+# Espacio en preparación: recibe escrituras pero no se consulta
+BACKFILL_SPACE = os.getenv("EMBEDDINGS_BACKFILL_SPACE") or None
+
+for _space in filter(None, (ACTIVE_SPACE, BACKFILL_SPACE)):
+    if _space not in EMBEDDING_SPACES:
+        raise ValueError(f"Espacio de embeddings no registrado en EMBEDDINGS_SPACES: {_space}")
+
+
+def get_space(space_id: str = None) -> Dict[str, Any]:
+    """Configuración de un espacio (por defecto el activo)"""
+    space_id = space_id or ACTIVE_SPACE
+    if space_id not in EMBEDDING_SPACES:
+        raise ValueError(f"Espacio de embeddings desconocido: {space_id}")
+    return EMBEDDING_SPACES[space_id]
+
+
+def write_spaces() -> List[str]:
+    """Espacios que deben actualizarse al (re)generar los embeddings de un manual"""
+    if EMBEDDINGS_VERSIONED and BACKFILL_SPACE and BACKFILL_SPACE != ACTIVE_SPACE:
+        return [ACTIVE_SPACE, BACKFILL_SPACE]
+    return [ACTIVE_SPACE]
+
+
+def space_column(space_id: str = None) -> Dict[str, str]:
+    """Columna embedding_space para una fila nueva (vacía sin versionado)"""
+    if not EMBEDDINGS_VERSIONED:
+        return {}
+    return {"embedding_space": space_id or ACTIVE_SPACE}
+
+
+def scope_to_space(query, space_id: str = None):
+    """Filtra una consulta de brand_manual_embeddings por espacio"""
+    if not EMBEDDINGS_VERSIONED:
+        return query
+    return query.eq("embedding_space", space_id or ACTIVE_SPACE)
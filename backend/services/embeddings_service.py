@@ -1,31 +1,153 @@
 import numpy as np
-from typing import List, Dict, Any
-import json
-from langfuse import observe
+from typing import List, Dict, Any, Optional, Set
+import asyncio
+import os
+import time
+from config.langfuse_config import observe
+from services.metrics_service import stage_timer, record_embedding_batch
+from services.embedding_backends import DEFAULT_MODEL_NAME, load_embedding_backend, load_token_counter
+from services.chunking import chunk_manual, estimate_tokens
+from services.vector_codec import VECTOR_TRANSPORT, embedding_column, encode_vector, uses_binary_transport
+from services.embedding_spaces import (
+    ACTIVE_SPACE,
+    EMBEDDINGS_VERSIONED,
+    get_space,
+    scope_to_space,
+    space_column,
+)
 
 # Lazy loading del modelo para evitar problemas de carga lenta en Windows
 # En producción (Linux/EC2) esto cargará normalmente
-_embeddings_model = None
+# Un modelo por espacio de embeddings (ver services/embedding_spaces.py)
+_embeddings_models: Dict[str, Any] = {}
 
-def _get_embeddings_model():
+def _get_embeddings_model(space: str = None):
     """
-    Carga el modelo de embeddings de forma lazy (solo cuando se necesita)
+    Carga el modelo de embeddings de un espacio de forma lazy (solo cuando se necesita)
+
+    El backend se elige con EMBEDDINGS_BACKEND: "torch" (SentenceTransformer)
+    u "onnx" (ONNX Runtime int8, sin torch)
     """
-    global _embeddings_model
-    if _embeddings_model is None:
-        from sentence_transformers import SentenceTransformer
-        # Usamos 'all-MiniLM-L6-v2': ligero, rápido y efectivo
+    space = space or ACTIVE_SPACE
+    if space not in _embeddings_models:
+        # Por defecto 'all-MiniLM-L6-v2': ligero, rápido y efectivo
         # Genera vectores de 384 dimensiones
-        _embeddings_model = SentenceTransformer('all-MiniLM-L6-v2')
-    return _embeddings_model
+        _embeddings_models[space] = load_embedding_backend(model_name=get_space(space)["model"])
+    return _embeddings_models[space]
+
+# Servidor de embeddings compartido (opcional): si está configurado, los
+# workers no cargan el modelo y delegan el encode por Unix socket
+EMBEDDINGS_SERVER_SOCKET = os.getenv("EMBEDDINGS_SERVER_SOCKET")
+# Si el servidor no responde, usar el modelo local en lugar de fallar
+EMBEDDINGS_SERVER_FALLBACK = os.getenv("EMBEDDINGS_SERVER_FALLBACK", "true").lower() == "true"
+# Segundos sin intentar el servidor tras un fallo de conexión (luego se vuelve a probar)
+EMBEDDINGS_SERVER_RETRY_AFTER = float(os.getenv("EMBEDDINGS_SERVER_RETRY_AFTER", "30"))
+
+# Micro-batching en proceso de encodes concurrentes
+EMBEDDINGS_MICROBATCH = os.getenv("EMBEDDINGS_MICROBATCH", "true").lower() == "true"
+EMBEDDINGS_BATCH_MAX_SIZE = int(os.getenv("EMBEDDINGS_BATCH_MAX_SIZE", "32"))
+EMBEDDINGS_BATCH_MAX_WAIT_MS = float(os.getenv("EMBEDDINGS_BATCH_MAX_WAIT_MS", "2"))
+
+def warm_up_embeddings_model():
+    """
+    Carga el modelo local por adelantado (arranque del servidor). No hace
+    nada si los encodes se delegan al servidor de embeddings
+
+    Returns:
+        El backend cargado, o None si se usa el servidor de embeddings
+    """
+    if not EMBEDDINGS_SERVER_SOCKET:
+        return _get_embeddings_model()
+    return None
 
-def get_embedding_dimension() -> int:
+_batchers: Dict[str, Any] = {}
+
+def _get_batcher(space: str = None):
     """
-    Retorna la dimensión de los embeddings del modelo
+    Crea el micro-batcher sobre el modelo local de un espacio (lazy)
     """
-    return 384  # Dimensión de all-MiniLM-L6-v2
+    space = space or ACTIVE_SPACE
+    if space not in _batchers:
+        from services.embedding_batcher import MicroBatcher
+        _batchers[space] = MicroBatcher(
+            lambda texts: _get_embeddings_model(space).encode(texts),
+            max_batch_size=EMBEDDINGS_BATCH_MAX_SIZE,
+            max_wait_ms=EMBEDDINGS_BATCH_MAX_WAIT_MS
+        )
+    return _batchers[space]
+
+# Conexiones libres al servidor (se reutilizan entre requests)
+_server_connections: List[tuple] = []
+# Hasta cuándo (time.monotonic) se usa el modelo local tras un fallo del servidor
+_server_down_until = 0.0
 
-async def generate_embedding(text: str) -> List[float]:
+def _uses_server(space: str) -> bool:
+    """El espacio se codifica en el servidor compartido (solo sirve el activo)"""
+    return bool(EMBEDDINGS_SERVER_SOCKET) and space == ACTIVE_SPACE and time.monotonic() >= _server_down_until
+
+async def _remote_encode(texts: List[str], space: str) -> np.ndarray:
+    """
+    Envía los textos al servidor de embeddings y espera los vectores
+    """
+    from services.embedding_server import EmbeddingSpaceMismatch, encode_request, read_response
+    
+    if _server_connections:
+        reader, writer = _server_connections.pop()
+    else:
+        reader, writer = await asyncio.open_unix_connection(EMBEDDINGS_SERVER_SOCKET)
+    
+    try:
+        writer.write(encode_request(texts, space))
+        await writer.drain()
+        vectors = await read_response(reader)
+    except EmbeddingSpaceMismatch:
+        # Respuesta completa: la conexión sigue sirviendo
+        _server_connections.append((reader, writer))
+        raise
+    except BaseException:
+        # Conexión en estado desconocido: descartarla
+        writer.close()
+        raise
+    
+    _server_connections.append((reader, writer))
+    return vectors
+
+async def _encode(texts: List[str], space: str = None) -> np.ndarray:
+    """
+    Ejecuta el encode en el servidor compartido (si existe) o con el modelo local
+
+    El servidor compartido solo sirve el espacio activo; los demás espacios
+    (ej: un backfill) usan un modelo local.
+    """
+    global _server_down_until
+    space = space or ACTIVE_SPACE
+    record_embedding_batch(len(texts))
+    
+    if _uses_server(space):
+        from services.embedding_server import EmbeddingSpaceMismatch
+        try:
+            return await _remote_encode(texts, space)
+        except (ConnectionError, FileNotFoundError, asyncio.IncompleteReadError, EmbeddingSpaceMismatch) as e:
+            if not EMBEDDINGS_SERVER_FALLBACK:
+                raise
+            print(f"Warning: servidor de embeddings no disponible ({e}); usando modelo local "
+                  f"por {EMBEDDINGS_SERVER_RETRY_AFTER:.0f}s")
+            _server_down_until = time.monotonic() + EMBEDDINGS_SERVER_RETRY_AFTER
+            # Las conexiones guardadas son del servidor caído
+            while _server_connections:
+                _server_connections.pop()[1].close()
+    
+    if EMBEDDINGS_MICROBATCH:
+        return await _get_batcher(space).submit(texts)
+    return _get_embeddings_model(space).encode(texts)
+
+def get_embedding_dimension(space: str = None) -> int:
+    """
+    Retorna la dimensión de los embeddings del espacio (por defecto el activo)
+    """
+    return get_space(space)["dimension"]
+
+async def generate_embedding(text: str, space: str = None) -> List[float]:
     """
     Genera un embedding (vector) para un texto dado
     
@@ -36,10 +158,8 @@ async def generate_embedding(text: str) -> List[float]:
         List[float]: Vector de 384 dimensiones
     """
     try:
-        # Obtener modelo (carga lazy)
-        model = _get_embeddings_model()
-        # Generar embedding
-        embedding = model.encode(text, convert_to_numpy=True)
+        # Generar embedding (servidor compartido o modelo local con carga lazy)
+        embedding = (await _encode([text], space))[0]
         
         # Convertir numpy array a lista de floats
         return embedding.tolist()
@@ -47,201 +167,240 @@ async def generate_embedding(text: str) -> List[float]:
     except Exception as e:
         raise Exception(f"Error al generar embedding: {str(e)}")
 
-async def chunk_manual_content(manual: Dict[str, Any]) -> List[Dict[str, str]]:
+async def generate_embeddings(texts: List[str], space: str = None) -> np.ndarray:
     """
-    Divide el manual de marca en chunks (fragmentos) semánticos
-    
-    Estrategia: Cada sección importante del manual es un chunk separado
-    Esto permite búsquedas más precisas por contexto
+    Genera embeddings para varios textos en una sola llamada al modelo
     
     Args:
-        manual: El JSON completo del manual de marca
+        texts: Textos a convertir en embeddings
     
     Returns:
-        List[Dict]: Lista de chunks con su contenido y metadata
+        np.ndarray: Matriz float32 (len(texts), 384)
     """
-    chunks = []
+    if not texts:
+        return np.zeros((0, get_embedding_dimension(space)), dtype=np.float32)
     
     try:
-        # Chunk 1: Identidad de Marca (completa)
-        if "identidad_marca" in manual:
-            identidad = manual["identidad_marca"]
-            content = f"""
-IDENTIDAD DE MARCA:
-Propósito: {identidad.get('proposito', '')}
-Valores: {', '.join(identidad.get('valores', []))}
-Personalidad: {identidad.get('personalidad', '')}
-Diferenciador: {identidad.get('diferenciador', '')}
-"""
-            chunks.append({
-                "section": "identidad_marca",
-                "content": content.strip()
-            })
-        
-        # Chunk 2: Tono de Comunicación (completo)
-        if "tono_comunicacion" in manual:
-            tono = manual["tono_comunicacion"]
-            content = f"""
-TONO DE COMUNICACIÓN:
-Descripción: {tono.get('descripcion_general', '')}
-Estilo: {tono.get('estilo_redaccion', '')}
-Uso de tecnicismos: {'Permitido' if tono.get('uso_tecnicismos') else 'Prohibido'}
-
-Palabras permitidas: {', '.join(tono.get('palabras_permitidas', []))}
-Palabras prohibidas: {', '.join(tono.get('palabras_prohibidas', []))}
-
-Ejemplos buenos:
-{chr(10).join('- ' + ej for ej in tono.get('ejemplos_buenos', []))}
-
-Ejemplos malos:
-{chr(10).join('- ' + ej for ej in tono.get('ejemplos_malos', []))}
-"""
-            chunks.append({
-                "section": "tono_comunicacion",
-                "content": content.strip()
-            })
-        
-        # Chunk 3: Elementos Visuales
-        if "elementos_visuales" in manual:
-            visuales = manual["elementos_visuales"]
-            content = f"""
-ELEMENTOS VISUALES:
-Colores principales: {', '.join(visuales.get('colores_principales', []))}
-Colores secundarios: {', '.join(visuales.get('colores_secundarios', []))}
-Tipografía principal: {visuales.get('tipografia_principal', '')}
-Tipografía secundaria: {visuales.get('tipografia_secundaria', '')}
-Estilo fotográfico: {visuales.get('estilo_fotografico', '')}
-Iconografía: {visuales.get('iconografia', '')}
-
-Uso del logo:
-- Tamaño mínimo: {visuales.get('uso_logo', {}).get('tamano_minimo', '')}
-- Espaciado: {visuales.get('uso_logo', {}).get('espaciado', '')}
-- Fondos permitidos: {', '.join(visuales.get('uso_logo', {}).get('fondos_permitidos', []))}
-- Fondos prohibidos: {', '.join(visuales.get('uso_logo', {}).get('fondos_prohibidos', []))}
-"""
-            chunks.append({
-                "section": "elementos_visuales",
-                "content": content.strip()
-            })
-        
-        # Chunk 4: Público Objetivo
-        if "publico_objetivo" in manual:
-            publico = manual["publico_objetivo"]
-            demo = publico.get('demografia', {})
-            psico = publico.get('psicografia', {})
-            
-            content = f"""
-PÚBLICO OBJETIVO:
-
-Demografía:
-- Edad: {demo.get('edad', '')}
-- Género: {demo.get('genero', '')}
-- Ubicación: {demo.get('ubicacion', '')}
-- Nivel socioeconómico: {demo.get('nivel_socioeconomico', '')}
-
-Psicografía:
-- Intereses: {', '.join(psico.get('intereses', []))}
-- Valores: {', '.join(psico.get('valores', []))}
-- Estilo de vida: {psico.get('estilo_vida', '')}
-
-Pain Points: {', '.join(publico.get('pain_points', []))}
-Aspiraciones: {', '.join(publico.get('aspiraciones', []))}
-"""
-            chunks.append({
-                "section": "publico_objetivo",
-                "content": content.strip()
-            })
-        
-        # Chunk 5: Directrices de Contenido
-        if "directrices_contenido" in manual:
-            directrices = manual["directrices_contenido"]
-            content = f"""
-DIRECTRICES DE CONTENIDO:
-
-Palabras clave SEO: {', '.join(directrices.get('palabras_clave_seo', []))}
-Mensajes clave: {', '.join(directrices.get('mensajes_clave', []))}
-
-Tipos de contenido:
-{json.dumps(directrices.get('tipos_contenido', {}), indent=2, ensure_ascii=False)}
-"""
-            chunks.append({
-                "section": "directrices_contenido",
-                "content": content.strip()
-            })
+        return await _encode(texts, space)
         
-        # Chunk 6: Ejemplos de Aplicación
-        if "ejemplos_aplicacion" in manual:
-            ejemplos = manual["ejemplos_aplicacion"]
-            content = f"""
-EJEMPLOS DE APLICACIÓN:
-
-✅ Descripción de producto BUENA:
-{ejemplos.get('descripcion_producto_buena', '')}
+    except Exception as e:
+        raise Exception(f"Error al generar embeddings: {str(e)}")
 
-❌ Descripción de producto MALA:
-{ejemplos.get('descripcion_producto_mala', '')}
+def get_token_counter(space: str = None):
+    """
+    Contador de tokens del modelo de embeddings
 
-✅ Post en redes sociales BUENO:
-{ejemplos.get('post_redes_bueno', '')}
+    Con el servidor compartido el modelo no está en este proceso: se usa
+    el tokenizer exportado del modelo servido o, para el modelo por
+    defecto, una estimación calibrada para su WordPiece. Otros modelos sin
+    tokenizer local cargan el modelo para contar.
+    """
+    space = space or ACTIVE_SPACE
+    if _uses_server(space):
+        model_name = get_space(space)["model"]
+        counter = load_token_counter(model_name)
+        if counter is not None:
+            return counter
+        if model_name == DEFAULT_MODEL_NAME:
+            return estimate_tokens
+    return _get_embeddings_model(space).count_tokens
 
-❌ Post en redes sociales MALO:
-{ejemplos.get('post_redes_malo', '')}
-"""
-            chunks.append({
-                "section": "ejemplos_aplicacion",
-                "content": content.strip()
-            })
-        
-        return chunks
-        
+async def chunk_manual_content(manual: Dict[str, Any], space: str = None) -> List[Dict[str, Any]]:
+    """
+    Divide el manual de marca en chunks (fragmentos) semánticos
+    
+    Estrategia: cada sub-sección del esquema (services/chunking.py) es un
+    chunk, partido si supera CHUNK_MAX_TOKENS. Esto permite búsquedas más
+    precisas y evita que el modelo trunque secciones largas
+    
+    Args:
+        manual: El JSON completo del manual de marca
+    
+    Returns:
+        List[Dict]: Lista de chunks con su contenido y metadata
+    """
+    try:
+        return chunk_manual(manual, count_tokens=get_token_counter(space))
     except Exception as e:
         raise Exception(f"Error al crear chunks del manual: {str(e)}")
 
 @observe(name="process_manual_for_rag")
-async def process_manual_for_rag(manual_id: str, manual_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+async def process_manual_for_rag(
+    manual_id: str,
+    manual_data: Dict[str, Any],
+    existing_hashes: Optional[Set[str]] = None,
+    space: str = None
+) -> Dict[str, Any]:
     """
     Procesa un manual completo para RAG:
     1. Divide en chunks
-    2. Genera embeddings para cada chunk
+    2. Genera embeddings solo para los chunks nuevos o modificados
     3. Prepara para insertar en la base de datos
     
     Args:
         manual_id: UUID del manual en la base de datos
         manual_data: Contenido del manual (el JSON full_manual)
+        existing_hashes: content_hash de los chunks ya guardados (se reutilizan)
+        space: Espacio de embeddings destino (por defecto el activo)
     
     Returns:
-        List[Dict]: Lista de embeddings listos para guardar
+        Dict: "to_insert" (embeddings listos para guardar), "keep_hashes"
+        (hashes vigentes) y "chunks" (todos los chunks del manual)
     """
+    existing_hashes = existing_hashes or set()
+    
     try:
         # 1. Dividir en chunks
-        chunks = await chunk_manual_content(manual_data)
+        chunks = await chunk_manual_content(manual_data, space)
+        
+        # 2. Generar embeddings de los chunks nuevos en un solo lote
+        new_chunks = [chunk for chunk in chunks if chunk["content_hash"] not in existing_hashes]
+        vectors = await generate_embeddings([chunk["content"] for chunk in new_chunks], space)
         
-        # 2. Generar embeddings para cada chunk
         embeddings_to_save = []
         
-        for chunk in chunks:
-            # Generar embedding para el contenido del chunk
-            embedding_vector = await generate_embedding(chunk["content"])
-            
+        for chunk, embedding_vector in zip(new_chunks, vectors):
             # Preparar para guardar en DB
             embeddings_to_save.append({
                 "manual_id": manual_id,
                 "content": chunk["content"],
                 "section": chunk["section"],
-                "embedding": embedding_vector
+                "parent_section": chunk["parent_section"],
+                "chunk_index": chunk["chunk_index"],
+                "content_hash": chunk["content_hash"],
+                # Lista de floats o base64 compacto según VECTOR_TRANSPORT
+                **embedding_column(embedding_vector),
+                **space_column(space)
             })
         
-        return embeddings_to_save
+        return {
+            "to_insert": embeddings_to_save,
+            "keep_hashes": {chunk["content_hash"] for chunk in chunks},
+            "chunks": chunks
+        }
         
     except Exception as e:
         raise Exception(f"Error al procesar manual para RAG: {str(e)}")
 
+async def sync_manual_embeddings(
+    manual_id: str,
+    manual_data: Dict[str, Any],
+    supabase_client,
+    space: str = None
+) -> Dict[str, Any]:
+    """
+    Sincroniza los embeddings de un manual en un espacio: reutiliza los
+    chunks sin cambios, inserta los nuevos y borra los obsoletos
+    
+    Returns:
+        Dict: chunks_created, chunks_reused, sections y stored (filas
+        vigentes con id, manual_id, content y section)
+    """
+    space = space or ACTIVE_SPACE
+    table = lambda: supabase_client.table("brand_manual_embeddings")
+    # El cliente de Supabase es síncrono: cada llamada corre en un hilo para
+    # no bloquear el event loop (p. ej. durante un backfill de todo el catálogo)
+    
+    # 1. Chunks ya guardados: los que no cambiaron conservan su embedding
+    with stage_timer("db_fetch", table="brand_manual_embeddings"):
+        existing = await asyncio.to_thread(scope_to_space(
+            table().select("content_hash").eq("manual_id", manual_id), space
+        ).execute)
+    existing_hashes = {row["content_hash"] for row in existing.data if row.get("content_hash")}
+    
+    # 2. Procesar el manual y generar embeddings de los chunks nuevos
+    processed = await process_manual_for_rag(
+        manual_id=manual_id,
+        manual_data=manual_data,
+        existing_hashes=existing_hashes,
+        space=space
+    )
+    embeddings_data = processed["to_insert"]
+    keep_hashes = processed["keep_hashes"]
+    
+    # 3. Eliminar los chunks obsoletos (y los antiguos sin hash)
+    with stage_timer("delete", table="brand_manual_embeddings"):
+        stale = scope_to_space(table().delete().eq("manual_id", manual_id), space)
+        if keep_hashes:
+            stale = stale.or_(f"content_hash.is.null,content_hash.not.in.({','.join(sorted(keep_hashes))})")
+        await asyncio.to_thread(stale.execute)
+    
+    # 4. Guardar los nuevos embeddings en la base de datos
+    if embeddings_data:
+        with stage_timer("insert", table="brand_manual_embeddings"):
+            await asyncio.to_thread(table().insert(embeddings_data).execute)
+    
+    with stage_timer("db_fetch", table="brand_manual_embeddings"):
+        stored = await asyncio.to_thread(scope_to_space(
+            table().select("id, manual_id, content, section").eq("manual_id", manual_id), space
+        ).execute)
+    
+    return {
+        "space": space,
+        "chunks_created": len(embeddings_data),
+        "chunks_reused": len(processed["chunks"]) - len(embeddings_data),
+        "sections": [chunk["section"] for chunk in processed["chunks"]],
+        "stored": stored.data or []
+    }
+
+# Candidatos que aporta cada recuperador antes de la fusión híbrida
+HYBRID_CANDIDATES = int(os.getenv("RAG_HYBRID_CANDIDATES", "20"))
+
 @observe(name="rag_search")
+def _vector_search(query_vector: np.ndarray, manual_id: str, supabase_client,
+                   match_count: int, space: str) -> List[Dict[str, Any]]:
+    """Llamada al RPC de similitud coseno con el vector de la consulta"""
+    # Nota: Supabase con pgvector usa el operador <=> para distancia coseno
+    if uses_binary_transport():
+        rpc_name = 'match_brand_manual_embeddings_b64'
+        vector_param = {'query_embedding_b64': encode_vector(query_vector, VECTOR_TRANSPORT)}
+    else:
+        rpc_name = 'match_brand_manual_embeddings_space' if EMBEDDINGS_VERSIONED else 'match_brand_manual_embeddings'
+        vector_param = {'query_embedding': query_vector.tolist()}
+    if EMBEDDINGS_VERSIONED:
+        vector_param['match_space'] = space
+    
+    with stage_timer("vector_search"):
+        result = supabase_client.rpc(
+            rpc_name,
+            {
+                **vector_param,
+                'match_manual_id': manual_id,
+                'match_count': match_count
+            }
+        ).execute()
+    
+    return result.data or []
+
+
+async def _hybrid_rerank(query: str, vector_results: List[Dict[str, Any]], manual_id: str,
+                         supabase_client, match_count: int, top_k: int, space: str) -> List[Dict[str, Any]]:
+    """Búsqueda léxica (BM25) y fusión por ranking recíproco con los resultados vectoriales"""
+    from services.lexical_index import get_lexical_index, reciprocal_rank_fusion
+    
+    with stage_timer("lexical_search"):
+        # Sin índice en caché (o vencido) se reconstruye leyendo la tabla: en un hilo
+        index = await asyncio.to_thread(get_lexical_index, manual_id, supabase_client, space)
+        lexical_results = index.search(query, match_count)
+    
+    lexical_ranking = [
+        {**chunk, "lexical_score": score} for chunk, score in lexical_results
+    ]
+    fused = reciprocal_rank_fusion([vector_results, lexical_ranking])
+    
+    return [
+        {**chunk, "similarity": chunk.get("similarity"), "score": score}
+        for chunk, score in fused[:top_k]
+    ]
+
+
 async def search_similar_content(
     query: str,
     manual_id: str,
     supabase_client,
-    top_k: int = 3
+    top_k: int = 3,
+    mode: str = "vector",
+    space: str = None
 ) -> List[Dict[str, Any]]:
     """
     Búsqueda semántica en el manual de marca
@@ -251,29 +410,72 @@ async def search_similar_content(
         manual_id: UUID del manual a consultar
         supabase_client: Cliente de Supabase
         top_k: Número de resultados más relevantes a retornar
+        mode: "vector" (solo similitud coseno) o "hybrid" (BM25 + vector con RRF)
+        space: Espacio de embeddings a consultar (por defecto el activo)
     
     Returns:
         List[Dict]: Chunks más relevantes del manual
     """
+    space = space or ACTIVE_SPACE
+    
     try:
-        # 1. Generar embedding de la consulta
-        query_embedding = await generate_embedding(query)
+        match_count = max(top_k, HYBRID_CANDIDATES) if mode == "hybrid" else top_k
+        
+        # 1. Generar embedding de la consulta (array de NumPy)
+        with stage_timer("query_embed"):
+            query_vector = (await generate_embeddings([query], space))[0]
         
         # 2. Buscar en la base de datos usando similitud coseno
-        # Nota: Supabase con pgvector usa el operador <=> para distancia coseno
-        result = supabase_client.rpc(
-            'match_brand_manual_embeddings',
-            {
-                'query_embedding': query_embedding,
-                'match_manual_id': manual_id,
-                'match_count': top_k
-            }
-        ).execute()
+        vector_results = await asyncio.to_thread(
+            _vector_search, query_vector, manual_id, supabase_client, match_count, space
+        )
+        
+        if mode != "hybrid":
+            return vector_results
+        
+        # 3. Búsqueda léxica (BM25) y fusión por ranking recíproco
+        return await _hybrid_rerank(query, vector_results, manual_id, supabase_client, match_count, top_k, space)
+        
+    except Exception as e:
+        raise Exception(f"Error en búsqueda semántica: {str(e)}")
+
+
+async def search_similar_content_batch(
+    queries: List[str],
+    manual_id: str,
+    supabase_client,
+    top_k: int = 3,
+    mode: str = "vector",
+    space: str = None
+) -> List[List[Dict[str, Any]]]:
+    """
+    Varias búsquedas sobre el mismo manual: un solo batch de embeddings para
+    todas las consultas y las llamadas al RPC en paralelo
+    
+    Returns:
+        List[List[Dict]]: resultados por consulta, en el mismo orden
+    """
+    space = space or ACTIVE_SPACE
+    
+    try:
+        match_count = max(top_k, HYBRID_CANDIDATES) if mode == "hybrid" else top_k
+        
+        with stage_timer("query_embed"):
+            query_vectors = await generate_embeddings(queries, space)
+        
+        # El cliente de Supabase es síncrono: cada RPC en su propio hilo
+        vector_results = await asyncio.gather(*[
+            asyncio.to_thread(_vector_search, vector, manual_id, supabase_client, match_count, space)
+            for vector in query_vectors
+        ])
         
-        if not result.data:
-            return []
+        if mode != "hybrid":
+            return list(vector_results)
         
-        return result.data
+        return list(await asyncio.gather(*[
+            _hybrid_rerank(query, results, manual_id, supabase_client, match_count, top_k, space)
+            for query, results in zip(queries, vector_results)
+        ]))
         
     except Exception as e:
-        raise Exception(f"Error en búsqueda semántica: {str(e)}")
\ No newline at end of file
+        raise Exception(f"Error en búsqueda semántica: {str(e)}")
@@ -0,0 +1,124 @@
+"""
+Serialización rápida de filas de la base de datos (FAST_JSON_RESPONSES)
+
+Con response_model, FastAPI valida cada fila contra el modelo Pydantic
+(incluido todo el árbol arbitrario de full_manual) y luego la codifica con
+json de la stdlib. Para filas que vienen de Supabase esa validación no
+aporta nada y es el costo dominante en listas grandes.
+
+Con FAST_JSON_RESPONSES=true y orjson instalado:
+- Cada fila se proyecta sobre los campos del modelo, en su mismo orden.
+- Solo los campos datetime se normalizan (fromisoformat). Así la salida es
+  byte a byte la de Pydantic: "Z" para UTC y microsegundos en 6 dígitos.
+- El resto (full_manual, UUIDs, textos) pasa tal cual a orjson.
+
+La única diferencia conocida es el formato de floats con exponente (1e16
+vs 1e+16), que representa el mismo valor. Si orjson no puede codificar
+algo (p. ej. un entero de más de 64 bits) se usa la ruta Pydantic. La
+equivalencia se verifica en tests/test_fast_json.py y el throughput con
+scripts/benchmark_serialization.py.
+"""
+import os
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple, Type, Union, get_args
+
+from pydantic import BaseModel, TypeAdapter
+
+from services.metrics_service import register_counter, inc_counter
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+FAST_JSON_RESPONSES = os.getenv("FAST_JSON_RESPONSES", "false").lower() == "true"
+
+register_counter("fast_json_fallback_total", "Respuestas que volvieron a la serialización Pydantic")
+
+
+def fast_path_enabled() -> bool:
+    return FAST_JSON_RESPONSES and orjson is not None
+
+
+@lru_cache(maxsize=None)
+def _model_layout(model: Type[BaseModel]) -> Tuple[Tuple[str, ...], frozenset]:
+    """Campos del modelo (en orden) y cuáles son datetime"""
+    fields = tuple(model.model_fields)
+    datetime_fields = frozenset(
+        name for name, info in model.model_fields.items()
+        if info.annotation is datetime or datetime in get_args(info.annotation)
+    )
+    return fields, datetime_fields
+
+
+@lru_cache(maxsize=None)
+def _adapter(model: Type[BaseModel], many: bool) -> TypeAdapter:
+    return TypeAdapter(List[model] if many else model)
+
+
+def _parse_datetime(value: Any) -> Any:
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            return value
+    return value
+
+
+def project_row(row: Dict[str, Any], model: Type[BaseModel]) -> Dict[str, Any]:
+    """Fila con los campos del modelo, sin validar el resto"""
+    fields, datetime_fields = _model_layout(model)
+    return {
+        name: _parse_datetime(row.get(name)) if name in datetime_fields else row.get(name)
+        for name in fields
+    }
+
+
+def serialize_validated(data: Union[Dict[str, Any], List[Dict[str, Any]]],
+                        model: Type[BaseModel], many: bool = False) -> bytes:
+    """Ruta de referencia: la misma validación y salida que response_model"""
+    adapter = _adapter(model, many)
+    return adapter.dump_json(adapter.validate_python(data))
+
+
+def serialize_fast(data: Union[Dict[str, Any], List[Dict[str, Any]]],
+                   model: Type[BaseModel], many: bool = False) -> bytes:
+    """Ruta rápida: proyección + orjson (requiere orjson)"""
+    if many:
+        payload = [project_row(row, model) for row in data]
+    else:
+        payload = project_row(data, model)
+    return orjson.dumps(payload, option=orjson.OPT_UTC_Z)
+
+
+def serialize_rows(data: Union[Dict[str, Any], List[Dict[str, Any]]],
+                   model: Type[BaseModel], many: bool = False) -> bytes:
+    """
+    Serializa filas de la base de datos según el modelo de respuesta,
+    por la ruta rápida si está activada
+    """
+    if fast_path_enabled():
+        try:
+            return serialize_fast(data, model, many)
+        except (orjson.JSONEncodeError, TypeError):
+            inc_counter("fast_json_fallback_total", labels={"model": model.__name__})
+    return serialize_validated(data, model, many)
+
+
+def json_response(data: Any, status_code: int = 200,
+                  headers: Optional[Dict[str, str]] = None) -> Any:
+    """
+    Respuesta para endpoints sin response_model: con la ruta rápida se
+    codifica con orjson; si no, se retorna data y FastAPI la codifica como
+    siempre
+    """
+    if not fast_path_enabled():
+        return data
+    from fastapi import Response
+    try:
+        body = orjson.dumps(data, option=orjson.OPT_UTC_Z)
+    except (orjson.JSONEncodeError, TypeError):
+        inc_counter("fast_json_fallback_total", labels={"model": "raw"})
+        return data
+    return Response(content=body, status_code=status_code, media_type="application/json", headers=headers)
@@ -1,41 +1,78 @@
-import google.generativeai as genai
 from dotenv import load_dotenv
 import os
-from PIL import Image
 import io
+import threading
 import json
-from langfuse import observe
+import time
+import asyncio
+from typing import Any, Dict, List, Optional
+from config.langfuse_config import observe
 import base64
+from services.metrics_service import stage_timer, record_llm_call
+from services.color_analysis import analyze_image_colors, describe_color_analysis, image_dominant_colors
+from services.admission_control import admission, AdmissionRejected
+from services.model_router import choose_model, record_model_call
+from services.token_counter import estimate_llm_tokens
 
 load_dotenv()
 
-# Configurar Gemini
-genai.configure(api_key=os.getenv("GOOGLE_AI_KEY"))
+# El SDK de Gemini (y grpc) se importa y configura en el primer uso
+_genai = None
+_genai_lock = threading.Lock()
+
+
+def get_genai():
+    """Retorna el módulo google.generativeai ya configurado"""
+    global _genai
+    if _genai is None:
+        with _genai_lock:
+            if _genai is None:
+                import google.generativeai as genai
+                genai.configure(api_key=os.getenv("GOOGLE_AI_KEY"))
+                _genai = genai
+    return _genai
 
 # MODELO CORRECTO - De tu lista disponible
+# (con MODEL_ROUTING=true services/model_router.py puede degradar a uno más rápido)
 VISION_MODEL = "gemini-2.0-flash"  
 
-@observe(name="multimodal_audit")
-async def audit_image_against_brand_manual(
-    image_bytes: bytes,
-    manual_content: dict,
-    brand_name: str
-) -> dict:
+# Auditoría por niveles: un pre-filtro barato (imagen reducida + prompt corto)
+# decide los casos claros y solo los dudosos pasan a la auditoría completa
+AUDIT_TIERED = os.getenv("AUDIT_TIERED", "false").lower() == "true"
+AUDIT_THRESHOLD = float(os.getenv("AUDIT_THRESHOLD", "72"))
+# Distancia mínima al umbral para aceptar la decisión del pre-filtro
+AUDIT_ESCALATION_MARGIN = float(os.getenv("AUDIT_ESCALATION_MARGIN", "15"))
+# Confianza mínima del pre-filtro para no escalar
+AUDIT_MIN_CONFIDENCE = float(os.getenv("AUDIT_MIN_CONFIDENCE", "0.85"))
+# Lado máximo (px) de la imagen enviada al pre-filtro
+AUDIT_PRESCREEN_MAX_SIDE = int(os.getenv("AUDIT_PRESCREEN_MAX_SIDE", "384"))
+
+# Análisis local de la paleta (NumPy) antes de llamar a Gemini
+AUDIT_COLOR_CHECK = os.getenv("AUDIT_COLOR_CHECK", "true").lower() == "true"
+# Score de color (0-100) bajo el cual se rechaza sin llamar a Gemini (0 = desactivado)
+AUDIT_COLOR_FAIL_BELOW = float(os.getenv("AUDIT_COLOR_FAIL_BELOW", "0"))
+
+def _color_prompt_section(color_context: str) -> str:
+    if not color_context:
+        return ""
+    return f"""
+=== ANÁLISIS LOCAL DE COLOR (medido sobre la imagen) ===
+{color_context}
+Usa esta medición como referencia objetiva para la categoría colores.
+"""
+
+
+def _build_full_audit_prompt(manual_content: dict, brand_name: str, color_context: str = "") -> str:
     """
-    Audita una imagen contra el manual de marca usando Gemini Vision
+    Prompt de la auditoría completa (5 categorías ponderadas)
     """
+    # Construir el manual como texto COMPLETO Y DETALLADO
+    elementos_visuales = manual_content.get('elementos_visuales', {})
+    tono = manual_content.get('tono_comunicacion', {})
+    uso_logo = elementos_visuales.get('uso_logo', {})
+    identidad = manual_content.get('identidad_marca', {})
     
-    try:
-        # Cargar imagen con PIL
-        image = Image.open(io.BytesIO(image_bytes))
-        
-        # Construir el manual como texto COMPLETO Y DETALLADO
-        elementos_visuales = manual_content.get('elementos_visuales', {})
-        tono = manual_content.get('tono_comunicacion', {})
-        uso_logo = elementos_visuales.get('uso_logo', {})
-        identidad = manual_content.get('identidad_marca', {})
-        
-        manual_text = f"""
+    manual_text = f"""
 MANUAL DE MARCA - {brand_name}
 
 === IDENTIDAD DE MARCA ===
@@ -71,9 +108,9 @@ Personalidad: {identidad.get('personalidad', 'No especificado')}
 Palabras permitidas: {tono.get('palabras_permitidas', 'No especificado')}
 Palabras prohibidas: {tono.get('palabras_prohibidas', 'No especificado')}
 """
-        
-        # Prompt para Gemini Vision - AUDITORÍA ESTRICTA EN ESPAÑOL
-        prompt = f"""Eres un auditor PROFESIONAL de identidad de marca. Tu trabajo es analizar esta imagen y determinar si cumple con el manual de marca.
+    
+    # Prompt para Gemini Vision - AUDITORÍA ESTRICTA EN ESPAÑOL
+    prompt = f"""Eres un auditor PROFESIONAL de identidad de marca. Tu trabajo es analizar esta imagen y determinar si cumple con el manual de marca.
 
 {manual_text}
 
@@ -154,64 +191,350 @@ RESPONDE EN FORMATO JSON EXACTO (sin markdown, sin código, TODO EN ESPAÑOL):
 - ELEMENTOS: Estricto en obligatorios/prohibidos
 - El objetivo es evaluar si la imagen COMUNICA la marca correctamente, no si es pixel-perfect
 """
-        
-        # Llamar a Gemini Vision usando la API correcta
-        model = genai.GenerativeModel(VISION_MODEL)
-        
-        response = model.generate_content([
-            prompt,
-            image
-        ])
-        
-        # Parsear respuesta
-        response_text = response.text.strip()
-        
-        # Limpiar markdown si existe
-        if response_text.startswith("```json"):
-            response_text = response_text[7:]
-        if response_text.startswith("```"):
-            response_text = response_text[3:]
-        if response_text.endswith("```"):
-            response_text = response_text[:-3]
-        response_text = response_text.strip()
-        
-        # Intentar parsear JSON
+
+    return prompt + _color_prompt_section(color_context)
+
+
+# Tokens que reserva cada imagen y la respuesta en el control de admisión
+GEMINI_IMAGE_TOKENS = 258
+GEMINI_RESPONSE_TOKENS = 1024
+
+
+def _estimate_call_tokens(parts: list) -> int:
+    tokens = GEMINI_RESPONSE_TOKENS
+    for part in parts:
+        tokens += estimate_llm_tokens(part) if isinstance(part, str) else GEMINI_IMAGE_TOKENS
+    return tokens
+
+
+async def _call_gemini(parts: list, task: str = "audit"):
+    """
+    Llama a Gemini en un hilo (el SDK es síncrono) y registra métricas
+    
+    Returns:
+        (response, nombre del modelo usado)
+    """
+    model_name = choose_model("gemini", task)
+    model = get_genai().GenerativeModel(model_name)
+    
+    async with admission("gemini", _estimate_call_tokens(parts)) as ticket:
+        start = time.perf_counter()
         try:
+            with stage_timer("llm_call", provider="gemini"):
+                response = await asyncio.to_thread(model.generate_content, parts)
+        except Exception:
+            record_model_call(model_name, time.perf_counter() - start, ok=False)
+            raise
+        usage = getattr(response, "usage_metadata", None)
+        ticket.used(getattr(usage, "total_token_count", None))
+    duration = time.perf_counter() - start
+    record_model_call(model_name, duration)
+    record_llm_call(
+        provider="gemini",
+        model=model_name,
+        duration=duration,
+        prompt_tokens=getattr(usage, "prompt_token_count", None),
+        completion_tokens=getattr(usage, "candidates_token_count", None)
+    )
+    return response, model_name
+
+
+def _parse_audit_response(response_text: str) -> dict:
+    """
+    Parsea la respuesta JSON de Gemini y completa la estructura mínima
+    """
+    response_text = response_text.strip()
+    
+    # Limpiar markdown si existe
+    if response_text.startswith("```json"):
+        response_text = response_text[7:]
+    if response_text.startswith("```"):
+        response_text = response_text[3:]
+    if response_text.endswith("```"):
+        response_text = response_text[:-3]
+    response_text = response_text.strip()
+    
+    # Intentar parsear JSON
+    try:
+        with stage_timer("json_parse"):
             result = json.loads(response_text)
-        except json.JSONDecodeError:
-            # Si falla, crear estructura básica con el análisis en texto
-            result = {
-                "compliant": False,
-                "score": 50,
-                "issues": ["No se pudo parsear respuesta estructurada"],
-                "recommendations": ["Verificar formato de imagen"],
-                "analysis": response_text
-            }
-        
-        # Validar y completar estructura
-        if "compliant" not in result:
-            result["compliant"] = False
-        if "score" not in result:
-            result["score"] = 0
-        if "issues" not in result or not isinstance(result["issues"], list):
-            result["issues"] = []
-        if "recommendations" not in result or not isinstance(result["recommendations"], list):
-            result["recommendations"] = []
-        if "analysis" not in result:
-            result["analysis"] = "Análisis no disponible"
-        
-        return result
-        
+    except json.JSONDecodeError:
+        # Si falla, crear estructura básica con el análisis en texto
+        result = {
+            "compliant": False,
+            "score": 50,
+            "issues": ["No se pudo parsear respuesta estructurada"],
+            "recommendations": ["Verificar formato de imagen"],
+            "analysis": response_text
+        }
+    
+    # Validar y completar estructura
+    if "compliant" not in result:
+        result["compliant"] = False
+    if "score" not in result:
+        result["score"] = 0
+    if "issues" not in result or not isinstance(result["issues"], list):
+        result["issues"] = []
+    if "recommendations" not in result or not isinstance(result["recommendations"], list):
+        result["recommendations"] = []
+    if "analysis" not in result:
+        result["analysis"] = "Análisis no disponible"
+    
+    return result
+
+
+async def _full_audit(image_part, manual_content: dict, brand_name: str, color_context: str = "") -> dict:
+    """Auditoría completa con la imagen original"""
+    response, model = await _call_gemini(
+        [_build_full_audit_prompt(manual_content, brand_name, color_context), image_part], task="audit"
+    )
+    return {**_parse_audit_response(response.text), "model_used": model}
+
+
+def _build_prescreen_prompt(manual_content: dict, brand_name: str, color_context: str = "") -> str:
+    """
+    Prompt corto del pre-filtro: solo las reglas que más pesan en el score
+    """
+    elementos_visuales = manual_content.get('elementos_visuales', {})
+    uso_logo = elementos_visuales.get('uso_logo', {})
+    
+    return f"""Eres un auditor de marca. Evalúa RÁPIDAMENTE si esta imagen cumple el manual de {brand_name}.
+
+Reglas clave:
+- Colores principales: {elementos_visuales.get('colores_principales', 'No especificado')}
+- Colores secundarios: {elementos_visuales.get('colores_secundarios', 'No especificado')}
+- Logo: posiciones {uso_logo.get('posicion_permitida', 'No especificado')}, tamaño mínimo {uso_logo.get('tamano_minimo', 'No especificado')}
+- Estilo fotográfico: {elementos_visuales.get('estilo_fotografico', 'No especificado')}
+- Elementos obligatorios: {elementos_visuales.get('elementos_obligatorios', 'No especificado')}
+- Elementos prohibidos: {elementos_visuales.get('elementos_prohibidos', 'No especificado')}
+
+Pesos: colores 25, logo 30, estilo 20, elementos 15, tipografía 10. Aprueba con score >= {AUDIT_THRESHOLD:.0f}.
+"confidence" (0-1) indica qué tan seguro estás; usa valores bajos si la imagen es ambigua o el score está cerca del umbral.
+
+Responde SOLO JSON (en español):
+{{"compliant": boolean, "score": number, "confidence": number, "issues": ["string"], "recommendations": ["string"], "analysis": "string breve"}}
+""" + _color_prompt_section(color_context)
+
+
+async def _prescreen_audit(small_part, manual_content: dict, brand_name: str, color_context: str = "") -> dict:
+    """Pre-filtro con imagen reducida y prompt corto"""
+    response, model = await _call_gemini(
+        [_build_prescreen_prompt(manual_content, brand_name, color_context), small_part], task="prescreen"
+    )
+    result = {**_parse_audit_response(response.text), "model_used": model}
+    try:
+        result["confidence"] = float(result.get("confidence", 0))
+    except (TypeError, ValueError):
+        result["confidence"] = 0.0
+    return result
+
+
+def _is_clear_decision(result: dict) -> bool:
+    """El pre-filtro decide solo si está lejos del umbral y con alta confianza"""
+    try:
+        score = float(result["score"])
+    except (TypeError, ValueError):
+        return False
+    return (
+        result.get("confidence", 0) >= AUDIT_MIN_CONFIDENCE
+        and abs(score - AUDIT_THRESHOLD) >= AUDIT_ESCALATION_MARGIN
+    )
+
+
+def _color_rejection(color: dict) -> dict:
+    """Resultado cuando la paleta descarta la imagen sin consultar a Gemini"""
+    missing = ", ".join(color["primary_missing"]) or "ninguno"
+    return {
+        "compliant": False,
+        # Misma escala 0-100 que las auditorías de Gemini; los puntos de la
+        # categoría (sobre 25) van solo en category_scores
+        "score": color["score"],
+        "issues": [
+            f"La imagen no usa la paleta del manual (score de color {color['score']}/100)",
+            f"Colores principales ausentes: {missing}"
+        ],
+        "recommendations": ["Usar los colores principales del manual como colores dominantes de la pieza"],
+        "analysis": "Rechazada por el análisis local de color; no se evaluaron las demás categorías.\n"
+                    + describe_color_analysis(color),
+        "category_scores": {"colors": color["category_points"]}
+    }
+
+
+def _tier_summary(tier: str, result: dict, latency: float, escalated: bool) -> dict:
+    return {
+        "tier": tier,
+        "score": result.get("score"),
+        "compliant": result.get("compliant"),
+        "confidence": result.get("confidence"),
+        "latency_ms": round(latency * 1000, 1),
+        "escalated": escalated,
+        "model": result.get("model_used")
+    }
+
+
+# Formatos que Gemini recibe tal cual (sin volver a codificar la imagen)
+GEMINI_IMAGE_MIME_TYPES = {"image/png", "image/jpeg", "image/webp", "image/heic", "image/heif"}
+
+
+def _blob(data: bytes, mime_type: str) -> dict:
+    return {"mime_type": mime_type, "data": data}
+
+
+def prepare_audit_image(image_bytes: bytes, tiered: bool) -> Dict[str, Any]:
+    """
+    Decodifica y pre-procesa una imagen una sola vez para todas sus auditorías
+
+    - full_part: los bytes originales (el SDK no vuelve a codificar la imagen
+      en cada llamada) o la imagen PIL si el formato no es soportado
+    - prescreen_part: miniatura JPEG para el pre-filtro (solo si tiered)
+    - dominant: colores dominantes para el análisis de color de cada manual
+    """
+    from PIL import Image
+    
+    # Cargar imagen con PIL
+    image = Image.open(io.BytesIO(image_bytes))
+    image.load()
+    
+    mime_type = Image.MIME.get(image.format or "")
+    prepared = {
+        "image": image,
+        "full_part": _blob(image_bytes, mime_type) if mime_type in GEMINI_IMAGE_MIME_TYPES else image,
+        "prescreen_part": None,
+        "dominant": None,
+    }
+    
+    if tiered:
+        small = image.convert("RGB")
+        small.thumbnail((AUDIT_PRESCREEN_MAX_SIDE, AUDIT_PRESCREEN_MAX_SIDE))
+        buffer = io.BytesIO()
+        small.save(buffer, format="JPEG", quality=85)
+        prepared["prescreen_part"] = _blob(buffer.getvalue(), "image/jpeg")
+    
+    if AUDIT_COLOR_CHECK:
+        with stage_timer("color_analysis", step="dominant_colors"):
+            prepared["dominant"] = image_dominant_colors(image)
+    
+    return prepared
+
+
+async def _audit_prepared(prepared: Dict[str, Any], manual_content: dict, brand_name: str, tiered: bool) -> dict:
+    """Auditoría de una imagen ya preparada contra un manual"""
+    tiers = []
+    color = None
+    color_context = ""
+    
+    if AUDIT_COLOR_CHECK:
+        start = time.perf_counter()
+        with stage_timer("color_analysis"):
+            color = await asyncio.to_thread(
+                analyze_image_colors, prepared["image"], manual_content, prepared["dominant"]
+            )
+        if color is not None:
+            rejected = color["score"] < AUDIT_COLOR_FAIL_BELOW
+            tiers.append({
+                "tier": "local_color",
+                "score": color["score"],
+                "compliant": False if rejected else None,
+                "confidence": None,
+                "latency_ms": round((time.perf_counter() - start) * 1000, 1),
+                "escalated": not rejected
+            })
+            if rejected:
+                return {**_color_rejection(color), "color_analysis": color,
+                        "tier_used": "local_color", "tiers": tiers}
+            color_context = describe_color_analysis(color)
+    
+    if tiered:
+        start = time.perf_counter()
+        prescreen = await _prescreen_audit(prepared["prescreen_part"], manual_content, brand_name, color_context)
+        clear = _is_clear_decision(prescreen)
+        tiers.append(_tier_summary("prescreen", prescreen, time.perf_counter() - start, not clear))
+        if clear:
+            prescreen["compliant"] = float(prescreen["score"]) >= AUDIT_THRESHOLD
+            return {**prescreen, "color_analysis": color, "tier_used": "prescreen", "tiers": tiers}
+    
+    start = time.perf_counter()
+    result = await _full_audit(prepared["full_part"], manual_content, brand_name, color_context)
+    tiers.append(_tier_summary("full", result, time.perf_counter() - start, False))
+    
+    return {**result, "color_analysis": color, "tier_used": "full", "tiers": tiers}
+
+
+@observe(name="multimodal_audit")
+async def audit_image_against_brand_manual(
+    image_bytes: bytes,
+    manual_content: dict,
+    brand_name: str,
+    tiered: Optional[bool] = None
+) -> dict:
+    """
+    Audita una imagen contra el manual de marca usando Gemini Vision
+    
+    Con tiered=True (o AUDIT_TIERED) corre primero un pre-filtro barato y
+    solo escala a la auditoría completa si el resultado es dudoso: score a
+    menos de AUDIT_ESCALATION_MARGIN del umbral o confianza baja.
+    
+    Antes de Gemini se mide la paleta localmente (AUDIT_COLOR_CHECK); la
+    medición se agrega al prompt y, con AUDIT_COLOR_FAIL_BELOW, rechaza sin
+    llamar al modelo las imágenes que claramente no usan los colores.
+    """
+    tiered = AUDIT_TIERED if tiered is None else tiered
+    
+    try:
+        # Decodificar y reducir la imagen es CPU: fuera del event loop
+        prepared = await asyncio.to_thread(prepare_audit_image, image_bytes, tiered)
+        return await _audit_prepared(prepared, manual_content, brand_name, tiered)
+    except AdmissionRejected:
+        raise
     except Exception as e:
         raise Exception(f"Error en auditoría con Gemini: {str(e)}")
 
 
+@observe(name="multimodal_audit_multi")
+async def audit_image_against_brand_manuals(
+    image_bytes: bytes,
+    manuals: List[Dict[str, Any]],
+    tiered: Optional[bool] = None
+) -> List[Any]:
+    """
+    Audita una imagen contra varios manuales (piezas co-branded)
+    
+    La imagen se decodifica, reduce y analiza en color una sola vez; las
+    auditorías por manual corren en paralelo.
+    
+    Args:
+        manuals: filas de brand_manuals (name y full_manual)
+    
+    Returns:
+        Un resultado por manual, en el mismo orden; si la auditoría de un
+        manual falla, su posición contiene la excepción
+    """
+    tiered = AUDIT_TIERED if tiered is None else tiered
+    
+    try:
+        prepared = await asyncio.to_thread(prepare_audit_image, image_bytes, tiered)
+    except AdmissionRejected:
+        raise
+    except Exception as e:
+        raise Exception(f"Error en auditoría con Gemini: {str(e)}")
+    
+    async def audit_one(manual: Dict[str, Any]) -> dict:
+        try:
+            return await _audit_prepared(prepared, manual["full_manual"], manual["name"], tiered)
+        except AdmissionRejected:
+            raise
+        except Exception as e:
+            raise Exception(f"Error en auditoría con Gemini: {str(e)}")
+    
+    return await asyncio.gather(*[audit_one(m) for m in manuals], return_exceptions=True)
+
+
 async def test_gemini_connection() -> dict:
     """
     Prueba la conexión con Google Gemini
     """
     try:
-        model = genai.GenerativeModel(VISION_MODEL)
+        model = get_genai().GenerativeModel(VISION_MODEL)
         response = model.generate_content("Responde solo con la palabra: OK")
         
         return {
@@ -0,0 +1,552 @@
+"""
+Búsqueda semántica global (todos los manuales) con un índice ANN
+
+Los RPC match_brand_manual_embeddings* siempre filtran por un manual. Para
+preguntas sobre el catálogo ("¿qué marcas ya usan este claim o este
+tono?") hay dos backends (GLOBAL_SEARCH_BACKEND):
+
+- local: índice IVF en memoria (NumPy) sobre todos los chunks del espacio
+  activo. Los vectores se agrupan con k-means en ~4·√N listas y cada
+  consulta solo compara contra las GLOBAL_INDEX_NPROBE listas más cercanas.
+  Con menos de GLOBAL_INDEX_MIN_TRAIN chunks la búsqueda es exacta.
+  Se carga desde Supabase en la primera consulta y se actualiza de forma
+  incremental al regenerar embeddings o borrar un manual; con muchas
+  altas o bajas se vuelve a entrenar.
+- pgvector: RPC match_embeddings_global sobre un índice HNSW (migración 6
+  de docs/SUPABASE_RAG_SETUP.sql). No ocupa memoria en el proceso y
+  siempre está al día, útil con varios workers.
+
+Filtros: section (la sección o cualquiera de sus sub-secciones),
+product_type del manual y manuales a excluir. Con filtros muy selectivos
+el índice local compara en forma exacta contra las filas que pasan el
+filtro; si no, filtra los candidatos y amplía las listas visitadas hasta
+juntar top_k.
+
+El recall frente a la búsqueda exacta se mide con
+scripts/benchmark_global_search.py.
+"""
+import asyncio
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from services.embedding_spaces import ACTIVE_SPACE, scope_to_space
+from services.metrics_service import register_counter, inc_counter, stage_timer
+from services.vector_codec import parse_vector
+
+GLOBAL_SEARCH_BACKEND = os.getenv("GLOBAL_SEARCH_BACKEND", "local").lower()
+GLOBAL_SEARCH_RPC = os.getenv("GLOBAL_SEARCH_RPC", "match_embeddings_global")
+
+# Listas IVF (0 = automático, ~4·√N)
+GLOBAL_INDEX_LISTS = int(os.getenv("GLOBAL_INDEX_LISTS", "0"))
+# Listas visitadas por consulta
+GLOBAL_INDEX_NPROBE = int(os.getenv("GLOBAL_INDEX_NPROBE", "16"))
+# Por debajo de este número de chunks no se entrena (búsqueda exacta)
+GLOBAL_INDEX_MIN_TRAIN = int(os.getenv("GLOBAL_INDEX_MIN_TRAIN", "2048"))
+# Con filtros que dejan menos filas que esto se compara en forma exacta
+GLOBAL_INDEX_EXACT_BELOW = int(os.getenv("GLOBAL_INDEX_EXACT_BELOW", "4096"))
+# Antigüedad máxima del índice local en segundos (0 = sin límite); con
+# varios workers, cada uno solo ve las altas que procesó él mismo
+GLOBAL_INDEX_MAX_AGE = float(os.getenv("GLOBAL_INDEX_MAX_AGE", "0"))
+
+KMEANS_ITERATIONS = 10
+# Filas por bloque al asignar vectores a listas (acota la matriz N × listas)
+ASSIGN_BLOCK = 8192
+
+register_counter("global_search_total", "Búsquedas globales por backend y plan (ivf / exact)")
+
+
+class IVFIndex:
+    """
+    Índice IVF (inverted file) de producto interno sobre vectores
+    normalizados, con metadatos por chunk y altas / bajas incrementales
+    """
+
+    def __init__(self, dimension: int, nlist: int = None, seed: int = 0):
+        self.dimension = dimension
+        self.nlist = nlist or GLOBAL_INDEX_LISTS
+        self.seed = seed
+        self._size = 0
+        self._vectors = np.empty((0, dimension), dtype=np.float32)
+        self._alive = np.empty(0, dtype=bool)
+        self._list_of = np.empty(0, dtype=np.int32)
+        self._section = np.empty(0, dtype=np.int32)
+        self._manual = np.empty(0, dtype=np.int32)
+        self._chunks: List[Dict[str, Any]] = []
+        self._positions: Dict[str, int] = {}
+        self._manual_rows: Dict[str, List[int]] = {}
+        self._dead = 0
+        # Vocabularios de metadatos (texto → código entero)
+        self._sections: Dict[str, int] = {}
+        self._manual_codes: Dict[str, int] = {}
+        self._manual_meta: List[Dict[str, Any]] = []
+        self._product_types: Dict[str, int] = {}
+        self._manual_ptype = np.empty(0, dtype=np.int32)
+        # IVF
+        self.centroids: Optional[np.ndarray] = None
+        self._lists: List[List[int]] = []
+        self._list_arrays: Dict[int, np.ndarray] = {}
+        self._trained_size = 0
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return self._size - self._dead
+
+    # --- metadatos ---
+
+    def _code(self, vocab: Dict[str, int], value: Optional[str]) -> int:
+        value = value or ""
+        if value not in vocab:
+            vocab[value] = len(vocab)
+        return vocab[value]
+
+    def set_manual(self, manual_id: str, name: Optional[str] = None, product_type: Optional[str] = None):
+        """Registra o actualiza nombre y product_type de un manual"""
+        with self._lock:
+            manual_id = str(manual_id)
+            ptype = self._code(self._product_types, product_type)
+            if manual_id not in self._manual_codes:
+                self._manual_codes[manual_id] = len(self._manual_meta)
+                self._manual_meta.append({})
+                self._manual_ptype = np.append(self._manual_ptype, np.int32(ptype))
+            code = self._manual_codes[manual_id]
+            meta = self._manual_meta[code]
+            if name is not None:
+                meta["name"] = name
+            if product_type is not None or "product_type" not in meta:
+                meta["product_type"] = product_type
+                self._manual_ptype[code] = ptype
+
+    # --- altas y bajas ---
+
+    def _reserve(self, extra: int):
+        needed = self._size + extra
+        capacity = len(self._vectors)
+        if needed <= capacity:
+            return
+        capacity = max(needed, capacity * 2, 1024)
+        grow = capacity - len(self._vectors)
+        self._vectors = np.vstack([self._vectors, np.zeros((grow, self.dimension), dtype=np.float32)])
+        self._alive = np.concatenate([self._alive, np.zeros(grow, dtype=bool)])
+        self._list_of = np.concatenate([self._list_of, np.full(grow, -1, dtype=np.int32)])
+        self._section = np.concatenate([self._section, np.zeros(grow, dtype=np.int32)])
+        self._manual = np.concatenate([self._manual, np.zeros(grow, dtype=np.int32)])
+
+    def add(self, chunks: List[Dict[str, Any]], vectors: np.ndarray):
+        """
+        Agrega chunks (id, manual_id, content, section) con sus vectores;
+        un id existente se reemplaza
+        """
+        if not chunks:
+            return
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(chunks), self.dimension)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+
+        with self._lock:
+            self.remove_ids([str(chunk["id"]) for chunk in chunks])
+            self._reserve(len(chunks))
+            start, end = self._size, self._size + len(chunks)
+            self._vectors[start:end] = vectors
+            self._alive[start:end] = True
+            for offset, chunk in enumerate(chunks):
+                position = start + offset
+                manual_id = str(chunk["manual_id"])
+                if manual_id not in self._manual_codes:
+                    self.set_manual(manual_id)
+                self._positions[str(chunk["id"])] = position
+                self._manual_rows.setdefault(manual_id, []).append(position)
+                self._section[position] = self._code(self._sections, chunk.get("section"))
+                self._manual[position] = self._manual_codes[manual_id]
+                self._chunks.append({
+                    "id": str(chunk["id"]),
+                    "manual_id": manual_id,
+                    "content": chunk.get("content"),
+                    "section": chunk.get("section"),
+                })
+            self._size = end
+
+            if self.centroids is not None:
+                self._assign(start, end)
+            self._maybe_retrain()
+
+    def remove_ids(self, ids: Iterable[str]):
+        with self._lock:
+            for chunk_id in ids:
+                position = self._positions.pop(str(chunk_id), None)
+                if position is None or not self._alive[position]:
+                    continue
+                self._alive[position] = False
+                self._dead += 1
+                manual_rows = self._manual_rows.get(self._chunks[position]["manual_id"])
+                if manual_rows:
+                    manual_rows.remove(position)
+
+    def remove_manual(self, manual_id: str):
+        """Baja de todos los chunks de un manual"""
+        with self._lock:
+            positions = self._manual_rows.pop(str(manual_id), [])
+            self.remove_ids([self._chunks[p]["id"] for p in positions])
+
+    def replace_manual(self, manual_id: str, chunks: List[Dict[str, Any]], vectors: np.ndarray):
+        with self._lock:
+            self.remove_manual(manual_id)
+            self.add(chunks, vectors)
+
+    # --- entrenamiento ---
+
+    def _maybe_retrain(self):
+        live = len(self)
+        if self.centroids is None:
+            if live >= GLOBAL_INDEX_MIN_TRAIN:
+                self.train()
+            return
+        # Muchas bajas o el índice creció mucho desde el último k-means
+        if self._dead > 0.3 * self._size or live > 2 * self._trained_size:
+            self.train()
+
+    def _compact(self):
+        """Descarta las filas dadas de baja"""
+        keep = np.flatnonzero(self._alive[:self._size])
+        self._vectors = self._vectors[keep]
+        self._alive = np.ones(len(keep), dtype=bool)
+        self._list_of = self._list_of[keep]
+        self._section = self._section[keep]
+        self._manual = self._manual[keep]
+        self._chunks = [self._chunks[p] for p in keep]
+        self._positions = {chunk["id"]: p for p, chunk in enumerate(self._chunks)}
+        self._manual_rows = {}
+        for position, chunk in enumerate(self._chunks):
+            self._manual_rows.setdefault(chunk["manual_id"], []).append(position)
+        self._size = len(keep)
+        self._dead = 0
+
+    def train(self):
+        """k-means esférico sobre las filas vigentes y reasignación de todas"""
+        with self._lock:
+            self._compact()
+            data = self._vectors[:self._size]
+            if self._size < GLOBAL_INDEX_MIN_TRAIN:
+                self.centroids = None
+                self._lists, self._list_arrays = [], {}
+                return
+            nlist = self.nlist or max(16, int(4 * np.sqrt(self._size)))
+            nlist = min(nlist, self._size // 8)
+            rng = np.random.default_rng(self.seed)
+            sample = data[rng.choice(self._size, size=min(self._size, 32 * nlist), replace=False)]
+            centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+            with stage_timer("global_index_train"):
+                for _ in range(KMEANS_ITERATIONS):
+                    labels = np.argmax(sample @ centroids.T, axis=1)
+                    counts = np.bincount(labels, minlength=nlist)
+                    # Suma por lista: ordenar por etiqueta y reducir por tramos
+                    order = np.argsort(labels, kind="stable")
+                    present = np.flatnonzero(counts)
+                    starts = np.concatenate([[0], np.cumsum(counts[present])[:-1]])
+                    sums = np.zeros_like(centroids)
+                    sums[present] = np.add.reduceat(sample[order], starts, axis=0)
+                    empty = counts == 0
+                    # Listas vacías: se re-siembran con vectores al azar
+                    sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()), replace=False)]
+                    centroids = sums / np.linalg.norm(sums, axis=1, keepdims=True)
+            self.centroids = centroids.astype(np.float32)
+            self._assign(0, self._size, rebuild=True)
+            self._trained_size = self._size
+
+    def _assign(self, start: int, end: int, rebuild: bool = False):
+        if rebuild:
+            self._lists = [[] for _ in range(len(self.centroids))]
+        for block in range(start, end, ASSIGN_BLOCK):
+            stop = min(end, block + ASSIGN_BLOCK)
+            labels = np.argmax(self._vectors[block:stop] @ self.centroids.T, axis=1)
+            self._list_of[block:stop] = labels
+            for offset, label in enumerate(labels):
+                self._lists[label].append(block + offset)
+        if rebuild:
+            self._list_arrays = {}
+        else:
+            for label in set(self._list_of[start:end].tolist()):
+                self._list_arrays.pop(label, None)
+
+    def _list_array(self, label: int) -> np.ndarray:
+        array = self._list_arrays.get(label)
+        if array is None:
+            array = np.asarray(self._lists[label], dtype=np.int64)
+            self._list_arrays[label] = array
+        return array
+
+    # --- búsqueda ---
+
+    def _filter_mask(self, positions: np.ndarray, sections: Optional[List[str]],
+                     product_types: Optional[List[str]], exclude_manual_ids: Optional[List[str]]) -> np.ndarray:
+        mask = self._alive[positions].copy()
+        if sections:
+            allowed = [code for name, code in self._sections.items()
+                       if any(name == s or name.startswith(s + ".") for s in sections)]
+            mask &= np.isin(self._section[positions], allowed)
+        if product_types:
+            allowed = [self._product_types[p] for p in product_types if p in self._product_types]
+            mask &= np.isin(self._manual_ptype[self._manual[positions]], allowed)
+        if exclude_manual_ids:
+            excluded = [self._manual_codes[m] for m in map(str, exclude_manual_ids) if m in self._manual_codes]
+            mask &= ~np.isin(self._manual[positions], excluded)
+        return mask
+
+    def _top(self, positions: np.ndarray, scores: np.ndarray, top_k: int) -> List[Dict[str, Any]]:
+        k = min(top_k, len(positions))
+        if k == 0:
+            return []
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        results = []
+        for index in best:
+            if not np.isfinite(scores[index]):
+                break
+            chunk = self._chunks[positions[index]]
+            meta = self._manual_meta[self._manual_codes[chunk["manual_id"]]]
+            results.append({
+                **chunk,
+                "manual_name": meta.get("name"),
+                "product_type": meta.get("product_type"),
+                "similarity": float(scores[index]),
+            })
+        return results
+
+    def search(self, query: np.ndarray, top_k: int = 10, nprobe: int = None,
+               sections: Optional[List[str]] = None, product_types: Optional[List[str]] = None,
+               exclude_manual_ids: Optional[List[str]] = None, exact: bool = False) -> List[Dict[str, Any]]:
+        """
+        top_k chunks más similares (producto interno = coseno) que cumplen
+        los filtros
+        """
+        query = np.asarray(query, dtype=np.float32).reshape(self.dimension)
+        query = query / (np.linalg.norm(query) or 1.0)
+        filtered = bool(sections or product_types or exclude_manual_ids)
+
+        with self._lock:
+            everything = np.arange(self._size)
+            allowed = self._filter_mask(everything, sections, product_types, exclude_manual_ids) \
+                if filtered else self._alive[:self._size]
+            allowed_count = int(allowed.sum())
+
+            if exact or self.centroids is None:
+                plan = "exact"
+                positions = everything
+                scores = self._vectors[:self._size] @ query
+                scores[~allowed] = -np.inf
+            elif filtered and allowed_count <= GLOBAL_INDEX_EXACT_BELOW:
+                plan = "exact_filtered"
+                positions = np.flatnonzero(allowed)
+                scores = self._vectors[positions] @ query
+            else:
+                plan = "ivf"
+                nprobe = nprobe or GLOBAL_INDEX_NPROBE
+                if filtered:
+                    # Visitar más listas cuanto más selectivo es el filtro, para
+                    # comparar contra un número parecido de filas válidas
+                    nprobe = int(np.ceil(nprobe * len(self) / max(allowed_count, 1)))
+                order = np.argsort(-(self.centroids @ query))
+                nprobe = min(nprobe, len(order))
+                while True:
+                    candidates = np.concatenate([self._list_array(l) for l in order[:nprobe]])
+                    positions = candidates[allowed[candidates]]
+                    # Ampliar hasta juntar top_k candidatos válidos
+                    if len(positions) >= top_k or nprobe >= len(order):
+                        break
+                    nprobe = min(len(order), nprobe * 2)
+                scores = self._vectors[positions] @ query
+
+            inc_counter("global_search_total", labels={"backend": "local", "plan": plan})
+            return self._top(positions, scores, top_k)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "chunks": len(self),
+                "manuals": len(self._manual_rows),
+                "lists": 0 if self.centroids is None else len(self.centroids),
+                "trained_on": self._trained_size,
+                "deleted_pending": self._dead,
+                "memory_mb": round(self._vectors.nbytes / 1e6, 1),
+            }
+
+
+# ============================================
+# ÍNDICE DEL PROCESO (backend local)
+# ============================================
+
+_index: Optional[IVFIndex] = None
+_index_loaded_at = 0.0
+_index_lock = threading.Lock()
+
+
+def _manual_rows(supabase_client, manual_ids: Optional[List[str]] = None):
+    from services.bulk_transfer import iter_table_rows
+    return iter_table_rows(supabase_client, "brand_manuals", manual_ids, columns="id, name, product_type")
+
+
+def _embedding_rows(supabase_client, manual_ids: Optional[List[str]] = None):
+    from services.bulk_transfer import iter_table_rows
+    return iter_table_rows(
+        supabase_client, "brand_manual_embeddings", manual_ids,
+        columns="id, manual_id, content, section, embedding",
+        scope=lambda query: scope_to_space(query, ACTIVE_SPACE)
+    )
+
+
+def _add_rows(index: Optional[IVFIndex], rows: List[Dict[str, Any]]) -> Optional[IVFIndex]:
+    vectors = [parse_vector(row.get("embedding")) for row in rows]
+    valid = [(row, vector) for row, vector in zip(rows, vectors) if vector is not None]
+    if not valid:
+        return index
+    if index is None:
+        index = IVFIndex(len(valid[0][1]))
+    index.add([row for row, _ in valid], np.stack([vector for _, vector in valid]))
+    return index
+
+
+def build_global_index(supabase_client) -> Optional[IVFIndex]:
+    """Carga todos los chunks del espacio activo por páginas"""
+    index = None
+    metas = list(_manual_rows(supabase_client))
+    page: List[Dict[str, Any]] = []
+    with stage_timer("global_index_build"):
+        for row in _embedding_rows(supabase_client):
+            page.append(row)
+            if len(page) >= 1000:
+                index = _add_rows(index, page)
+                page = []
+        index = _add_rows(index, page)
+    if index is not None:
+        for meta in metas:
+            index.set_manual(meta["id"], meta.get("name"), meta.get("product_type"))
+    return index
+
+
+def get_global_index(supabase_client) -> Optional[IVFIndex]:
+    """Índice del proceso; se construye en el primer uso (o al vencer GLOBAL_INDEX_MAX_AGE)"""
+    global _index, _index_loaded_at
+    expired = GLOBAL_INDEX_MAX_AGE and time.monotonic() - _index_loaded_at > GLOBAL_INDEX_MAX_AGE
+    if _index is None or expired:
+        with _index_lock:
+            expired = GLOBAL_INDEX_MAX_AGE and time.monotonic() - _index_loaded_at > GLOBAL_INDEX_MAX_AGE
+            if _index is None or expired:
+                _index = build_global_index(supabase_client)
+                _index_loaded_at = time.monotonic()
+    return _index
+
+
+def refresh_manual_in_index(manual_id: str, supabase_client, name: str = None, product_type: str = None):
+    """
+    Reemplaza los chunks de un manual en el índice (si ya está cargado)
+    después de regenerar sus embeddings
+    """
+    global _index
+    if _index is None:
+        return
+    rows = list(_embedding_rows(supabase_client, [manual_id]))
+    with _index_lock:
+        # Pudo descartarse (reset_global_index) mientras se leían las filas
+        if _index is None:
+            return
+        _index.remove_manual(manual_id)
+        _index = _add_rows(_index, rows)
+        _index.set_manual(manual_id, name, product_type)
+
+
+def reset_global_index():
+    """Descarta el índice; se vuelve a cargar en la próxima búsqueda (p. ej. tras un import masivo)"""
+    global _index
+    with _index_lock:
+        _index = None
+
+
+def drop_manual_from_index(manual_id: str):
+    index = _index
+    if index is not None:
+        index.remove_manual(manual_id)
+
+
+def update_index_on_change(event: Dict[str, Any]):
+    """
+    Listener del feed de cambios: bajas y cambios de metadatos de manuales
+    (con CHANGE_FEED_BACKEND=table llegan también los de otros workers)
+    """
+    index = _index
+    if index is None or event.get("table") != "brand_manuals":
+        return
+    if event.get("op") == "delete":
+        index.remove_manual(event.get("row_id"))
+    elif event.get("data"):
+        data = event["data"]
+        index.set_manual(event.get("row_id"), data.get("name"), data.get("product_type"))
+
+
+def global_index_status() -> Dict[str, Any]:
+    status = {"backend": GLOBAL_SEARCH_BACKEND, "loaded": _index is not None}
+    if _index is not None:
+        status.update(_index.stats())
+        status["age_seconds"] = round(time.monotonic() - _index_loaded_at, 1)
+    return status
+
+
+# ============================================
+# BÚSQUEDA
+# ============================================
+
+def _pgvector_search(query_vector: np.ndarray, supabase_client, top_k: int,
+                     sections, product_types, exclude_manual_ids) -> List[Dict[str, Any]]:
+    with stage_timer("vector_search", scope="global"):
+        result = supabase_client.rpc(GLOBAL_SEARCH_RPC, {
+            "query_embedding": query_vector.tolist(),
+            "match_count": top_k,
+            "filter_sections": sections or None,
+            "filter_product_types": product_types or None,
+            "exclude_manual_ids": exclude_manual_ids or None,
+        }).execute()
+    inc_counter("global_search_total", labels={"backend": "pgvector", "plan": "hnsw"})
+    return result.data or []
+
+
+async def global_search(
+    query: str,
+    supabase_client,
+    top_k: int = 10,
+    sections: Optional[List[str]] = None,
+    product_types: Optional[List[str]] = None,
+    exclude_manual_ids: Optional[List[str]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Búsqueda semántica en todos los manuales del espacio activo
+
+    Returns:
+        List[Dict]: chunks con id, manual_id, manual_name, product_type,
+        content, section y similarity, de mayor a menor similitud
+    """
+    from services.embeddings_service import generate_embeddings
+
+    try:
+        with stage_timer("query_embed"):
+            query_vector = (await generate_embeddings([query]))[0]
+
+        if GLOBAL_SEARCH_BACKEND == "pgvector":
+            return await asyncio.to_thread(
+                _pgvector_search, query_vector, supabase_client, top_k,
+                sections, product_types, exclude_manual_ids
+            )
+
+        # La primera carga lee toda la tabla: fuera del event loop
+        index = await asyncio.to_thread(get_global_index, supabase_client)
+        if index is None:
+            return []
+        # search() espera el lock del índice si se está reentrenando
+        with stage_timer("vector_search", scope="global"):
+            return await asyncio.to_thread(
+                index.search, query_vector, top_k, sections=sections, product_types=product_types,
+                exclude_manual_ids=exclude_manual_ids
+            )
+    except Exception as e:
+        raise Exception(f"Error en búsqueda global: {str(e)}")
@@ -1,24 +1,257 @@
-from groq import Groq
 from dotenv import load_dotenv
+import asyncio
 import os
+import threading
 import json
-from langfuse import observe
+import time
+from typing import Any, Dict, List, Optional
+from config.langfuse_config import observe
+from services.metrics_service import stage_timer, record_llm_call, register_counter, inc_counter
+from services.compliance_scanner import StreamScanner, get_compiled_rules
+from services.admission_control import admission, AdmissionRejected
+from services.model_router import choose_model, record_model_call
+from services.token_counter import estimate_llm_tokens
 
 load_dotenv()
 
-# Inicializar cliente de Groq
-client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+# Cliente de Groq: se crea en el primer uso (importar no requiere la API key)
+client = None
+_client_lock = threading.Lock()
 
-# Configuración del modelo
+
+def get_groq_client():
+    """Retorna el cliente de Groq (singleton)"""
+    global client
+    if client is None:
+        with _client_lock:
+            if client is None:
+                from groq import Groq
+                client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+    return client
+
+
+# Configuración del modelo (con MODEL_ROUTING=true services/model_router.py
+# puede elegir un modelo más rápido de la cadena de cada tarea)
 MODEL_NAME = "llama-3.3-70b-versatile"  # Modelo más potente de Groq
 
+# Modo de generación de manuales por defecto: "single" (un solo JSON) o
+# "parallel" (núcleo de marca + una llamada concurrente por sección)
+MANUAL_GENERATION_MODE = os.getenv("MANUAL_GENERATION_MODE", "single")
+# Reintentos por sección en modo parallel (solo se reintentan las que fallan)
+SECTION_MAX_RETRIES = int(os.getenv("MANUAL_SECTION_MAX_RETRIES", "2"))
+
+# Regeneraciones automáticas cuando el texto usa palabras prohibidas
+COMPLIANCE_MAX_REGENERATIONS = int(os.getenv("COMPLIANCE_MAX_REGENERATIONS", "1"))
+# Cortar el stream en cuanto aparece una palabra prohibida (si se va a regenerar)
+COMPLIANCE_STREAM_ABORT = os.getenv("COMPLIANCE_STREAM_ABORT", "true").lower() == "true"
+
+register_counter("compliance_regenerations_total", "Regeneraciones por palabras prohibidas")
+
+# Estructura del manual de marca. Es la fuente única para el prompt del
+# modo single, los prompts por sección del modo parallel y la validación.
+MANUAL_SCHEMA: Dict[str, Any] = {
+    "identidad_marca": {
+        "proposito": "string (el propósito y misión del producto)",
+        "valores": ["valor1", "valor2", "valor3"],
+        "personalidad": "string (descripción de la personalidad de la marca)",
+        "diferenciador": "string (qué hace único a este producto)"
+    },
+    "tono_comunicacion": {
+        "descripcion_general": "string",
+        "palabras_permitidas": ["palabra1", "palabra2", "palabra3"],
+        "palabras_prohibidas": ["palabra1", "palabra2", "palabra3"],
+        "estilo_redaccion": "string (formal, casual, técnico, creativo, etc.)",
+        "uso_tecnicismos": "boolean (true si se permiten, false si no)",
+        "ejemplos_buenos": ["ejemplo1", "ejemplo2"],
+        "ejemplos_malos": ["ejemplo1", "ejemplo2"]
+    },
+    "elementos_visuales": {
+        "colores_principales": ["#HEX1", "#HEX2"],
+        "colores_secundarios": ["#HEX3", "#HEX4"],
+        "tipografia_principal": "string (nombre de fuente)",
+        "tipografia_secundaria": "string (nombre de fuente)",
+        "uso_logo": {
+            "tamano_minimo": "string (ej: '10% del ancho de la imagen' o '50px mínimo')",
+            "espaciado_minimo": "string (ej: '5% del ancho del logo alrededor' o 'espacio blanco equivalente a la altura del logo')",
+            "posicion_permitida": ["posición1", "posición2"],
+            "fondos_permitidos": ["fondo1", "fondo2"],
+            "fondos_prohibidos": ["fondo1", "fondo2"],
+            "elementos_adicionales": "string (ej: 'puede aparecer con tagline', 'siempre acompañado de...')"
+        },
+        "estilo_fotografico": "string (descripción DETALLADA: iluminación, composición, tipo de tomas, mood, filtros si aplica)",
+        "iconografia": "string (tipo de iconos: planos, con sombras, estilo específico)",
+        "composicion_visual": "string (ej: 'fondo minimalista con producto centrado', 'ingredientes visibles', 'contraste alto/bajo')",
+        "elementos_obligatorios": ["elemento1", "elemento2"],
+        "elementos_prohibidos": ["elemento1", "elemento2"]
+    },
+    "publico_objetivo": {
+        "demografia": {
+            "edad": "string (rango de edad)",
+            "genero": "string",
+            "ubicacion": "string",
+            "nivel_socioeconomico": "string"
+        },
+        "psicografia": {
+            "intereses": ["interés1", "interés2"],
+            "valores": ["valor1", "valor2"],
+            "estilo_vida": "string"
+        },
+        "pain_points": ["problema1", "problema2"],
+        "aspiraciones": ["aspiración1", "aspiración2"]
+    },
+    "directrices_contenido": {
+        "tipos_contenido": {
+            "redes_sociales": {
+                "longitud_ideal": "string",
+                "hashtags": ["#tag1", "#tag2"],
+                "frecuencia": "string"
+            },
+            "blog_articulos": {
+                "longitud_ideal": "string",
+                "estructura": "string",
+                "temas_principales": ["tema1", "tema2"]
+            },
+            "email_marketing": {
+                "subject_line_style": "string",
+                "longitud_ideal": "string",
+                "call_to_action": ["CTA1", "CTA2"]
+            }
+        },
+        "palabras_clave_seo": ["keyword1", "keyword2", "keyword3"],
+        "mensajes_clave": ["mensaje1", "mensaje2", "mensaje3"]
+    },
+    "ejemplos_aplicacion": {
+        "descripcion_producto_buena": "string (ejemplo de descripción que sigue el manual)",
+        "descripcion_producto_mala": "string (ejemplo de lo que NO hacer)",
+        "post_redes_bueno": "string",
+        "post_redes_malo": "string"
+    }
+}
+
+# Tokens máximos por sección en modo parallel
+SECTION_MAX_TOKENS = {
+    "identidad_marca": 500,
+    "tono_comunicacion": 800,
+    "elementos_visuales": 1000,
+    "publico_objetivo": 700,
+    "directrices_contenido": 900,
+    "ejemplos_aplicacion": 900,
+}
+
+MANUAL_SYSTEM_PROMPT = """Eres un experto en branding y marketing estratégico. 
+Tu tarea es crear manuales de marca profesionales, detallados y coherentes.
+Debes generar un manual en formato JSON con la estructura exacta que se te solicita.
+Sé creativo, específico y profesional."""
+
+
+def _record_groq_usage(chat_completion, model: str, duration: float):
+    """Registra latencia y tokens reportados por Groq"""
+    usage = getattr(chat_completion, "usage", None)
+    record_llm_call(
+        provider="groq",
+        model=model,
+        duration=duration,
+        prompt_tokens=getattr(usage, "prompt_tokens", None),
+        completion_tokens=getattr(usage, "completion_tokens", None)
+    )
+
+
+def _estimate_call_tokens(messages: List[Dict[str, str]], params: Dict[str, Any]) -> int:
+    """Tokens que reserva una llamada en el control de admisión: prompt + máximo de salida"""
+    prompt = "".join(m["content"] for m in messages)
+    return estimate_llm_tokens(prompt) + params.get("max_tokens", 1024)
+
+
+async def _chat_completion(messages: List[Dict[str, str]], task: str = "default", **params):
+    """
+    Llama a Groq en un hilo (el cliente es síncrono) para no bloquear el
+    event loop y poder lanzar varias llamadas en paralelo
+
+    task elige la cadena de modelos y el presupuesto de latencia del router
+    """
+    model = choose_model("groq", task)
+    async with admission("groq", _estimate_call_tokens(messages, params)) as ticket:
+        start = time.perf_counter()
+        try:
+            with stage_timer("llm_call", provider="groq"):
+                chat_completion = await asyncio.to_thread(
+                    get_groq_client().chat.completions.create,
+                    messages=messages,
+                    model=model,
+                    **params
+                )
+        except Exception:
+            record_model_call(model, time.perf_counter() - start, ok=False)
+            raise
+        ticket.used(getattr(getattr(chat_completion, "usage", None), "total_tokens", None))
+    duration = time.perf_counter() - start
+    record_model_call(model, duration)
+    _record_groq_usage(chat_completion, model, duration)
+    return chat_completion
+
+
+def _parse_json_response(response_content: str) -> Any:
+    """Limpia la respuesta (por si viene con markdown) y parsea el JSON"""
+    response_content = response_content.strip()
+    if response_content.startswith("```json"):
+        response_content = response_content[7:]
+    if response_content.startswith("```"):
+        response_content = response_content[3:]
+    if response_content.endswith("```"):
+        response_content = response_content[:-3]
+    response_content = response_content.strip()
+    
+    with stage_timer("json_parse"):
+        return json.loads(response_content)
+
+
+def validate_against_schema(value: Any, schema: Any, path: str = "") -> List[str]:
+    """
+    Valida la forma de un JSON generado contra MANUAL_SCHEMA
+
+    Los dicts deben tener todas las claves, las listas deben ser listas y
+    los strings del esquema aceptan cualquier valor escalar.
+
+    Returns:
+        List[str]: Errores encontrados (vacía si es válido)
+    """
+    if isinstance(schema, dict):
+        if not isinstance(value, dict):
+            return [f"{path or 'raíz'}: se esperaba un objeto"]
+        errors = []
+        for key, sub_schema in schema.items():
+            sub_path = f"{path}.{key}" if path else key
+            if key not in value:
+                errors.append(f"{sub_path}: falta el campo")
+            else:
+                errors.extend(validate_against_schema(value[key], sub_schema, sub_path))
+        return errors
+    if isinstance(schema, list):
+        if not isinstance(value, list) or not value:
+            return [f"{path}: se esperaba una lista no vacía"]
+        return []
+    if isinstance(value, (dict, list)) or value is None or value == "":
+        return [f"{path}: se esperaba un valor simple"]
+    return []
+
+
+def _product_info(name: str, description: str, product_type: str, tone: str, target_audience: str) -> str:
+    return f"""**INFORMACIÓN DEL PRODUCTO:**
+- Nombre: {name}
+- Descripción: {description}
+- Tipo de producto: {product_type}
+- Tono de comunicación: {tone}
+- Público objetivo: {target_audience}"""
+
+
 @observe(name="generate_brand_manual")
 async def generate_brand_manual(
     name: str,
     description: str,
     product_type: str,
     tone: str,
-    target_audience: str
+    target_audience: str,
+    mode: Optional[str] = None
 ) -> dict:
     """
     Genera un manual de marca estructurado usando Groq (Llama 3)
@@ -29,107 +262,24 @@ async def generate_brand_manual(
         product_type: Tipo de producto (snack, bebida, etc.)
         tone: Tono de comunicación deseado
         target_audience: Público objetivo
+        mode: "single" o "parallel" (por defecto MANUAL_GENERATION_MODE)
     
     Returns:
         dict: Manual de marca estructurado en formato JSON
     """
+    mode = mode or MANUAL_GENERATION_MODE
+    if mode == "parallel":
+        return await _generate_brand_manual_parallel(name, description, product_type, tone, target_audience)
     
     # Prompt engineering para generar un manual completo
-    system_prompt = """Eres un experto en branding y marketing estratégico. 
-Tu tarea es crear manuales de marca profesionales, detallados y coherentes.
-Debes generar un manual en formato JSON con la estructura exacta que se te solicita.
-Sé creativo, específico y profesional."""
-
     user_prompt = f"""
 Crea un manual de marca completo y profesional para el siguiente producto:
 
-**INFORMACIÓN DEL PRODUCTO:**
-- Nombre: {name}
-- Descripción: {description}
-- Tipo de producto: {product_type}
-- Tono de comunicación: {tone}
-- Público objetivo: {target_audience}
+{_product_info(name, description, product_type, tone, target_audience)}
 
 **ESTRUCTURA REQUERIDA (Responde SOLO con JSON válido):**
 
-{{
-  "identidad_marca": {{
-    "proposito": "string (el propósito y misión del producto)",
-    "valores": ["valor1", "valor2", "valor3"],
-    "personalidad": "string (descripción de la personalidad de la marca)",
-    "diferenciador": "string (qué hace único a este producto)"
-  }},
-  "tono_comunicacion": {{
-    "descripcion_general": "string",
-    "palabras_permitidas": ["palabra1", "palabra2", "palabra3"],
-    "palabras_prohibidas": ["palabra1", "palabra2", "palabra3"],
-    "estilo_redaccion": "string (formal, casual, técnico, creativo, etc.)",
-    "uso_tecnicismos": "boolean (true si se permiten, false si no)",
-    "ejemplos_buenos": ["ejemplo1", "ejemplo2"],
-    "ejemplos_malos": ["ejemplo1", "ejemplo2"]
-  }},
-  "elementos_visuales": {{
-    "colores_principales": ["#HEX1", "#HEX2"],
-    "colores_secundarios": ["#HEX3", "#HEX4"],
-    "tipografia_principal": "string (nombre de fuente)",
-    "tipografia_secundaria": "string (nombre de fuente)",
-    "uso_logo": {{
-      "tamano_minimo": "string (ej: '10% del ancho de la imagen' o '50px mínimo')",
-      "espaciado_minimo": "string (ej: '5% del ancho del logo alrededor' o 'espacio blanco equivalente a la altura del logo')",
-      "posicion_permitida": ["posición1", "posición2"],
-      "fondos_permitidos": ["fondo1", "fondo2"],
-      "fondos_prohibidos": ["fondo1", "fondo2"],
-      "elementos_adicionales": "string (ej: 'puede aparecer con tagline', 'siempre acompañado de...')"
-    }},
-    "estilo_fotografico": "string (descripción DETALLADA: iluminación, composición, tipo de tomas, mood, filtros si aplica)",
-    "iconografia": "string (tipo de iconos: planos, con sombras, estilo específico)",
-    "composicion_visual": "string (ej: 'fondo minimalista con producto centrado', 'ingredientes visibles', 'contraste alto/bajo')",
-    "elementos_obligatorios": ["elemento1", "elemento2"],
-    "elementos_prohibidos": ["elemento1", "elemento2"]
-  }},
-  "publico_objetivo": {{
-    "demografia": {{
-      "edad": "string (rango de edad)",
-      "genero": "string",
-      "ubicacion": "string",
-      "nivel_socioeconomico": "string"
-    }},
-    "psicografia": {{
-      "intereses": ["interés1", "interés2"],
-      "valores": ["valor1", "valor2"],
-      "estilo_vida": "string"
-    }},
-    "pain_points": ["problema1", "problema2"],
-    "aspiraciones": ["aspiración1", "aspiración2"]
-  }},
-  "directrices_contenido": {{
-    "tipos_contenido": {{
-      "redes_sociales": {{
-        "longitud_ideal": "string",
-        "hashtags": ["#tag1", "#tag2"],
-        "frecuencia": "string"
-      }},
-      "blog_articulos": {{
-        "longitud_ideal": "string",
-        "estructura": "string",
-        "temas_principales": ["tema1", "tema2"]
-      }},
-      "email_marketing": {{
-        "subject_line_style": "string",
-        "longitud_ideal": "string",
-        "call_to_action": ["CTA1", "CTA2"]
-      }}
-    }},
-    "palabras_clave_seo": ["keyword1", "keyword2", "keyword3"],
-    "mensajes_clave": ["mensaje1", "mensaje2", "mensaje3"]
-  }},
-  "ejemplos_aplicacion": {{
-    "descripcion_producto_buena": "string (ejemplo de descripción que sigue el manual)",
-    "descripcion_producto_mala": "string (ejemplo de lo que NO hacer)",
-    "post_redes_bueno": "string",
-    "post_redes_malo": "string"
-  }}
-}}
+{json.dumps(MANUAL_SCHEMA, indent=2, ensure_ascii=False)}
 
 IMPORTANTE: 
 - Responde ÚNICAMENTE con el JSON, sin texto adicional antes o después
@@ -140,59 +290,180 @@ IMPORTANTE:
 
     try:
         # Llamada a Groq API
-        chat_completion = client.chat.completions.create(
+        chat_completion = await _chat_completion(
+            task="manual",
             messages=[
                 {
                     "role": "system",
-                    "content": system_prompt
+                    "content": MANUAL_SYSTEM_PROMPT
                 },
                 {
                     "role": "user",
                     "content": user_prompt
                 }
             ],
-            model=MODEL_NAME,
             temperature=0.7,  # Balance entre creatividad y coherencia
             max_tokens=4000,  # Suficiente para un manual completo
             top_p=0.9,
             stream=False
         )
         
-        # Extraer respuesta
-        response_content = chat_completion.choices[0].message.content
-        
-        # Limpiar la respuesta (por si viene con markdown)
-        response_content = response_content.strip()
-        if response_content.startswith("```json"):
-            response_content = response_content[7:]
-        if response_content.startswith("```"):
-            response_content = response_content[3:]
-        if response_content.endswith("```"):
-            response_content = response_content[:-3]
-        response_content = response_content.strip()
-        
-        # Parsear JSON
-        manual_json = json.loads(response_content)
+        # Extraer respuesta y parsear JSON
+        manual_json = _parse_json_response(chat_completion.choices[0].message.content)
         
         return manual_json
         
+    except AdmissionRejected:
+        raise
     except json.JSONDecodeError as e:
         raise Exception(f"Error al parsear JSON de Groq: {str(e)}")
     except Exception as e:
         raise Exception(f"Error al generar manual con Groq: {str(e)}")
 
 
+# ============================================
+# GENERACIÓN POR SECCIONES EN PARALELO
+# ============================================
+
+async def _generate_brand_core(product_info: str) -> Dict[str, Any]:
+    """
+    Paso 1 del modo parallel: núcleo de marca compacto que comparten todas
+    las secciones para que el manual sea coherente
+    """
+    user_prompt = f"""
+Define el NÚCLEO de marca (resumen compacto) para el siguiente producto:
+
+{product_info}
+
+Responde SOLO con JSON válido con esta estructura:
+{{
+  "esencia": "string (una frase)",
+  "personalidad": "string (3-5 adjetivos)",
+  "valores": ["valor1", "valor2", "valor3"],
+  "paleta": ["#HEX1", "#HEX2", "#HEX3", "#HEX4"],
+  "tono": "string (cómo habla la marca)",
+  "conceptos_clave": ["concepto1", "concepto2", "concepto3"]
+}}
+"""
+    chat_completion = await _chat_completion(
+        task="manual",
+        messages=[
+            {"role": "system", "content": MANUAL_SYSTEM_PROMPT},
+            {"role": "user", "content": user_prompt}
+        ],
+        temperature=0.7,
+        max_tokens=400,
+        top_p=0.9
+    )
+    return _parse_json_response(chat_completion.choices[0].message.content)
+
+
+async def _generate_manual_section(section: str, product_info: str, brand_core: Dict[str, Any],
+                                   previous_errors: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Genera una sola sección del manual a partir del núcleo de marca
+    """
+    retry_note = ""
+    if previous_errors:
+        retry_note = "\nCORRIGE estos errores del intento anterior:\n" + "\n".join(f"- {e}" for e in previous_errors) + "\n"
+
+    user_prompt = f"""
+Estás escribiendo la sección "{section}" del manual de marca del siguiente producto:
+
+{product_info}
+
+**NÚCLEO DE MARCA (respétalo para mantener la coherencia con las demás secciones):**
+{json.dumps(brand_core, ensure_ascii=False)}
+
+**ESTRUCTURA REQUERIDA DE LA SECCIÓN (Responde SOLO con este objeto JSON):**
+
+{json.dumps(MANUAL_SCHEMA[section], indent=2, ensure_ascii=False)}
+{retry_note}
+IMPORTANTE:
+- Responde ÚNICAMENTE con el objeto JSON de la sección, sin la clave "{section}" envolviéndolo
+- Todos los campos deben tener contenido relevante y detallado
+"""
+    chat_completion = await _chat_completion(
+        task="manual",
+        messages=[
+            {"role": "system", "content": MANUAL_SYSTEM_PROMPT},
+            {"role": "user", "content": user_prompt}
+        ],
+        temperature=0.7,
+        max_tokens=SECTION_MAX_TOKENS.get(section, 800),
+        top_p=0.9
+    )
+    data = _parse_json_response(chat_completion.choices[0].message.content)
+    # Tolerar que el modelo envuelva la sección en su propia clave
+    if isinstance(data, dict) and list(data.keys()) == [section]:
+        data = data[section]
+    return data
+
+
+async def _generate_brand_manual_parallel(name: str, description: str, product_type: str,
+                                          tone: str, target_audience: str) -> dict:
+    """
+    Modo parallel: núcleo de marca + una llamada concurrente por sección,
+    validando cada sección por separado y reintentando solo las que fallan.
+    La latencia total ≈ núcleo + la sección más lenta.
+    """
+    product_info = _product_info(name, description, product_type, tone, target_audience)
+
+    try:
+        brand_core = await _generate_brand_core(product_info)
+    except AdmissionRejected:
+        raise
+    except json.JSONDecodeError as e:
+        raise Exception(f"Error al parsear JSON del núcleo de marca: {str(e)}")
+    except Exception as e:
+        raise Exception(f"Error al generar núcleo de marca con Groq: {str(e)}")
 
+    manual: Dict[str, Any] = {}
+    pending = {section: None for section in MANUAL_SCHEMA}
 
-@observe(name="generate_content_with_rag")
-async def generate_content_with_rag(
+    for _attempt in range(SECTION_MAX_RETRIES + 1):
+        sections = list(pending)
+        results = await asyncio.gather(
+            *[_generate_manual_section(s, product_info, brand_core, pending[s]) for s in sections],
+            return_exceptions=True
+        )
+
+        failed = {}
+        for section, result in zip(sections, results):
+            # Sin presupuesto no tiene sentido reintentar: se responde 429
+            if isinstance(result, AdmissionRejected):
+                raise result
+            if isinstance(result, Exception):
+                failed[section] = [f"respuesta inválida: {str(result)}"]
+                continue
+            errors = validate_against_schema(result, MANUAL_SCHEMA[section], section)
+            if errors:
+                failed[section] = errors
+            else:
+                manual[section] = result
+
+        pending = failed
+        if not pending:
+            break
+
+    if pending:
+        detail = "; ".join(f"{s}: {', '.join(errors[:3])}" for s, errors in pending.items())
+        raise Exception(f"Error al generar manual con Groq: secciones inválidas tras reintentos ({detail})")
+
+    # Mismo orden de secciones que el modo single
+    return {section: manual[section] for section in MANUAL_SCHEMA}
+
+
+
+
+def build_content_prompt(
     content_type: str,
     user_prompt: str,
     rag_context: str,
     brand_name: str
 ) -> str:
     """
-    Genera contenido usando contexto RAG
+    Construye el prompt final de generación de contenido
     
     Args:
         content_type: product_description, video_script, image_prompt
@@ -201,7 +472,7 @@ async def generate_content_with_rag(
         brand_name: Nombre de la marca
     
     Returns:
-        str: Contenido generado
+        str: Prompt listo para enviar a Groq
     """
     
     # Prompts específicos por tipo - Generación automática según el manual
@@ -321,17 +592,155 @@ INSTRUCCIONES CRÍTICAS - CADA DETALLE ES OBLIGATORIO:
 AHORA GENERA EL PROMPT COMPLETO EN ESPAÑOL (250-350 palabras, narrativa fluida):"""
     }
     
-    prompt = prompts_map.get(content_type, prompts_map["product_description"])
+    return prompts_map.get(content_type, prompts_map["product_description"])
+
+
+def _consume_stream(messages: List[Dict[str, str]], params: Dict[str, Any], model: str,
+                    scanner: StreamScanner, abort_on_violation: bool) -> Dict[str, Any]:
+    """
+    Consume el stream de Groq (en un hilo) pasando cada fragmento al escáner
+    """
+    stream = get_groq_client().chat.completions.create(
+        messages=messages,
+        model=model,
+        stream=True,
+        **params
+    )
+    usage = None
+    aborted = False
+    try:
+        for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                new = scanner.feed(delta)
+                if abort_on_violation and any(m["severity"] == "error" for m in new):
+                    aborted = True
+                    break
+            # Groq reporta el uso de tokens en el último fragmento (x_groq.usage)
+            usage = getattr(getattr(chunk, "x_groq", None), "usage", None) or usage
+    finally:
+        close = getattr(stream, "close", None)
+        if close:
+            close()
+    if not aborted:
+        scanner.finish()
+    return {"usage": usage, "aborted": aborted}
+
+
+@observe(name="content_generation_stream")
+async def stream_content_with_rag(
+    content_type: str,
+    user_prompt: str,
+    rag_context: str,
+    brand_name: str,
+    scanner: StreamScanner,
+    abort_on_violation: bool = False
+) -> Dict[str, Any]:
+    """
+    Genera contenido en streaming escaneando el texto a medida que llega
+    
+    Returns:
+        dict: text (parcial si se abortó), aborted y model (modelo usado)
+    """
+    prompt = build_content_prompt(content_type, user_prompt, rag_context, brand_name)
+    
+    messages = [{"role": "user", "content": prompt}]
+    params = {"temperature": 0.7, "max_tokens": 1500}
+    model = choose_model("groq", content_type)
     
     try:
-        chat_completion = client.chat.completions.create(
-            messages=[{"role": "user", "content": prompt}],
-            model=MODEL_NAME,
-            temperature=0.7,
-            max_tokens=1500
+        async with admission("groq", _estimate_call_tokens(messages, params)) as ticket:
+            start = time.perf_counter()
+            try:
+                with stage_timer("llm_call", provider="groq"):
+                    streamed = await asyncio.to_thread(
+                        _consume_stream,
+                        messages,
+                        params,
+                        model,
+                        scanner,
+                        abort_on_violation
+                    )
+            except Exception:
+                record_model_call(model, time.perf_counter() - start, ok=False)
+                raise
+            ticket.used(getattr(streamed["usage"], "total_tokens", None))
+        duration = time.perf_counter() - start
+        # Un stream cortado por una violación no mide la latencia completa
+        if not streamed["aborted"]:
+            record_model_call(model, duration)
+        record_llm_call(
+            provider="groq",
+            model=model,
+            duration=duration,
+            prompt_tokens=getattr(streamed["usage"], "prompt_tokens", None),
+            completion_tokens=getattr(streamed["usage"], "completion_tokens", None)
         )
+        return {"text": scanner.text.strip(), "aborted": streamed["aborted"], "model": model}
         
-        return chat_completion.choices[0].message.content.strip()
-        
+    except AdmissionRejected:
+        raise
     except Exception as e:
-        raise Exception(f"Error generando contenido: {str(e)}")
\ No newline at end of file
+        raise Exception(f"Error generando contenido: {str(e)}")
+
+
+async def generate_compliant_content(
+    content_type: str,
+    user_prompt: str,
+    rag_context: str,
+    brand_name: str,
+    manual_content: dict
+) -> Dict[str, Any]:
+    """
+    Genera contenido y lo escanea contra las reglas de texto del manual
+    
+    Si el texto usa palabras prohibidas se regenera (hasta
+    COMPLIANCE_MAX_REGENERATIONS veces) indicando explícitamente qué
+    términos evitar. Mientras quede una regeneración disponible el stream se
+    corta en la primera violación para no esperar un texto que se va a
+    descartar.
+    
+    Returns:
+        dict: text, compliance (compliant, violations y warnings con
+        posiciones sobre text), regenerations y model (modelo del texto final)
+    """
+    rules = get_compiled_rules(manual_content)
+    feedback = ""
+    regenerations = 0
+    
+    while True:
+        can_retry = regenerations < COMPLIANCE_MAX_REGENERATIONS
+        scanner = StreamScanner(rules)
+        generation = await stream_content_with_rag(
+            content_type=content_type,
+            user_prompt=user_prompt + feedback,
+            rag_context=rag_context,
+            brand_name=brand_name,
+            scanner=scanner,
+            abort_on_violation=can_retry and COMPLIANCE_STREAM_ABORT
+        )
+        compliance = scanner.report()
+        if compliance["compliant"] or not can_retry:
+            break
+        
+        regenerations += 1
+        inc_counter("compliance_regenerations_total", labels={"content_type": content_type})
+        terms = sorted({v["term"] for v in compliance["violations"]})
+        feedback = (
+            "\n\nIMPORTANTE: el intento anterior usó palabras prohibidas por el manual. "
+            f"NO uses: {', '.join(terms)}"
+        )
+    
+    # Las posiciones se calcularon sobre el texto sin recortar
+    offset = len(scanner.text) - len(scanner.text.lstrip())
+    for match in compliance["violations"] + compliance["warnings"]:
+        match["start"] -= offset
+        match["end"] -= offset
+    
+    return {
+        "text": generation["text"],
+        "compliance": compliance,
+        "regenerations": regenerations,
+        "model": generation["model"],
+    }
+
@@ -0,0 +1,248 @@
+"""
+GET condicional (ETag / If-None-Match) y compresión de respuestas
+
+Los endpoints de manuales devuelven el mismo full_manual una y otra vez.
+Este módulo:
+
+- Calcula ETags fuertes: id + updated_at para un manual, y un hash de los
+  pares (id, updated_at) para la lista.
+- Guarda en memoria el último ETag de cada recurso. Si el cliente envía
+  If-None-Match con ese valor, se responde 304 sin consultar la base de
+  datos. Los eventos del feed de cambios (services/change_feed.py)
+  invalidan las entradas, y además cada entrada vence tras
+  HTTP_CACHE_VALIDATOR_TTL segundos, que acota el desfase con escrituras
+  de otros workers o hechas fuera de la API.
+- Serializa el JSON y lo comprime (brotli si está instalado, si no gzip)
+  una sola vez por ETag y codificación. Las lecturas repetidas no vuelven a
+  serializar ni a comprimir. Por debajo de HTTP_COMPRESSION_MIN_BYTES el
+  cuerpo se envía sin comprimir.
+"""
+import gzip
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from fastapi import Request, Response
+
+from services.metrics_service import register_counter, inc_counter
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+HTTP_CACHE_ENABLED = os.getenv("HTTP_CACHE_ENABLED", "true").lower() == "true"
+# Segundos que un ETag guardado sirve para responder 304 sin ir a la base
+HTTP_CACHE_VALIDATOR_TTL = float(os.getenv("HTTP_CACHE_VALIDATOR_TTL", "60"))
+# Cuerpos (ya serializados / comprimidos) que se conservan
+HTTP_CACHE_MAX_ENTRIES = int(os.getenv("HTTP_CACHE_MAX_ENTRIES", "256"))
+HTTP_COMPRESSION_MIN_BYTES = int(os.getenv("HTTP_COMPRESSION_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("HTTP_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("HTTP_BROTLI_QUALITY", "5"))
+
+# Los clientes siempre revalidan: los manuales cambian sin aviso
+CACHE_CONTROL = "private, no-cache"
+
+register_counter("http_cache_total", "Resultados del cache HTTP (not_modified, body_hit, body_miss)")
+
+_validators: Dict[str, Tuple[str, float]] = {}
+_bodies: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+
+
+# ---------- ETags ----------
+
+def _digest(value: str) -> str:
+    return hashlib.sha1(value.encode("utf-8")).hexdigest()[:20]
+
+
+def manual_etag(row: Dict[str, Any]) -> str:
+    """ETag fuerte de un manual (id + updated_at)"""
+    key = f"{row.get('id')}:{row.get('updated_at')}"
+    return f'"m-{_digest(key)}"'
+
+
+def list_etag(rows: Iterable[Dict[str, Any]]) -> str:
+    """ETag fuerte de una lista: hash de los pares (id, updated_at) en orden"""
+    key = "|".join(f"{row.get('id')}:{row.get('updated_at')}" for row in rows)
+    return f'"l-{_digest(key)}"'
+
+
+def _encoded_etag(etag: str, encoding: str) -> str:
+    """
+    Un ETag fuerte identifica los bytes exactos: la variante comprimida
+    lleva la codificación como sufijo ("m-abc-gzip")
+    """
+    if encoding == "identity":
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def _base_etag(tag: str) -> str:
+    tag = tag.strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    for encoding in ("br", "gzip"):
+        suffix = f'-{encoding}"'
+        if tag.endswith(suffix):
+            return tag[:-len(suffix)] + '"'
+    return tag
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """
+    Compara If-None-Match con el ETag (acepta listas, *, prefijo W/ y
+    cualquier variante de codificación)
+    """
+    header = request.headers.get("if-none-match")
+    if not header or not etag:
+        return False
+    if header.strip() == "*":
+        return True
+    return etag in {_base_etag(tag) for tag in header.split(",")}
+
+
+# ---------- validadores en memoria ----------
+
+def get_validator(key: str) -> Optional[str]:
+    """ETag vigente de un recurso, o None si no se conoce o venció"""
+    if not HTTP_CACHE_ENABLED:
+        return None
+    entry = _validators.get(key)
+    if entry is None:
+        return None
+    etag, stored_at = entry
+    if time.monotonic() - stored_at > HTTP_CACHE_VALIDATOR_TTL:
+        _validators.pop(key, None)
+        return None
+    return etag
+
+
+def set_validator(key: str, etag: str):
+    if HTTP_CACHE_ENABLED:
+        _validators[key] = (etag, time.monotonic())
+
+
+def invalidate(*keys: str):
+    for key in keys:
+        _validators.pop(key, None)
+
+
+def invalidate_on_change(event: Dict[str, Any]):
+    """Listener del feed de cambios: descarta los validadores afectados"""
+    if event.get("table") == "brand_manuals":
+        invalidate(f"manual:{event.get('row_id')}", "manuals:list")
+
+
+def check_not_modified(request: Request, key: str) -> Optional[Response]:
+    """
+    304 sin tocar la base de datos si el ETag guardado coincide con
+    If-None-Match; None si hay que consultar
+    """
+    etag = get_validator(key)
+    if etag and etag_matches(request, etag):
+        inc_counter("http_cache_total", labels={"result": "not_modified", "source": "validator"})
+        return not_modified(_request_etag(request, etag))
+    return None
+
+
+# ---------- respuestas ----------
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> str:
+    """Codificación preferida por el cliente entre br, gzip e identity"""
+    if not accept_encoding:
+        return "identity"
+    weights = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip()] = q
+
+    def weight(name: str) -> float:
+        return weights.get(name, weights.get("*", 0.0))
+
+    options = [("br", weight("br")), ("gzip", weight("gzip"))] if brotli else [("gzip", weight("gzip"))]
+    best, q = max(options, key=lambda option: option[1])
+    return best if q > 0 else "identity"
+
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    # mtime=0: mismo resultado para el mismo cuerpo
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def _cached_body(etag: str, encoding: str, serialize: Callable[[], bytes]) -> Tuple[bytes, str]:
+    """Cuerpo serializado (y comprimido) por ETag y codificación, con LRU"""
+    key = (etag, encoding)
+    body = _bodies.get(key)
+    if body is not None:
+        _bodies.move_to_end(key)
+        inc_counter("http_cache_total", labels={"result": "body_hit", "source": "memory"})
+    else:
+        raw = _bodies.get((etag, "identity"))
+        if raw is None:
+            raw = serialize()
+            _store_body((etag, "identity"), raw)
+        if encoding != "identity" and len(raw) >= HTTP_COMPRESSION_MIN_BYTES:
+            body = _compress(raw, encoding)
+            _store_body(key, body)
+        else:
+            body, encoding = raw, "identity"
+        inc_counter("http_cache_total", labels={"result": "body_miss", "source": "memory"})
+    return body, encoding
+
+
+def _store_body(key: Tuple[str, str], body: bytes):
+    if not HTTP_CACHE_ENABLED:
+        return
+    _bodies[key] = body
+    _bodies.move_to_end(key)
+    while len(_bodies) > HTTP_CACHE_MAX_ENTRIES:
+        _bodies.popitem(last=False)
+
+
+def _request_etag(request: Request, etag: str) -> str:
+    """ETag de la variante que el cliente recibiría con su Accept-Encoding"""
+    return _encoded_etag(etag, negotiate_encoding(request.headers.get("accept-encoding")))
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={
+        "ETag": etag,
+        "Cache-Control": CACHE_CONTROL,
+        "Vary": "Accept-Encoding",
+    })
+
+
+def conditional_json_response(request: Request, key: str, etag: str,
+                              serialize: Callable[[], bytes],
+                              headers: Optional[Dict[str, str]] = None) -> Response:
+    """
+    Respuesta JSON con ETag: 304 si el cliente ya la tiene, si no el cuerpo
+    serializado/comprimido desde el cache. Guarda el ETag como validador.
+    """
+    set_validator(key, etag)
+    if etag_matches(request, etag):
+        inc_counter("http_cache_total", labels={"result": "not_modified", "source": "database"})
+        response = not_modified(_request_etag(request, etag))
+    else:
+        encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+        body, encoding = _cached_body(etag, encoding, serialize)
+        response = Response(content=body, media_type="application/json", headers={
+            "ETag": _encoded_etag(etag, encoding),
+            "Cache-Control": CACHE_CONTROL,
+            "Vary": "Accept-Encoding",
+        })
+        if encoding != "identity":
+            response.headers["Content-Encoding"] = encoding
+    for name, value in (headers or {}).items():
+        response.headers[name] = value
+    return response
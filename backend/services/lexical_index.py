@@ -0,0 +1,184 @@
+"""
+Índice léxico BM25 en memoria sobre los chunks de cada manual
+
+Complementa la búsqueda vectorial en consultas con términos exactos
+(palabras prohibidas, códigos HEX, nombres de tipografías) donde MiniLM
+no siempre rankea bien. Se construye al generar los embeddings y, si el
+proceso no lo tiene (reinicio, otro worker), se reconstruye desde la
+tabla brand_manual_embeddings la primera vez que se consulta.
+
+Cada índice es de un espacio de embeddings (los chunks del espacio activo
+no son los del espacio en backfill). Los cambios de otros procesos llegan
+por el feed de cambios (bajas y ediciones de manuales) y, para embeddings
+regenerados en otro worker, los índices vencen a los LEXICAL_INDEX_TTL
+segundos.
+"""
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+from typing import List, Dict, Any, Optional, Tuple
+
+from services.metrics_service import stage_timer
+from services.embedding_spaces import ACTIVE_SPACE, scope_to_space
+
+# Parámetros estándar de BM25
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Constante de Reciprocal Rank Fusion (valor habitual en la literatura)
+RRF_K = 60
+
+# Segundos que un índice se usa antes de reconstruirlo desde la base (0 = sin vencimiento)
+LEXICAL_INDEX_TTL = float(os.getenv("LEXICAL_INDEX_TTL", "300"))
+
+_STOPWORDS = {
+    "a", "al", "como", "con", "cual", "cuales", "de", "del", "debo", "el", "en",
+    "es", "esta", "estan", "hay", "la", "las", "lo", "los", "mas", "o", "para",
+    "por", "puedo", "que", "se", "sin", "son", "su", "sus", "un", "una", "uno",
+    "y", "usar", "uso",
+}
+
+_TOKEN_RE = re.compile(r"#[0-9a-f]{3,8}\b|[a-z0-9]+")
+
+# (espacio, manual_id) -> (índice, momento de construcción)
+_indexes: Dict[Tuple[str, str], Tuple["BM25Index", float]] = {}
+_lock = threading.Lock()
+
+
+def _strip_accents(text: str) -> str:
+    normalized = unicodedata.normalize("NFD", text)
+    return "".join(c for c in normalized if unicodedata.category(c) != "Mn")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Minúsculas, sin tildes y sin stopwords. Los códigos HEX se indexan
+    con y sin '#' para que "#8BC34A" y "8bc34a" coincidan.
+    """
+    tokens = []
+    for token in _TOKEN_RE.findall(_strip_accents(text.lower())):
+        if token.startswith("#"):
+            tokens.append(token)
+            tokens.append(token[1:])
+        elif token not in _STOPWORDS:
+            tokens.append(token)
+    return tokens
+
+
+class BM25Index:
+    """
+    Índice invertido BM25 de los chunks de un manual
+    """
+
+    def __init__(self, rows: List[Dict[str, Any]]):
+        self.rows = [
+            {k: row[k] for k in ("id", "manual_id", "content", "section") if k in row}
+            for row in rows
+        ]
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        self.doc_lengths: List[int] = []
+
+        for doc_id, row in enumerate(self.rows):
+            counts = Counter(tokenize(row["content"]))
+            self.doc_lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings.setdefault(term, []).append((doc_id, tf))
+
+        self.avg_length = (sum(self.doc_lengths) / len(self.doc_lengths)) if self.doc_lengths else 0.0
+
+    def search(self, query: str, top_k: int) -> List[Tuple[Dict[str, Any], float]]:
+        """Retorna [(chunk, score_bm25)] ordenados de mayor a menor"""
+        n_docs = len(self.rows)
+        if not n_docs:
+            return []
+
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[doc_id] / (self.avg_length or 1))
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [(self.rows[doc_id], score) for doc_id, score in ranked]
+
+
+def _key(manual_id: str, space: Optional[str]) -> Tuple[str, str]:
+    return (space or ACTIVE_SPACE, str(manual_id))
+
+
+def build_lexical_index(manual_id: str, rows: List[Dict[str, Any]], space: str = None) -> BM25Index:
+    """
+    Construye (o reemplaza) el índice de un manual a partir de sus chunks
+    del espacio indicado (por defecto el activo)
+    """
+    index = BM25Index(rows)
+    with _lock:
+        _indexes[_key(manual_id, space)] = (index, time.monotonic())
+    return index
+
+
+def drop_lexical_index(manual_id: str, space: str = None):
+    """
+    Elimina el índice de un manual (al borrar o regenerar el manual); sin
+    space, el de todos los espacios
+    """
+    with _lock:
+        if space:
+            _indexes.pop(_key(manual_id, space), None)
+        else:
+            for key in [k for k in _indexes if k[1] == str(manual_id)]:
+                del _indexes[key]
+
+
+def invalidate_lexical_on_change(event: Dict[str, Any]):
+    """Listener del feed de cambios: descarta los índices de manuales editados o borrados"""
+    if event.get("table") == "brand_manuals" and event.get("op") in ("update", "delete"):
+        drop_lexical_index(event.get("row_id"))
+
+
+def get_lexical_index(manual_id: str, supabase_client, space: str = None) -> BM25Index:
+    """
+    Retorna el índice del manual, reconstruyéndolo desde la base de datos
+    si hace falta o si venció
+    """
+    entry = _indexes.get(_key(manual_id, space))
+    if entry is not None and (not LEXICAL_INDEX_TTL or time.monotonic() - entry[1] < LEXICAL_INDEX_TTL):
+        return entry[0]
+
+    with stage_timer("db_fetch", table="brand_manual_embeddings"):
+        result = scope_to_space(
+            supabase_client.table("brand_manual_embeddings")
+            .select("id, manual_id, content, section")
+            .eq("manual_id", manual_id),
+            space
+        ).execute()
+    return build_lexical_index(manual_id, result.data or [], space)
+
+
+def reciprocal_rank_fusion(rankings: List[List[Dict[str, Any]]], k: int = RRF_K) -> List[Tuple[Dict[str, Any], float]]:
+    """
+    Fusiona varios rankings con RRF: score = Σ 1 / (k + posición)
+
+    Args:
+        rankings: Listas de chunks ordenadas por relevancia (cada chunk con 'id')
+
+    Returns:
+        [(chunk, score_rrf)] ordenados de mayor a menor
+    """
+    fused: Dict[str, Tuple[Dict[str, Any], float]] = {}
+    for ranking in rankings:
+        for position, chunk in enumerate(ranking, start=1):
+            key = str(chunk["id"])
+            previous, score = fused.get(key, (chunk, 0.0))
+            # Conservar el dict con más información (ej: el que trae 'similarity')
+            merged = {**chunk, **previous}
+            fused[key] = (merged, score + 1.0 / (k + position))
+    return sorted(fused.values(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,196 @@
+"""
+Instrumentación local (sin dependencias externas) en formato Prometheus.
+
+Mantiene contadores e histogramas en memoria del proceso y los exporta como
+texto plano en el endpoint /metrics.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Tuple, Optional
+
+# Buckets (en segundos) pensados para latencias de API: desde pocos ms
+# (búsqueda vectorial) hasta decenas de segundos (generación de manuales)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Buckets para tamaños de lote de embeddings
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+_lock = threading.Lock()
+
+# nombre -> (tipo, ayuda)
+_metadata: Dict[str, Tuple[str, str]] = {}
+# nombre -> {labels -> valor}
+_counters: Dict[str, Dict[Tuple[Tuple[str, str], ...], float]] = {}
+# nombre -> {labels -> [conteos por bucket..., suma, total]}
+_histograms: Dict[str, Dict[Tuple[Tuple[str, str], ...], list]] = {}
+_histogram_buckets: Dict[str, Tuple[float, ...]] = {}
+
+
+def _labels_key(labels: Optional[Dict[str, str]]) -> Tuple[Tuple[str, str], ...]:
+    if not labels:
+        return ()
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def register_counter(name: str, help_text: str):
+    """Registra un contador (idempotente)"""
+    with _lock:
+        _metadata.setdefault(name, ("counter", help_text))
+        _counters.setdefault(name, {})
+
+
+def register_histogram(name: str, help_text: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+    """Registra un histograma (idempotente)"""
+    with _lock:
+        _metadata.setdefault(name, ("histogram", help_text))
+        _histograms.setdefault(name, {})
+        _histogram_buckets.setdefault(name, tuple(sorted(buckets)))
+
+
+def inc_counter(name: str, value: float = 1.0, labels: Optional[Dict[str, str]] = None):
+    """Incrementa un contador registrado"""
+    key = _labels_key(labels)
+    with _lock:
+        series = _counters[name]
+        series[key] = series.get(key, 0.0) + value
+
+
+def observe_histogram(name: str, value: float, labels: Optional[Dict[str, str]] = None):
+    """Registra una observación en un histograma registrado"""
+    key = _labels_key(labels)
+    buckets = _histogram_buckets[name]
+    with _lock:
+        series = _histograms[name]
+        state = series.get(key)
+        if state is None:
+            # [conteo por bucket..., +Inf, suma]
+            state = [0] * (len(buckets) + 1) + [0.0]
+            series[key] = state
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                state[i] += 1
+        state[len(buckets)] += 1
+        state[-1] += value
+
+
+# ============================================
+# MÉTRICAS DE LA APLICACIÓN
+# ============================================
+
+register_histogram(
+    "http_request_duration_seconds",
+    "Latencia de las requests HTTP por endpoint"
+)
+register_counter(
+    "http_requests_total",
+    "Total de requests HTTP por endpoint y código de estado"
+)
+register_histogram(
+    "stage_duration_seconds",
+    "Latencia por etapa interna (db_fetch, query_embed, vector_search, llm_call, json_parse, insert)"
+)
+register_histogram(
+    "llm_provider_latency_seconds",
+    "Latencia de las llamadas a proveedores LLM (Groq, Gemini)"
+)
+register_counter(
+    "llm_tokens_total",
+    "Tokens consumidos por proveedor, modelo y tipo (prompt/completion)"
+)
+register_histogram(
+    "embedding_batch_size",
+    "Número de textos por llamada de encode al modelo de embeddings",
+    buckets=BATCH_SIZE_BUCKETS
+)
+
+
+def observe_request(method: str, path: str, status_code: int, duration: float):
+    """Registra una request HTTP terminada"""
+    labels = {"method": method, "path": path}
+    observe_histogram("http_request_duration_seconds", duration, labels)
+    inc_counter("http_requests_total", 1, {**labels, "status": str(status_code)})
+
+
+@contextmanager
+def stage_timer(stage: str, **labels):
+    """
+    Mide la duración de una etapa interna
+
+    Uso:
+        with stage_timer("db_fetch", table="brand_manuals"):
+            ...
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_histogram(
+            "stage_duration_seconds",
+            time.perf_counter() - start,
+            {"stage": stage, **labels}
+        )
+
+
+def record_llm_call(provider: str, model: str, duration: float,
+                    prompt_tokens: Optional[int] = None,
+                    completion_tokens: Optional[int] = None):
+    """Registra latencia y tokens de una llamada a un proveedor LLM"""
+    labels = {"provider": provider, "model": model}
+    observe_histogram("llm_provider_latency_seconds", duration, labels)
+    if prompt_tokens:
+        inc_counter("llm_tokens_total", prompt_tokens, {**labels, "kind": "prompt"})
+    if completion_tokens:
+        inc_counter("llm_tokens_total", completion_tokens, {**labels, "kind": "completion"})
+
+
+def record_embedding_batch(batch_size: int):
+    """Registra el tamaño de un lote enviado al modelo de embeddings"""
+    observe_histogram("embedding_batch_size", batch_size)
+
+
+# ============================================
+# EXPORTACIÓN
+# ============================================
+
+def _format_labels(key: Tuple[Tuple[str, str], ...], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = []
+    for k, v in pairs:
+        v = v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        escaped.append(f'{k}="{v}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+def render_metrics() -> str:
+    """
+    Retorna todas las métricas en el formato de texto de Prometheus
+    """
+    lines = []
+    with _lock:
+        for name, (kind, help_text) in _metadata.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == "counter":
+                for key, value in _counters[name].items():
+                    lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+            else:
+                buckets = _histogram_buckets[name]
+                for key, state in _histograms[name].items():
+                    for i, bound in enumerate(buckets):
+                        lines.append(
+                            f"{name}_bucket{_format_labels(key, ('le', _format_value(bound)))} {state[i]}"
+                        )
+                    total = state[len(buckets)]
+                    lines.append(f"{name}_bucket{_format_labels(key, ('le', '+Inf'))} {total}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {_format_value(state[-1])}")
+                    lines.append(f"{name}_count{_format_labels(key)} {total}")
+    return "\n".join(lines) + "\n"
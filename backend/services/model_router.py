@@ -0,0 +1,154 @@
+"""
+Ruteo de modelos con degradación bajo presión de latencia
+
+Cada llamada a Groq o Gemini registra su latencia y si falló. Con
+MODEL_ROUTING=true, antes de cada llamada se elige el primer modelo sano de
+la cadena de su tarea (tipo de contenido, manual, auditoría...). Un modelo
+está sano si, en la ventana MODEL_ROUTER_WINDOW:
+
+- su p90 de latencia no supera MODEL_ROUTER_HEADROOM × el presupuesto de
+  la tarea, y
+- su tasa de error no supera MODEL_ROUTER_MAX_ERROR_RATE.
+
+Con menos de MODEL_ROUTER_MIN_SAMPLES muestras el modelo se considera sano,
+así que el primario vuelve a probarse solo cuando sus muestras lentas salen
+de la ventana. Si ninguno está sano se usa el de menor p90.
+
+Cadenas y presupuestos se configuran con MODEL_CHAINS y LATENCY_BUDGETS
+(JSON, se fusionan con los valores por defecto).
+"""
+import json
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Tuple
+
+from services.metrics_service import register_counter, inc_counter
+
+MODEL_ROUTING = os.getenv("MODEL_ROUTING", "false").lower() == "true"
+MODEL_ROUTER_WINDOW = float(os.getenv("MODEL_ROUTER_WINDOW", "120"))
+MODEL_ROUTER_MIN_SAMPLES = int(os.getenv("MODEL_ROUTER_MIN_SAMPLES", "5"))
+MODEL_ROUTER_HEADROOM = float(os.getenv("MODEL_ROUTER_HEADROOM", "0.8"))
+MODEL_ROUTER_MAX_ERROR_RATE = float(os.getenv("MODEL_ROUTER_MAX_ERROR_RATE", "0.25"))
+# Muestras por modelo como máximo (además de la ventana de tiempo)
+MAX_SAMPLES = 200
+
+GROQ_PRIMARY_MODEL = "llama-3.3-70b-versatile"
+GROQ_FAST_MODEL = "llama-3.1-8b-instant"
+GEMINI_PRIMARY_MODEL = "gemini-2.0-flash"
+GEMINI_FAST_MODEL = "gemini-2.0-flash-lite"
+
+# Cadena de modelos por proveedor y tarea, del preferido al más rápido
+DEFAULT_CHAINS = {
+    "groq": {
+        "default": [GROQ_PRIMARY_MODEL, GROQ_FAST_MODEL],
+        # El manual es JSON largo y estructurado: no se degrada por defecto
+        "manual": [GROQ_PRIMARY_MODEL],
+    },
+    "gemini": {
+        "default": [GEMINI_PRIMARY_MODEL, GEMINI_FAST_MODEL],
+    },
+}
+
+# Presupuesto de latencia por tarea (segundos)
+DEFAULT_BUDGETS = {
+    "default": 15.0,
+    "product_description": 8.0,
+    "image_prompt": 10.0,
+    "video_script": 12.0,
+    "manual": 45.0,
+    "audit": 15.0,
+    "prescreen": 6.0,
+}
+
+
+def _load_json_env(name: str) -> Dict[str, Any]:
+    raw = os.getenv(name)
+    if not raw:
+        return {}
+    try:
+        return json.loads(raw)
+    except json.JSONDecodeError:
+        print(f"Warning: {name} no es JSON válido; se usan los valores por defecto")
+        return {}
+
+
+MODEL_CHAINS = {provider: dict(chains) for provider, chains in DEFAULT_CHAINS.items()}
+for _provider, _chains in _load_json_env("MODEL_CHAINS").items():
+    MODEL_CHAINS.setdefault(_provider, {}).update(_chains)
+
+LATENCY_BUDGETS = {**DEFAULT_BUDGETS, **_load_json_env("LATENCY_BUDGETS")}
+
+register_counter("model_route_total", "Modelo elegido por tarea (fallback=true si no es el primario)")
+register_counter("model_call_errors_total", "Llamadas fallidas por modelo")
+
+# (timestamp, latencia, ok) por modelo
+_samples: Dict[str, Deque[Tuple[float, float, bool]]] = {}
+
+
+def record_model_call(model: str, latency: float, ok: bool = True):
+    """Registra una llamada terminada (latencia total, incluido streaming)"""
+    samples = _samples.setdefault(model, deque(maxlen=MAX_SAMPLES))
+    samples.append((time.monotonic(), latency, ok))
+    if not ok:
+        inc_counter("model_call_errors_total", labels={"model": model})
+
+
+def model_stats(model: str) -> Dict[str, Any]:
+    """p90 de latencia (llamadas exitosas) y tasa de error en la ventana"""
+    samples = _samples.get(model)
+    cutoff = time.monotonic() - MODEL_ROUTER_WINDOW
+    while samples and samples[0][0] < cutoff:
+        samples.popleft()
+    if not samples:
+        return {"samples": 0, "p90": None, "error_rate": 0.0}
+    latencies = sorted(latency for _, latency, ok in samples if ok)
+    errors = sum(1 for _, _, ok in samples if not ok)
+    p90 = latencies[min(len(latencies) - 1, int(0.9 * len(latencies)))] if latencies else None
+    return {"samples": len(samples), "p90": p90, "error_rate": errors / len(samples)}
+
+
+def _is_healthy(stats: Dict[str, Any], budget: float) -> bool:
+    if stats["samples"] < MODEL_ROUTER_MIN_SAMPLES:
+        return True
+    if stats["error_rate"] > MODEL_ROUTER_MAX_ERROR_RATE:
+        return False
+    return stats["p90"] is not None and stats["p90"] <= budget * MODEL_ROUTER_HEADROOM
+
+
+def model_chain(provider: str, task: str) -> List[str]:
+    chains = MODEL_CHAINS[provider]
+    return chains.get(task) or chains["default"]
+
+
+def choose_model(provider: str, task: str = "default") -> str:
+    """
+    Modelo para una llamada: el primario, o el primer modelo sano de la
+    cadena si el ruteo está activo
+    """
+    chain = model_chain(provider, task)
+    if not MODEL_ROUTING or len(chain) == 1:
+        return chain[0]
+
+    budget = LATENCY_BUDGETS.get(task, LATENCY_BUDGETS["default"])
+    stats = {model: model_stats(model) for model in chain}
+    chosen = next((model for model in chain if _is_healthy(stats[model], budget)), None)
+    if chosen is None:
+        # Ninguno cumple: el de menor p90 (los que solo fallan van al final)
+        chosen = min(chain, key=lambda m: (stats[m]["p90"] is None, stats[m]["p90"] or 0))
+
+    inc_counter("model_route_total", labels={
+        "provider": provider, "task": task, "model": chosen, "fallback": str(chosen != chain[0]).lower()
+    })
+    return chosen
+
+
+def router_status() -> Dict[str, Any]:
+    """Cadenas, presupuestos y estadísticas actuales por modelo"""
+    models = {model for chains in MODEL_CHAINS.values() for chain in chains.values() for model in chain}
+    return {
+        "enabled": MODEL_ROUTING,
+        "chains": MODEL_CHAINS,
+        "budgets": LATENCY_BUDGETS,
+        "models": {model: model_stats(model) for model in sorted(models)},
+    }
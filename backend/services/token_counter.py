@@ -0,0 +1,56 @@
+"""
+Conteo local de tokens para los prompts del LLM (Groq / Llama 3)
+
+Orden de preferencia:
+1. LLM_TOKENIZER_PATH: tokenizer.json del modelo (conteo exacto, librería tokenizers)
+2. tiktoken (o200k/cl100k, vocabularios BPE cercanos al de Llama 3)
+3. Estimación por caracteres
+"""
+import math
+import os
+from typing import Callable, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Caracteres por token aproximados para texto en español con BPE grande
+_CHARS_PER_TOKEN = 3.7
+
+_counter: Optional[Callable[[str], int]] = None
+
+
+def estimate_llm_tokens(text: str) -> int:
+    """Estimación cuando no hay tokenizer disponible"""
+    return math.ceil(len(text) / _CHARS_PER_TOKEN)
+
+
+def _load_counter() -> Callable[[str], int]:
+    tokenizer_path = os.getenv("LLM_TOKENIZER_PATH")
+    if tokenizer_path:
+        try:
+            from tokenizers import Tokenizer
+            tokenizer = Tokenizer.from_file(tokenizer_path)
+            return lambda text: len(tokenizer.encode(text, add_special_tokens=False).ids)
+        except Exception as e:
+            print(f"Warning: no se pudo cargar LLM_TOKENIZER_PATH ({e}); usando alternativa")
+
+    try:
+        import tiktoken
+        try:
+            encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            encoding = tiktoken.get_encoding("cl100k_base")
+        return lambda text: len(encoding.encode(text, disallowed_special=()))
+    except Exception:
+        return estimate_llm_tokens
+
+
+def count_llm_tokens(text: str) -> int:
+    """
+    Cuenta los tokens de un texto para el LLM (carga el tokenizer la primera vez)
+    """
+    global _counter
+    if _counter is None:
+        _counter = _load_counter()
+    return _counter(text)
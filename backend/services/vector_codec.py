@@ -0,0 +1,69 @@
+"""
+Transporte compacto de vectores hacia Supabase
+
+Un vector de 384 float en JSON ocupa ~7.5 KB de texto y cuesta convertir
+cada float a Python y luego a texto. Este módulo lo codifica como bytes
+little-endian en base64 con un prefijo de formato ("f16:..." o "f32:..."):
+~1 KB en float16 y ~2 KB en float32, directo desde el array de NumPy.
+
+La base de datos decodifica con decode_vector_b64() (ver
+docs/SUPABASE_RAG_SETUP.sql), tanto en las inserciones (columna
+embedding_b64 + trigger) como en la búsqueda (RPC
+match_brand_manual_embeddings_b64).
+
+VECTOR_TRANSPORT:
+- json: listas de floats (compatible sin migración, por defecto)
+- f16:  float16 base64 (error de coseno ~1e-4 en vectores normalizados)
+- f32:  float32 base64 (sin pérdida)
+"""
+import base64
+import json
+import os
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+VECTOR_TRANSPORT = os.getenv("VECTOR_TRANSPORT", "json").lower()
+
+_DTYPES = {
+    "f16": np.dtype("<f2"),
+    "f32": np.dtype("<f4"),
+}
+
+
+def encode_vector(vector: np.ndarray, fmt: str = "f16") -> str:
+    """Codifica un vector como "<formato>:<base64>" """
+    data = np.ascontiguousarray(vector, dtype=_DTYPES[fmt]).tobytes()
+    return f"{fmt}:{base64.b64encode(data).decode('ascii')}"
+
+
+def decode_vector(payload: str) -> np.ndarray:
+    """Inversa de encode_vector (retorna float32)"""
+    fmt, _, data = payload.partition(":")
+    if fmt not in _DTYPES:
+        raise ValueError(f"Formato de vector desconocido: {fmt}")
+    return np.frombuffer(base64.b64decode(data), dtype=_DTYPES[fmt]).astype(np.float32)
+
+
+def parse_vector(value: Any) -> Optional[np.ndarray]:
+    """Columna embedding leída por PostgREST: texto "[0.1,0.2,...]" o lista"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = json.loads(value)
+    return np.asarray(value, dtype=np.float32)
+
+
+def uses_binary_transport(transport: str = None) -> bool:
+    return (transport or VECTOR_TRANSPORT) in _DTYPES
+
+
+def embedding_column(vector: np.ndarray, transport: str = None) -> Dict[str, Any]:
+    """
+    Columna de embedding para insertar una fila en brand_manual_embeddings:
+    {"embedding": [...]} en modo json o {"embedding_b64": "f16:..."}
+    """
+    transport = transport or VECTOR_TRANSPORT
+    if uses_binary_transport(transport):
+        return {"embedding_b64": encode_vector(vector, transport)}
+    return {"embedding": np.asarray(vector, dtype=np.float32).tolist()}
@@ -0,0 +1,69 @@
+"""
+La ruta rápida (services/fast_json.py) debe producir exactamente el JSON
+de BrandManualResponse(...).model_dump_json()
+"""
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.brand_manual import BrandManualResponse  # noqa: E402
+from services.fast_json import orjson, serialize_fast  # noqa: E402
+
+pytestmark = pytest.mark.skipif(orjson is None, reason="orjson no está instalado")
+
+FULL_MANUAL = {
+    "identidad_marca": {"mision": "Llevar sabor a cada familia del Perú 🌽", "valores": ["calidad", "ñandú"]},
+    "elementos_visuales": {"colores_principales": ["#FF6B00", "#1A1A1A"]},
+    "uso_logo": {"tamano_minimo": "20mm", "area_proteccion": 0.25},
+    "publico_objetivo": {"edad": [18, 35]},
+    "reglas": {"uso_tecnicismos": False, "max_palabras": 120, "nota": None},
+}
+
+
+def _row(**overrides):
+    row = {
+        "id": "0b6f2a9e-4c1d-4e8a-9f3b-2d7c5e1a8b90",
+        "name": "Marca ñ",
+        "description": "Descripción con \"comillas\", \\ barras y\nsaltos",
+        "product_type": "snack",
+        "tone": "divertido",
+        "target_audience": "Gen Z",
+        "full_manual": FULL_MANUAL,
+        "created_at": "2024-05-01T12:34:56.789012+00:00",
+        "updated_at": "2024-05-01T12:34:56+00:00",
+        # Las columnas fuera del modelo no deben salir
+        "internal_note": "x",
+    }
+    row.update(overrides)
+    return row
+
+
+def _reference(row) -> bytes:
+    return BrandManualResponse(**row).model_dump_json().encode("utf-8")
+
+
+@pytest.mark.parametrize("row", [
+    _row(),
+    _row(description=None),
+    _row(full_manual=None),
+    _row(description=None, full_manual=None),
+    # Microsegundos parciales, sin zona y con offset distinto de UTC
+    _row(created_at="2024-05-01T12:34:56.78901+00:00", updated_at="2024-05-01T12:34:56.5+00:00"),
+    _row(created_at="2024-05-01T12:34:56.123456", updated_at="2024-05-01T07:34:56.5-05:00"),
+    _row(created_at="2024-05-01T12:34:56Z"),
+], ids=["completo", "sin_descripcion", "sin_manual", "nulos", "microsegundos", "zonas", "z"])
+def test_fast_path_matches_model_dump_json(row):
+    assert serialize_fast(row, BrandManualResponse) == _reference(row)
+
+
+def test_fast_path_list_matches_model_dump_json():
+    rows = [_row(), _row(description=None, full_manual=None), _row(updated_at="2024-05-01T12:34:56.000001+00:00")]
+
+    fast = serialize_fast(rows, BrandManualResponse, many=True)
+
+    assert json.loads(fast) == [json.loads(_reference(row)) for row in rows]
+    assert fast == b"[" + b",".join(_reference(row) for row in rows) + b"]"
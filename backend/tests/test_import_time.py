@@ -0,0 +1,27 @@
+"""
+La app debe importarse rápido, sin credenciales y sin cargar SDKs pesados
+(ver scripts/check_import_time.py)
+
+Ejecutar desde backend/:
+    python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+from check_import_time import IMPORT_TIME_BUDGET_MS, import_errors, measure_import  # noqa: E402
+
+
+def test_main_imports_within_budget_without_credentials():
+    # Requiere las dependencias de requirements.txt (no las credenciales)
+    pytest.importorskip("fastapi")
+    result, stderr = measure_import("main")
+
+    assert result is not None, f"main no se importa sin credenciales:\n{import_errors(stderr)}"
+    assert result["loaded"] == [], f"Módulos que deberían cargarse lazy: {result['loaded']}"
+    assert result["elapsed_ms"] <= IMPORT_TIME_BUDGET_MS, (
+        f"Importación de main: {result['elapsed_ms']:.0f} ms (presupuesto {IMPORT_TIME_BUDGET_MS:.0f} ms)"
+    )
@@ -0,0 +1,233 @@
+-- ================================================
+-- MIGRACIONES DE RAG (brand_manual_embeddings)
+-- ================================================
+-- Ejecutar en el SQL Editor de Supabase, en orden.
+-- Todas las sentencias son idempotentes.
+
+-- 1. METADATA DE CHUNKS (chunking por esquema)
+-- section:        sub-sección ("tono_comunicacion.palabras_prohibidas")
+-- parent_section: sección del manual para reensamblar el contexto
+-- chunk_index:    posición del chunk dentro de la sub-sección
+-- content_hash:   hash del contenido; los chunks sin cambios conservan su embedding
+ALTER TABLE brand_manual_embeddings
+ADD COLUMN IF NOT EXISTS parent_section TEXT;
+
+ALTER TABLE brand_manual_embeddings
+ADD COLUMN IF NOT EXISTS chunk_index INTEGER DEFAULT 0;
+
+ALTER TABLE brand_manual_embeddings
+ADD COLUMN IF NOT EXISTS content_hash TEXT;
+
+CREATE INDEX IF NOT EXISTS idx_brand_manual_embeddings_manual_hash
+  ON brand_manual_embeddings(manual_id, content_hash);
+
+-- 2. TRANSPORTE COMPACTO DE VECTORES (VECTOR_TRANSPORT=f16 | f32)
+-- El backend envía los vectores como "f16:<base64>" o "f32:<base64>"
+-- (bytes little-endian) en lugar de listas JSON de floats. La decodificación
+-- IEEE-754 se hace aquí, en SQL puro (sin extensiones adicionales).
+CREATE OR REPLACE FUNCTION decode_vector_b64(payload TEXT)
+RETURNS vector
+LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE
+AS $$
+  WITH raw AS (
+    SELECT split_part(payload, ':', 1) AS fmt,
+           decode(split_part(payload, ':', 2), 'base64') AS bytes
+  ),
+  words AS (
+    SELECT i, fmt,
+      CASE fmt
+        WHEN 'f16' THEN get_byte(bytes, i * 2)::BIGINT
+                      | (get_byte(bytes, i * 2 + 1)::BIGINT << 8)
+        ELSE get_byte(bytes, i * 4)::BIGINT
+           | (get_byte(bytes, i * 4 + 1)::BIGINT << 8)
+           | (get_byte(bytes, i * 4 + 2)::BIGINT << 16)
+           | (get_byte(bytes, i * 4 + 3)::BIGINT << 24)
+      END AS bits
+    FROM raw,
+         generate_series(0, length(bytes) / (CASE fmt WHEN 'f16' THEN 2 ELSE 4 END) - 1) AS i
+  )
+  SELECT array_agg(
+    CASE fmt
+      WHEN 'f16' THEN
+        (CASE WHEN (bits >> 15) = 1 THEN -1.0 ELSE 1.0 END)::FLOAT8 *
+        CASE WHEN ((bits >> 10) & 31) = 0
+             THEN (bits & 1023)::FLOAT8 * power(2::FLOAT8, -24)
+             ELSE (1 + (bits & 1023)::FLOAT8 / 1024) * power(2::FLOAT8, ((bits >> 10) & 31) - 15)
+        END
+      ELSE
+        (CASE WHEN (bits >> 31) = 1 THEN -1.0 ELSE 1.0 END)::FLOAT8 *
+        CASE WHEN ((bits >> 23) & 255) = 0
+             THEN (bits & 8388607)::FLOAT8 * power(2::FLOAT8, -149)
+             ELSE (1 + (bits & 8388607)::FLOAT8 / 8388608) * power(2::FLOAT8, ((bits >> 23) & 255) - 127)
+        END
+    END ORDER BY i)::REAL[]::vector
+  FROM words;
+$$;
+
+-- Inserciones: el backend llena embedding_b64 y el trigger lo convierte
+ALTER TABLE brand_manual_embeddings
+ADD COLUMN IF NOT EXISTS embedding_b64 TEXT;
+
+CREATE OR REPLACE FUNCTION brand_manual_embeddings_decode_b64()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF NEW.embedding_b64 IS NOT NULL THEN
+    NEW.embedding := decode_vector_b64(NEW.embedding_b64);
+    NEW.embedding_b64 := NULL;
+  END IF;
+  RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_brand_manual_embeddings_decode_b64 ON brand_manual_embeddings;
+CREATE TRIGGER trg_brand_manual_embeddings_decode_b64
+  BEFORE INSERT OR UPDATE OF embedding_b64 ON brand_manual_embeddings
+  FOR EACH ROW EXECUTE FUNCTION brand_manual_embeddings_decode_b64();
+
+-- Búsqueda: misma salida que match_brand_manual_embeddings, con el vector
+-- de la consulta en base64
+CREATE OR REPLACE FUNCTION match_brand_manual_embeddings_b64(
+  query_embedding_b64 TEXT,
+  match_manual_id UUID,
+  match_count INT DEFAULT 3
+)
+RETURNS TABLE (id UUID, manual_id UUID, content TEXT, section TEXT, similarity FLOAT)
+LANGUAGE sql STABLE
+AS $$
+  SELECT e.id, e.manual_id, e.content, e.section,
+         1 - (e.embedding <=> q.v) AS similarity
+  FROM brand_manual_embeddings e,
+       (SELECT decode_vector_b64(query_embedding_b64) AS v) q
+  WHERE e.manual_id = match_manual_id
+  ORDER BY e.embedding <=> q.v
+  LIMIT match_count;
+$$;
+
+-- 3. ESPACIOS DE EMBEDDINGS VERSIONADOS (EMBEDDINGS_VERSIONED=true)
+-- Cada fila indica el modelo/versión que generó su vector. Los vectores
+-- existentes quedan en el espacio por defecto.
+ALTER TABLE brand_manual_embeddings
+ADD COLUMN IF NOT EXISTS embedding_space TEXT NOT NULL DEFAULT 'all-MiniLM-L6-v2';
+
+-- Cada espacio puede tener otra dimensión: la columna deja de fijarla.
+-- (Si existe un índice ivfflat/hnsw sobre embedding, eliminarlo antes y
+-- recrearlo por espacio con el índice parcial de abajo.)
+ALTER TABLE brand_manual_embeddings
+ALTER COLUMN embedding TYPE vector;
+
+CREATE INDEX IF NOT EXISTS idx_brand_manual_embeddings_manual_space_hash
+  ON brand_manual_embeddings(manual_id, embedding_space, content_hash);
+
+-- Índice ANN por espacio (uno por cada espacio registrado), ej:
+-- CREATE INDEX IF NOT EXISTS idx_bme_hnsw_minilm
+--   ON brand_manual_embeddings USING hnsw ((embedding::vector(384)) vector_cosine_ops)
+--   WHERE embedding_space = 'all-MiniLM-L6-v2';
+
+-- Búsqueda acotada a un espacio (vector como lista JSON)
+CREATE OR REPLACE FUNCTION match_brand_manual_embeddings_space(
+  query_embedding vector,
+  match_manual_id UUID,
+  match_count INT DEFAULT 3,
+  match_space TEXT DEFAULT 'all-MiniLM-L6-v2'
+)
+RETURNS TABLE (id UUID, manual_id UUID, content TEXT, section TEXT, similarity FLOAT)
+LANGUAGE sql STABLE
+AS $$
+  SELECT e.id, e.manual_id, e.content, e.section,
+         1 - (e.embedding <=> query_embedding) AS similarity
+  FROM brand_manual_embeddings e
+  WHERE e.manual_id = match_manual_id
+    AND e.embedding_space = match_space
+  ORDER BY e.embedding <=> query_embedding
+  LIMIT match_count;
+$$;
+
+-- Variante base64 (migración 2) con el espacio como parámetro
+DROP FUNCTION IF EXISTS match_brand_manual_embeddings_b64(TEXT, UUID, INT);
+CREATE OR REPLACE FUNCTION match_brand_manual_embeddings_b64(
+  query_embedding_b64 TEXT,
+  match_manual_id UUID,
+  match_count INT DEFAULT 3,
+  match_space TEXT DEFAULT 'all-MiniLM-L6-v2'
+)
+RETURNS TABLE (id UUID, manual_id UUID, content TEXT, section TEXT, similarity FLOAT)
+LANGUAGE sql STABLE
+AS $$
+  SELECT e.id, e.manual_id, e.content, e.section,
+         1 - (e.embedding <=> q.v) AS similarity
+  FROM brand_manual_embeddings e,
+       (SELECT decode_vector_b64(query_embedding_b64) AS v) q
+  WHERE e.manual_id = match_manual_id
+    AND e.embedding_space = match_space
+  ORDER BY e.embedding <=> q.v
+  LIMIT match_count;
+$$;
+
+-- 4. FEED DE CAMBIOS COMPARTIDO (CHANGE_FEED_BACKEND=table)
+-- Eventos compactos de brand_manuals y generated_content. La secuencia es
+-- el cursor del stream SSE, así que los clientes pueden reanudar contra
+-- cualquier worker y después de un reinicio.
+
+CREATE TABLE IF NOT EXISTS change_events (
+  seq BIGSERIAL PRIMARY KEY,
+  "table" TEXT NOT NULL,
+  op TEXT NOT NULL CHECK (op IN ('create', 'update', 'delete')),
+  row_id TEXT NOT NULL,
+  data JSONB,
+  ts TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS change_events_table_seq_idx ON change_events ("table", seq);
+
+-- Retención: los clientes con un cursor más viejo reciben "reset"
+-- DELETE FROM change_events WHERE ts < NOW() - INTERVAL '7 days';
+
+-- 5. MODELO USADO POR CONTENIDO (RECORD_MODEL_USED=true)
+-- Con MODEL_ROUTING el contenido puede venir del modelo rápido de la
+-- cadena; la columna permite auditar y comparar la calidad por modelo.
+
+ALTER TABLE generated_content ADD COLUMN IF NOT EXISTS model_used TEXT;
+
+-- 6. BÚSQUEDA GLOBAL CON HNSW (GLOBAL_SEARCH_BACKEND=pgvector)
+-- Búsqueda en todos los manuales con filtros por sección y tipo de
+-- producto. Requiere la migración 3 (embedding_space). El índice es
+-- parcial por espacio y con la dimensión fija, así que el espacio va como
+-- literal en la función (un par índice + función por espacio; con otro
+-- modelo, copiar cambiando el nombre, la dimensión y el espacio).
+
+CREATE INDEX IF NOT EXISTS idx_bme_hnsw_minilm
+  ON brand_manual_embeddings USING hnsw ((embedding::vector(384)) vector_cosine_ops)
+  WHERE embedding_space = 'all-MiniLM-L6-v2';
+
+CREATE INDEX IF NOT EXISTS idx_brand_manuals_product_type
+  ON brand_manuals(product_type);
+
+CREATE OR REPLACE FUNCTION match_embeddings_global(
+  query_embedding vector(384),
+  match_count INT DEFAULT 10,
+  filter_sections TEXT[] DEFAULT NULL,
+  filter_product_types TEXT[] DEFAULT NULL,
+  exclude_manual_ids UUID[] DEFAULT NULL
+)
+RETURNS TABLE (id UUID, manual_id UUID, manual_name TEXT, product_type TEXT,
+               content TEXT, section TEXT, similarity FLOAT)
+LANGUAGE sql STABLE
+-- Candidatos por consulta; con filtros selectivos conviene subirlo (o,
+-- con pgvector >= 0.8, SET hnsw.iterative_scan = relaxed_order)
+SET hnsw.ef_search = 100
+AS $$
+  SELECT e.id, e.manual_id, m.name, m.product_type, e.content, e.section,
+         1 - ((e.embedding::vector(384)) <=> query_embedding) AS similarity
+  FROM brand_manual_embeddings e
+  JOIN brand_manuals m ON m.id = e.manual_id
+  WHERE e.embedding_space = 'all-MiniLM-L6-v2'
+    AND (filter_sections IS NULL
+         OR e.section = ANY(filter_sections)
+         OR e.parent_section = ANY(filter_sections))
+    AND (filter_product_types IS NULL OR m.product_type = ANY(filter_product_types))
+    AND (exclude_manual_ids IS NULL OR e.manual_id <> ALL(exclude_manual_ids))
+  ORDER BY (e.embedding::vector(384)) <=> query_embedding
+  LIMIT match_count;
+$$;
@@ -0,0 +1,78 @@
+import { useState, useEffect, useRef, useCallback } from 'react'
+import apiClient from '../config/axios'
+
+// Lista de manuales sincronizada con el feed de cambios del backend
+// (GET /changes/stream). Se descarga la lista una sola vez y luego se
+// aplican los eventos create / update / delete; solo se vuelve a pedir la
+// lista completa si el backend envía "reset" (cursor perdido o reinicio).
+export function useBrandManualsFeed() {
+  const [manuals, setManuals] = useState([])
+  const cursorRef = useRef(null)
+
+  const fetchManuals = useCallback(async () => {
+    try {
+      const res = await apiClient.get('/brand-manuals')
+      cursorRef.current = res.headers['x-change-cursor'] || null
+      setManuals(res.data)
+    } catch (error) {
+      console.error('Error fetching manuals:', error)
+    }
+  }, [])
+
+  // Los eventos solo traen campos de resumen: el manual completo
+  // (full_manual) se pide por ID cuando hace falta
+  const fetchManual = useCallback(async (id) => {
+    try {
+      const res = await apiClient.get(`/brand-manuals/${id}`)
+      upsert(res.data)
+    } catch (error) {
+      console.error('Error fetching manual:', error)
+    }
+  }, [])
+
+  const upsert = (manual) => {
+    setManuals((prev) => {
+      const index = prev.findIndex((m) => m.id === manual.id)
+      if (index === -1) return [manual, ...prev]
+      const next = [...prev]
+      next[index] = { ...prev[index], ...manual }
+      return next
+    })
+  }
+
+  useEffect(() => {
+    let source = null
+    let closed = false
+
+    const applyChange = (event) => {
+      const change = JSON.parse(event.data)
+      if (change.table !== 'brand_manuals') return
+
+      if (change.op === 'delete') {
+        setManuals((prev) => prev.filter((m) => m.id !== change.row_id))
+        return
+      }
+      const { has_full_manual: hasFullManual, ...summary } = change.data || {}
+      upsert({ id: change.row_id, ...summary })
+      if (hasFullManual) fetchManual(change.row_id)
+    }
+
+    fetchManuals().then(() => {
+      if (closed) return
+      const params = new URLSearchParams({ topics: 'brand_manuals' })
+      if (cursorRef.current) params.set('cursor', cursorRef.current)
+
+      // EventSource reenvía el último id (Last-Event-ID) al reconectarse
+      source = new EventSource(`/api/changes/stream?${params}`)
+      source.addEventListener('change', applyChange)
+      source.addEventListener('reset', fetchManuals)
+    })
+
+    return () => {
+      closed = true
+      if (source) source.close()
+    }
+  }, [fetchManuals, fetchManual])
+
+  return { manuals, refresh: fetchManuals }
+}
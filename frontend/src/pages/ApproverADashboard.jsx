@@ -1,35 +1,22 @@
-import { useState, useEffect } from 'react'
+import { useState } from 'react'
 import { useAuth } from '../context/AuthContext'
-import apiClient from '../config/axios'
 import { STATUS } from '../config/supabase'
+import { useBrandManualsFeed } from '../hooks/useBrandManualsFeed'
 
 export default function ApproverADashboard() {
   const { user, signOut } = useAuth()
-  const [pendingContent, setPendingContent] = useState([])
+  // En producción, filtrarías por status: pending_approval
+  const { manuals: pendingContent } = useBrandManualsFeed()
   const [loading, setLoading] = useState(false)
 
-  useEffect(() => {
-    fetchPendingContent()
-  }, [])
-
-  const fetchPendingContent = async () => {
-    try {
-      // En producción, filtrarías por status: pending_approval
-      const res = await apiClient.get('/brand-manuals')
-      setPendingContent(res.data)
-    } catch (error) {
-      console.error('Error fetching content:', error)
-    }
-  }
-
   const handleApprove = async (manualId) => {
     if (!confirm('¿Aprobar este manual de marca?')) return
 
     setLoading(true)
     try {
       // TODO: Endpoint para aprobar
+      // Los cambios de estado llegan por el feed de cambios
       alert('✅ Manual aprobado. Ahora pasa al Aprobador B para auditoría de imagen.')
-      fetchPendingContent()
     } catch (error) {
       alert('Error: ' + (error.response?.data?.detail || error.message))
     } finally {
@@ -45,7 +32,6 @@ export default function ApproverADashboard() {
     try {
       // TODO: Endpoint para rechazar
       alert('❌ Manual rechazado. El creador recibirá tu feedback.')
-      fetchPendingContent()
     } catch (error) {
       alert('Error: ' + (error.response?.data?.detail || error.message))
     } finally {
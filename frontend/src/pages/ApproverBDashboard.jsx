@@ -1,32 +1,26 @@
 import { useState, useEffect } from 'react'
 import { useAuth } from '../context/AuthContext'
 import apiClient from '../config/axios'
+import { useBrandManualsFeed } from '../hooks/useBrandManualsFeed'
 
 export default function ApproverBDashboard() {
   const { user, signOut } = useAuth()
-  const [manuals, setManuals] = useState([])
+  // En producción, filtrarías solo los aprobados por A
+  const { manuals } = useBrandManualsFeed()
   const [selectedManual, setSelectedManual] = useState(null)
   const [imageFile, setImageFile] = useState(null)
   const [imagePreview, setImagePreview] = useState(null)
   const [auditResult, setAuditResult] = useState(null)
   const [loading, setLoading] = useState(false)
 
+  // Mantener la selección al día con los deltas del feed: seleccionar el
+  // primero al cargar y soltar el manual si se elimina
   useEffect(() => {
-    fetchApprovedManuals()
-  }, [])
-
-  const fetchApprovedManuals = async () => {
-    try {
-      // En producción, filtrarías solo los aprobados por A
-      const res = await apiClient.get('/brand-manuals')
-      setManuals(res.data)
-      if (res.data.length > 0) {
-        setSelectedManual(res.data[0])
-      }
-    } catch (error) {
-      console.error('Error fetching manuals:', error)
-    }
-  }
+    setSelectedManual((current) => {
+      if (!current) return manuals[0] || null
+      return manuals.find((m) => m.id === current.id) || manuals[0] || null
+    })
+  }, [manuals])
 
   const handleImageChange = (e) => {
     const file = e.target.files[0]
@@ -1,28 +1,17 @@
-import { useState, useEffect } from 'react'
+import { useState } from 'react'
 import { useAuth } from '../context/AuthContext'
 import apiClient from '../config/axios'
+import { useBrandManualsFeed } from '../hooks/useBrandManualsFeed'
 
 export default function CreatorDashboard() {
   const { user, signOut } = useAuth()
-  const [manuals, setManuals] = useState([])
+  // La lista se actualiza sola con el feed de cambios
+  const { manuals } = useBrandManualsFeed()
   const [loading, setLoading] = useState(false)
   const [showCreateModal, setShowCreateModal] = useState(false)
   const [showContentModal, setShowContentModal] = useState(false)
   const [selectedManual, setSelectedManual] = useState(null)
 
-  useEffect(() => {
-    fetchManuals()
-  }, [])
-
-  const fetchManuals = async () => {
-    try {
-      const res = await apiClient.get('/brand-manuals')
-      setManuals(res.data)
-    } catch (error) {
-      console.error('Error fetching manuals:', error)
-    }
-  }
-
   return (
     <div className="min-h-screen bg-gray-50">
       {/* Header */}
@@ -148,8 +137,8 @@ export default function CreatorDashboard() {
         <CreateManualModal
           onClose={() => setShowCreateModal(false)}
           onSuccess={() => {
+            // El manual nuevo llega por el feed de cambios
             setShowCreateModal(false)
-            fetchManuals()
           }}
         />
       )}